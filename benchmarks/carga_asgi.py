@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Teste de carga: modo WSGI (gunicorn, workers síncronos) x modo ASGI (uvicorn,
+# src/asgi.py) com o mesmo orçamento de memória.
+#
+# Para cada modo, sobe um servidor com 1 worker, mede o RSS da árvore de
+# processos depois do aquecimento e calcula quantos workers cabem no orçamento
+# (--memoria-mb). Sobe de novo com esse número de workers e dispara
+# --concorrencia clientes simultâneos (threads com conexão persistente) contra
+# as rotas de lista, relatório e gráfico por --segundos. Imprime um JSON com
+# vazão, latências (p50/p95/p99), erros e memória de cada modo.
+#
+# Requer Linux (/proc), gunicorn, uvicorn, a2wsgi e aiosqlite.
+# Uso: python benchmarks/carga_asgi.py [--escala pequena] [--memoria-mb 512] [--concorrencia 200] [--segundos 15]
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import gerador
+from harness import percentil, _alvos
+
+SRC = gerador.SRC
+
+def _rss_arvore_kb(pid):
+    # RSS do processo e de todos os descendentes (gunicorn/uvicorn com vários workers)
+    total, pendentes = 0, [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with open(f"/proc/{atual}/status") as f:
+                for linha in f:
+                    if linha.startswith("VmRSS:"):
+                        total += int(linha.split()[1])
+            for tarefa in os.listdir(f"/proc/{atual}/task"):
+                with open(f"/proc/{atual}/task/{tarefa}/children") as f:
+                    pendentes.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _comando(modo, porta, workers):
+    if modo == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "--chdir", SRC, "-w", str(workers), "-b", f"127.0.0.1:{porta}",
+                "--backlog", "2048", "--log-level", "warning", "main:create_app()"]
+    return [sys.executable, "-m", "uvicorn", "--app-dir", SRC, "--factory", "asgi:create_asgi_app",
+            "--port", str(porta), "--workers", str(workers), "--backlog", "2048", "--log-level", "warning"]
+
+@contextlib.contextmanager
+def _servidor(modo, workers, ambiente):
+    porta = _porta_livre()
+    processo = subprocess.Popen(_comando(modo, porta, workers), env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        limite = time.time() + 60
+        while True:
+            try:
+                conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=2)
+                conexao.request("GET", "/")
+                conexao.getresponse().read()
+                break
+            except OSError:
+                if time.time() > limite or processo.poll() is not None:
+                    raise RuntimeError(f"Servidor {modo} não subiu")
+                time.sleep(0.2)
+        yield porta, processo
+    finally:
+        processo.send_signal(signal.SIGTERM)
+        try:
+            processo.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+def _login(porta):
+    conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+    conexao.request("POST", "/auth/login", body=json.dumps({"username": "bench_0", "password": gerador.SENHA_BENCH}),
+                    headers={"Content-Type": "application/json"})
+    return json.loads(conexao.getresponse().read())["token"]
+
+def _carga(porta, urls, concorrencia, segundos):
+    headers = {"Authorization": "Bearer " + _login(porta)}
+    duracoes, erros = [], [0]
+    trava = threading.Lock()
+    fim = time.perf_counter() + segundos
+
+    def cliente(indice):
+        locais, falhas = [], 0
+        conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=60)
+        i = indice
+        while time.perf_counter() < fim:
+            url = urls[i % len(urls)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                conexao.request("GET", url, headers=headers)
+                resposta = conexao.getresponse()
+                resposta.read()
+                if resposta.status >= 400:
+                    falhas += 1
+                else:
+                    locais.append((time.perf_counter() - inicio) * 1000)
+            except (OSError, http.client.HTTPException):
+                falhas += 1
+                conexao.close()
+                conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=60)
+        with trava:
+            duracoes.extend(locais)
+            erros[0] += falhas
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+    return {
+        "requisicoes": len(duracoes),
+        "erros": erros[0],
+        "rps": round(len(duracoes) / decorrido, 1),
+        "p50_ms": round(percentil(duracoes, 0.50), 2),
+        "p95_ms": round(percentil(duracoes, 0.95), 2),
+        "p99_ms": round(percentil(duracoes, 0.99), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga WSGI x ASGI com o mesmo orçamento de memória.")
+    parser.add_argument("--escala", choices=sorted(gerador.ESCALAS), default="pequena")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--memoria-mb", type=int, default=512)
+    parser.add_argument("--concorrencia", type=int, default=200)
+    parser.add_argument("--segundos", type=float, default=15)
+    parser.add_argument("--aquecimento", type=float, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "carga.db")
+        ambiente = dict(os.environ, DATABASE_URL=f"sqlite:///{caminho}", METRICS_ENABLED="0")
+        os.environ.update(ambiente)
+        import main as app_main
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = app_main.create_app()
+        with app.app_context():
+            gerador.gerar(args.escala, args.semente)
+        alvos = _alvos(app)
+        v, d = alvos["viagem_id"], alvos["destino_id"]
+        urls = [
+            f"/api/viagens/{v}/relatorio/geral",
+            f"/api/destinos/{d}/despesas?limit=50",
+            f"/api/viagens/{v}/grafico/despesas_por_dia",
+            f"/api/viagens/{v}/grafico/despesas_por_categoria",
+            "/api/viagens",
+        ]
+
+        resultado = {"escala": args.escala, "memoria_mb": args.memoria_mb, "concorrencia": args.concorrencia,
+                     "segundos": args.segundos, "modos": {}}
+        for modo in ("wsgi", "asgi"):
+            # Memória de um worker aquecido define quantos cabem no orçamento
+            with _servidor(modo, 1, ambiente) as (porta, processo):
+                _carga(porta, urls, min(args.concorrencia, 20), args.aquecimento)
+                rss_um_worker_mb = _rss_arvore_kb(processo.pid) / 1024
+            workers = max(1, int(args.memoria_mb // rss_um_worker_mb))
+            with _servidor(modo, workers, ambiente) as (porta, processo):
+                _carga(porta, urls, min(args.concorrencia, 20), args.aquecimento)
+                medicao = _carga(porta, urls, args.concorrencia, args.segundos)
+                medicao["rss_total_mb"] = round(_rss_arvore_kb(processo.pid) / 1024, 1)
+            medicao["rss_um_worker_mb"] = round(rss_um_worker_mb, 1)
+            medicao["workers"] = workers
+            resultado["modos"][modo] = medicao
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
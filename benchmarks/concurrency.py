@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Benchmark de concorrência leitura/escrita no SQLite.
+#
+# Simula vários workers do gunicorn (um processo cada) disputando o mesmo
+# arquivo: leitores listam despesas e pedem o relatório geral, escritores
+# criam despesas. Roda duas vezes, com os padrões do SQLite (SQLITE_TUNING=0)
+# e com os PRAGMAs de utils/database.py, e imprime um JSON comparativo.
+#
+# Uso: python benchmarks/concurrency.py [--readers 4] [--writers 2] [--seconds 10]
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC)
+
+def _create_app(db_url, tuning):
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["SQLITE_TUNING"] = "1" if tuning else "0"
+    import main
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main.create_app()
+
+def _login(client):
+    r = client.post("/auth/login", json={"username": "admin", "password": "admin_password"})
+    return {"Authorization": "Bearer " + r.get_json()["token"]}
+
+def _prepare(db_url, tuning, despesas_iniciais):
+    app = _create_app(db_url, tuning)
+    client = app.test_client()
+    headers = _login(client)
+    viagem = client.post("/api/viagens", json={"nome_viagem": "Bench"}, headers=headers).get_json()
+    destino = client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": "Lisboa"}, headers=headers).get_json()
+    linhas = [{"descricao": f"despesa {i}", "valor": 10, "data": "2024-01-%02d" % (i % 28 + 1)} for i in range(despesas_iniciais)]
+    client.post(f"/api/destinos/{destino['id']}/despesas/lote", json=linhas, headers=headers)
+    return viagem["id"], destino["id"]
+
+def _worker(papel, db_url, tuning, viagem_id, destino_id, segundos, fila):
+    app = _create_app(db_url, tuning)
+    client = app.test_client()
+    headers = _login(client)
+    ok = erros = 0
+    fim = time.perf_counter() + segundos
+    i = 0
+    while time.perf_counter() < fim:
+        i += 1
+        if papel == "leitor":
+            url = f"/api/destinos/{destino_id}/despesas?limit=50" if i % 2 else f"/api/viagens/{viagem_id}/relatorio/geral"
+            r = client.get(url, headers=headers)
+        else:
+            r = client.post(f"/api/destinos/{destino_id}/despesas",
+                            json={"descricao": "bench", "valor": 1, "data": "2024-02-01"}, headers=headers)
+        if r.status_code < 400:
+            ok += 1
+        else:
+            erros += 1
+    fila.put((papel, ok, erros))
+
+def run(tuning, readers, writers, segundos, despesas_iniciais):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        viagem_id, destino_id = _prepare(db_url, tuning, despesas_iniciais)
+        fila = multiprocessing.Queue()
+        processos = [
+            multiprocessing.Process(target=_worker, args=(papel, db_url, tuning, viagem_id, destino_id, segundos, fila))
+            for papel in ["leitor"] * readers + ["escritor"] * writers
+        ]
+        for p in processos:
+            p.start()
+        resultados = [fila.get() for _ in processos]
+        for p in processos:
+            p.join()
+
+    resumo = {"leitor": {"ok": 0, "erros": 0}, "escritor": {"ok": 0, "erros": 0}}
+    for papel, ok, erros in resultados:
+        resumo[papel]["ok"] += ok
+        resumo[papel]["erros"] += erros
+    return {
+        "leituras_por_segundo": round(resumo["leitor"]["ok"] / segundos, 1),
+        "escritas_por_segundo": round(resumo["escritor"]["ok"] / segundos, 1),
+        "erros_leitura": resumo["leitor"]["erros"],
+        "erros_escrita": resumo["escritor"]["erros"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--despesas", type=int, default=5000, help="despesas criadas antes da medição")
+    args = parser.parse_args()
+
+    resultado = {
+        "config": vars(args),
+        "padrao_sqlite": run(False, args.readers, args.writers, args.seconds, args.despesas),
+        "ajustado": run(True, args.readers, args.writers, args.seconds, args.despesas),
+    }
+    print(json.dumps(resultado, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Gerador determinístico (semente fixa) de dados sintéticos para benchmarks.
+#
+# Preenche Usuario, Viagem, Destino, CategoriaDespesa, MeioPagamento e Despesa
+# com inserts em lote (executemany) e reconstrói ResumoDespesa no final. Deve
+# ser usado num banco novo, criado por create_app.
+#
+# Uso: DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/gerador.py --escala media
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC)
+
+ESCALAS = {
+    "pequena": {"usuarios": 2, "viagens": 5, "destinos": 4, "despesas": 2_000, "categorias": 8, "meios_pagamento": 4},
+    "media": {"usuarios": 5, "viagens": 20, "destinos": 5, "despesas": 100_000, "categorias": 12, "meios_pagamento": 5},
+    "grande": {"usuarios": 10, "viagens": 50, "destinos": 6, "despesas": 1_000_000, "categorias": 15, "meios_pagamento": 6},
+}
+
+SENHA_BENCH = "bench_password"
+BLOCO = 10_000
+
+CIDADES = ("Lisboa", "Porto", "Madrid", "Paris", "Roma", "Berlim", "Praga", "Viena", "Atenas", "Dublin")
+CATEGORIAS = ("Alimentação", "Transporte", "Hospedagem", "Passeios", "Compras", "Saúde", "Seguro",
+              "Comunicação", "Taxas", "Presentes", "Lavanderia", "Gorjetas", "Museus", "Bebidas", "Outros")
+MEIOS = ("Dinheiro", "Cartão de crédito", "Cartão de débito", "Pix", "Transferência", "Vale")
+DESCRICOES = ("Táxi", "Almoço", "Jantar", "Metrô", "Hotel", "Museu", "Mercado", "Café", "Trem", "Souvenir")
+
+def _inserir(model, linhas):
+    from sqlalchemy import insert
+    from models.models import db
+    for i in range(0, len(linhas), BLOCO):
+        db.session.execute(insert(model), linhas[i:i + BLOCO])
+
+def gerar(escala="pequena", semente=42, **ajustes):
+    # Deve ser chamado dentro de um app context
+    from sqlalchemy import select
+    from werkzeug.security import generate_password_hash
+    from models.models import db, Usuario, Viagem, Destino, CategoriaDespesa, MeioPagamento, Despesa
+    from services.resumo_despesas import reconstruir_resumos
+
+    params = dict(ESCALAS[escala], **ajustes)
+    rnd = random.Random(semente)
+    senha_hash = generate_password_hash(SENHA_BENCH, method="pbkdf2:sha256")
+
+    _inserir(Usuario, [{"username": f"bench_{u}", "password_hash": senha_hash} for u in range(params["usuarios"])])
+    usuarios = list(db.session.scalars(select(Usuario.id).where(Usuario.username.like("bench_%")).order_by(Usuario.id)))
+
+    categorias_linhas, meios_linhas, viagens_linhas = [], [], []
+    inicio_base = datetime.date(2022, 1, 1)
+    for usuario_id in usuarios:
+        categorias_linhas += [{"nome": CATEGORIAS[i % len(CATEGORIAS)] + ("" if i < len(CATEGORIAS) else f" {i}"), "usuario_id": usuario_id}
+                              for i in range(params["categorias"])]
+        meios_linhas += [{"nome": MEIOS[i % len(MEIOS)] + ("" if i < len(MEIOS) else f" {i}"), "usuario_id": usuario_id}
+                         for i in range(params["meios_pagamento"])]
+        for v in range(params["viagens"]):
+            inicio = inicio_base + datetime.timedelta(days=rnd.randrange(0, 1000))
+            viagens_linhas.append({
+                "nome_viagem": f"Viagem {v + 1}",
+                "data_inicio": inicio,
+                "data_fim": inicio + datetime.timedelta(days=rnd.randrange(5, 60)),
+                "orcamento_total": rnd.randrange(1_000, 20_000),
+                "usuario_id": usuario_id,
+            })
+    _inserir(CategoriaDespesa, categorias_linhas)
+    _inserir(MeioPagamento, meios_linhas)
+    _inserir(Viagem, viagens_linhas)
+
+    viagens = db.session.execute(select(Viagem.id, Viagem.usuario_id, Viagem.data_inicio, Viagem.data_fim)).all()
+    destinos_linhas = []
+    for viagem_id, usuario_id, data_inicio, data_fim in viagens:
+        for d in range(params["destinos"]):
+            destinos_linhas.append({
+                "nome_cidade": rnd.choice(CIDADES),
+                "data_chegada": data_inicio,
+                "data_partida": data_fim,
+                "orcamento_destino": rnd.randrange(200, 5_000),
+                "viagem_id": viagem_id,
+            })
+    _inserir(Destino, destinos_linhas)
+
+    categorias_por_usuario, meios_por_usuario = {}, {}
+    for id_, usuario_id in db.session.execute(select(CategoriaDespesa.id, CategoriaDespesa.usuario_id)):
+        categorias_por_usuario.setdefault(usuario_id, []).append(id_)
+    for id_, usuario_id in db.session.execute(select(MeioPagamento.id, MeioPagamento.usuario_id)):
+        meios_por_usuario.setdefault(usuario_id, []).append(id_)
+    destinos = db.session.execute(
+        select(Destino.id, Viagem.usuario_id, Viagem.data_inicio, Viagem.data_fim).join(Viagem, Destino.viagem_id == Viagem.id)
+    ).all()
+
+    # Despesas distribuídas uniformemente entre os destinos, em blocos para limitar a memória
+    restantes = params["despesas"]
+    while restantes > 0:
+        linhas = []
+        for _ in range(min(BLOCO, restantes)):
+            destino_id, usuario_id, data_inicio, data_fim = destinos[rnd.randrange(len(destinos))]
+            dias = max((data_fim - data_inicio).days, 1)
+            linhas.append({
+                "descricao": f"{rnd.choice(DESCRICOES)} {rnd.randrange(1000)}",
+                "valor": round(rnd.uniform(1, 300), 2),
+                "data": data_inicio + datetime.timedelta(days=rnd.randrange(dias)),
+                "observacoes": None if rnd.random() < 0.7 else "gerado pelo benchmark",
+                "destino_id": destino_id,
+                "categoria_id": rnd.choice(categorias_por_usuario[usuario_id]) if rnd.random() < 0.9 else None,
+                "meio_pagamento_id": rnd.choice(meios_por_usuario[usuario_id]) if rnd.random() < 0.95 else None,
+            })
+        _inserir(Despesa, linhas)
+        restantes -= len(linhas)
+
+    reconstruir_resumos()
+    db.session.commit()
+    return params
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para benchmarks.")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--despesas", type=int, default=None, help="sobrescreve o número de despesas da escala")
+    args = parser.parse_args()
+
+    import main as app_main
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = app_main.create_app()
+    ajustes = {"despesas": args.despesas} if args.despesas else {}
+    inicio = time.perf_counter()
+    with app.app_context():
+        params = gerar(args.escala, args.semente, **ajustes)
+    print(f"Escala {args.escala} gerada em {time.perf_counter() - inicio:.1f}s: {params}")
+
+if __name__ == "__main__":
+    main()
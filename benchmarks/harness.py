@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Harness de benchmark das rotas dos seis blueprints.
+#
+# Gera (ou reaproveita) um banco sintético com benchmarks/gerador.py, exercita
+# cada rota pelo test client do Flask e registra latência p50/p95/p99 e
+# comandos SQL por requisição (lidos do cabeçalho Server-Timing). O resultado
+# pode ser salvo como baseline JSON e comparado com uma baseline anterior; a
+# comparação sai com código 1 se alguma rota regredir.
+#
+# Uso:
+#   python benchmarks/harness.py --escala pequena --salvar benchmarks/baselines/pequena.json
+#   python benchmarks/harness.py --escala pequena --comparar benchmarks/baselines/pequena.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gerador
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+def percentil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+class Medidor:
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.amostras = {}
+
+    def __call__(self, nome, metodo, url, **kwargs):
+        headers = dict(self.headers, **kwargs.pop("headers", {}))
+        inicio = time.perf_counter()
+        response = self.client.open(url, method=metodo, headers=headers, **kwargs)
+        response.get_data()  # consome respostas em streaming
+        duracao = time.perf_counter() - inicio
+        match = _QUERIES_RE.search(response.headers.get("Server-Timing", ""))
+        self.amostras.setdefault(nome, []).append((duracao, int(match.group(1)) if match else None, response.status_code))
+        return response
+
+    def resumo(self):
+        resultado = {}
+        for nome, amostras in sorted(self.amostras.items()):
+            duracoes = [d * 1000 for d, _, _ in amostras]
+            queries = [q for _, q, _ in amostras if q is not None]
+            resultado[nome] = {
+                "amostras": len(amostras),
+                "p50_ms": round(percentil(duracoes, 0.50), 3),
+                "p95_ms": round(percentil(duracoes, 0.95), 3),
+                "p99_ms": round(percentil(duracoes, 0.99), 3),
+                "queries_media": round(sum(queries) / len(queries), 2) if queries else None,
+                "queries_max": max(queries) if queries else None,
+                "status": sorted({s for _, _, s in amostras}),
+            }
+        return resultado
+
+def _alvos(app):
+    # Ids usados nos cenários: a viagem/destino com mais despesas do primeiro usuário de benchmark
+    from sqlalchemy import func, select
+    from models.models import db, Usuario, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+    with app.app_context():
+        usuario_id = db.session.scalar(select(Usuario.id).where(Usuario.username == "bench_0"))
+        destino_id, viagem_id = db.session.execute(
+            select(Destino.id, Destino.viagem_id)
+            .join(Viagem, Destino.viagem_id == Viagem.id)
+            .join(Despesa, Despesa.destino_id == Destino.id)
+            .where(Viagem.usuario_id == usuario_id)
+            .group_by(Destino.id, Destino.viagem_id)
+            .order_by(func.count(Despesa.id).desc())
+            .limit(1)
+        ).first()
+        return {
+            "viagem_id": viagem_id,
+            "destino_id": destino_id,
+            "despesa_id": db.session.scalar(select(Despesa.id).where(Despesa.destino_id == destino_id).limit(1)),
+            "categoria_id": db.session.scalar(select(CategoriaDespesa.id).where(CategoriaDespesa.usuario_id == usuario_id).limit(1)),
+            "meio_pagamento_id": db.session.scalar(select(MeioPagamento.id).where(MeioPagamento.usuario_id == usuario_id).limit(1)),
+        }
+
+def executar(app, repeticoes):
+    client = app.test_client()
+    login = client.post("/auth/login", json={"username": "bench_0", "password": gerador.SENHA_BENCH})
+    medir = Medidor(client, {"Authorization": "Bearer " + login.get_json()["token"]})
+    alvos = _alvos(app)
+    v, d, dp = alvos["viagem_id"], alvos["destino_id"], alvos["despesa_id"]
+    filtros = "data_inicio=2022-01-01&data_fim=2030-12-31"
+
+    # auth_bp (login roda o KDF: poucas repetições)
+    for _ in range(max(3, repeticoes // 10)):
+        medir("auth.login", "POST", "/auth/login", json={"username": "bench_0", "password": gerador.SENHA_BENCH})
+        medir("auth.setup_admin", "POST", "/auth/setup_admin")
+    for i in range(repeticoes):
+        # Leituras
+        medir("viagem.list", "GET", "/api/viagens")
+        medir("viagem.get", "GET", f"/api/viagens/{v}")
+        medir("viagem.get_expand", "GET", f"/api/viagens/{v}?expand=destinos,despesas,categorias,meios_pagamento")
+        medir("destino.list", "GET", f"/api/viagens/{v}/destinos")
+        medir("destino.get", "GET", f"/api/destinos/{d}")
+        medir("despesa.list", "GET", f"/api/destinos/{d}/despesas?limit=50")
+        medir("despesa.get", "GET", f"/api/despesas/{dp}")
+        medir("dropdown.categorias", "GET", "/api/categorias")
+        medir("dropdown.meios_pagamento", "GET", "/api/meios_pagamento")
+        medir("relatorio.geral", "GET", f"/api/viagens/{v}/relatorio/geral")
+        medir("relatorio.geral_filtrado", "GET", f"/api/viagens/{v}/relatorio/geral?{filtros}")
+        medir("relatorio.grafico_categoria", "GET", f"/api/viagens/{v}/grafico/despesas_por_categoria")
+        medir("relatorio.grafico_dia", "GET", f"/api/viagens/{v}/grafico/despesas_por_dia")
+
+        # Escritas: cada ciclo cria, altera e remove, mantendo o banco estável
+        nova = medir("viagem.create", "POST", "/api/viagens", json={"nome_viagem": "bench", "orcamento_total": 100}).get_json()
+        medir("viagem.update", "PUT", f"/api/viagens/{nova['id']}", json={"nome_viagem": "bench 2"})
+        novo_destino = medir("destino.create", "POST", f"/api/viagens/{nova['id']}/destinos", json={"nome_cidade": "Bench"}).get_json()
+        medir("destino.update", "PUT", f"/api/destinos/{novo_destino['id']}", json={"orcamento_destino": 50})
+        despesa = medir("despesa.create", "POST", f"/api/destinos/{novo_destino['id']}/despesas", json={
+            "descricao": "bench", "valor": 12.5, "data": "2024-01-01", "categoria_id": alvos["categoria_id"],
+            "meio_pagamento_id": alvos["meio_pagamento_id"]}).get_json()
+        medir("despesa.update", "PUT", f"/api/despesas/{despesa['id']}", json={"valor": 13})
+        medir("despesa.delete", "DELETE", f"/api/despesas/{despesa['id']}")
+        if i % 10 == 0:
+            medir("despesa.lote", "POST", f"/api/destinos/{novo_destino['id']}/despesas/lote",
+                  json=[{"descricao": "lote", "valor": 1, "data": "2024-01-02"}] * 100)
+        medir("destino.delete", "DELETE", f"/api/destinos/{novo_destino['id']}")
+        medir("viagem.delete", "DELETE", f"/api/viagens/{nova['id']}")
+
+        categoria = medir("dropdown.categoria_create", "POST", "/api/categorias", json={"nome": f"bench {i}"}).get_json()
+        medir("dropdown.categoria_update", "PUT", f"/api/categorias/{categoria['id']}", json={"nome": f"bench {i} b"})
+        medir("dropdown.categoria_delete", "DELETE", f"/api/categorias/{categoria['id']}")
+        meio = medir("dropdown.meio_create", "POST", "/api/meios_pagamento", json={"nome": f"bench {i}"}).get_json()
+        medir("dropdown.meio_update", "PUT", f"/api/meios_pagamento/{meio['id']}", json={"nome": f"bench {i} b"})
+        medir("dropdown.meio_delete", "DELETE", f"/api/meios_pagamento/{meio['id']}")
+
+    # Exportação completa da viagem (streaming): poucas repetições
+    for _ in range(max(3, repeticoes // 10)):
+        medir("despesa.export_csv", "GET", f"/api/viagens/{v}/despesas/export?format=csv")
+    return medir.resumo()
+
+def comparar(atual, baseline, tolerancia, minimo_ms):
+    regressoes = []
+    for nome, base in baseline["rotas"].items():
+        agora = atual["rotas"].get(nome)
+        if agora is None:
+            continue
+        if base["queries_max"] is not None and agora["queries_max"] is not None and agora["queries_max"] > base["queries_max"]:
+            regressoes.append(f"{nome}: queries_max {base['queries_max']} -> {agora['queries_max']}")
+        limite = max(base["p95_ms"] * (1 + tolerancia), base["p95_ms"] + minimo_ms)
+        if agora["p95_ms"] > limite:
+            regressoes.append(f"{nome}: p95 {base['p95_ms']}ms -> {agora['p95_ms']}ms")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das rotas da API.")
+    parser.add_argument("--escala", choices=sorted(gerador.ESCALAS), default="pequena")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--db", help="arquivo SQLite a usar/gerar (padrão: temporário)")
+    parser.add_argument("--salvar", help="grava o resultado como baseline JSON")
+    parser.add_argument("--comparar", help="baseline JSON para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="aumento relativo de p95 tolerado")
+    parser.add_argument("--minimo-ms", type=float, default=5.0, help="aumento absoluto de p95 sempre tolerado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = args.db or os.path.join(tmp, "bench.db")
+        novo = not os.path.exists(caminho)
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(caminho)}"
+        os.environ["METRICS_ENABLED"] = "1"
+        import main as app_main
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = app_main.create_app()
+        if novo:
+            with app.app_context():
+                gerador.gerar(args.escala, args.semente)
+        resultado = {
+            "escala": args.escala,
+            "semente": args.semente,
+            "repeticoes": args.repeticoes,
+            "rotas": executar(app, args.repeticoes),
+        }
+
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salvar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salvar)), exist_ok=True)
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    print(saida)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia, args.minimo_ms)
+        for r in regressoes:
+            print(f"REGRESSÃO {r}", file=sys.stderr)
+        if regressoes:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Custo por linha da serialização de uma listagem de despesas.
+#
+# Compara o caminho antigo (objetos ORM + lazy load dos nomes + dict montado à
+# mão + json padrão) com o atual (select só de colunas + despesa_lista_encoder
+# + provider JSON da aplicação) para a mesma listagem de N linhas.
+#
+# Uso: python benchmarks/serializacao.py [--linhas 10000] [--repeticoes 5]
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gerador
+
+def _orm(db, Despesa, linhas):
+    despesas = Despesa.query.order_by(Despesa.id).limit(linhas).all()
+    output = []
+    for despesa in despesas:
+        output.append({
+            "id": despesa.id,
+            "descricao": despesa.descricao,
+            "valor": float(despesa.valor),
+            "data": despesa.data.isoformat(),
+            "observacoes": despesa.observacoes,
+            "categoria_id": despesa.categoria_id,
+            "categoria_nome": despesa.categoria.nome if despesa.categoria else None,
+            "meio_pagamento_id": despesa.meio_pagamento_id,
+            "meio_pagamento_nome": despesa.meio_pagamento.nome if despesa.meio_pagamento else None
+        })
+    return json.dumps(output)
+
+def _colunas(db, Despesa, linhas, app):
+    from models.models import CategoriaDespesa, MeioPagamento
+    from utils.serializacao import despesa_lista_encoder
+    rows = db.session.execute(
+        db.select(*despesa_lista_encoder.colunas)
+        .outerjoin(CategoriaDespesa, Despesa.categoria_id == CategoriaDespesa.id)
+        .outerjoin(MeioPagamento, Despesa.meio_pagamento_id == MeioPagamento.id)
+        .order_by(Despesa.id).limit(linhas)
+    )
+    return app.json.dumps(despesa_lista_encoder.linhas(rows))
+
+def medir(fn, repeticoes, db):
+    tempos = []
+    for _ in range(repeticoes):
+        db.session.expunge_all()  # sessão limpa, como numa requisição nova
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+        db.session.rollback()
+    return min(tempos)
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo por linha da serialização de listagens.")
+    parser.add_argument("--linhas", type=int, default=10_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["METRICS_ENABLED"] = "0"
+        import main as app_main
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = app_main.create_app()
+        from models.models import db, Despesa
+        with app.app_context():
+            gerador.gerar("pequena", despesas=args.linhas)
+            orm = medir(lambda: _orm(db, Despesa, args.linhas), args.repeticoes, db)
+            colunas = medir(lambda: _colunas(db, Despesa, args.linhas, app), args.repeticoes, db)
+
+    print(json.dumps({
+        "linhas": args.linhas,
+        "orm_us_por_linha": round(orm / args.linhas * 1e6, 2),
+        "colunas_us_por_linha": round(colunas / args.linhas * 1e6, 2),
+        "ganho": round(orm / colunas, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
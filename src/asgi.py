@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# Modo de execução ASGI (assíncrono).
+#
+# As rotas de leitura mais pesadas (listas, relatório e gráficos) rodam no
+# event loop com sessões assíncronas do SQLAlchemy, então um único processo
+# atende centenas de requisições concorrentes enquanto as consultas esperam o
+# banco. Todo o resto (escritas, auth, exportação, /metrics) segue para o app
+# Flask de sempre através do adaptador WSGI, num pool de threads limitado.
+#
+# As consultas, ETags e respostas são as mesmas das rotas WSGI: os SELECTs vêm
+# das funções consulta_* dos serviços/rotas e só a execução muda.
+#
+# Uso: uvicorn --app-dir src --factory asgi:create_asgi_app --workers 1
+import sys
+import os
+import re
+from urllib.parse import parse_qsl
+
+# Adiciona o diretório src ao sys.path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import jwt
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+
+import main
+from models.models import Usuario, Viagem
+from services.principal_cache import principal_cache, Principal
+from services.relatorio_engine import FiltroRelatorio, consulta_relatorio, montar_resultado, consulta_gastos_viagens, gastos_por_destino
+from services.cambio import TaxaIndisponivel, cambio_cache
+from services.versoes import consulta_versao_viagem, consulta_versao_destino, consulta_versao_viagens_cambio
+from routes.relatorio_routes import relatorio_geral_json, grafico_categoria_json, grafico_dia_json
+from routes.despesa_routes import consulta_despesas_destino, pagina_despesas
+from routes.viagem_routes import (
+    WITH_VALIDOS, consulta_viagens_usuario, consulta_destinos_usuario, moedas_base_viagens, viagens_com_resumo_json
+)
+from utils.database import create_async_engine_for
+from utils.etag import calcular_etag
+from utils.pagination import parse_limit, decode_cursor
+from utils.serializacao import viagem_encoder, dumps
+
+# Threads para as rotas que continuam no Flask (síncronas)
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "8"))
+
+class NaoAutenticado(Exception):
+    pass
+
+class Requisicao:
+    def __init__(self, scope):
+        self.path = scope["path"]
+        query_string = scope.get("query_string", b"").decode("latin-1")
+        self.args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+        # Mesmo formato de request.full_path, para que os ETags coincidam com o modo WSGI
+        self.full_path = f"{self.path}?{query_string}"
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+    def nao_modificado(self, etag):
+        return parse_etags(self.headers.get("if-none-match")).contains(etag)
+
+class Resposta:
+    def __init__(self, corpo, status=200, etag=None):
+        self.corpo = corpo
+        self.status = status
+        self.etag = etag
+
+def mensagem(texto, status):
+    return Resposta({"message": texto}, status)
+
+# --- Autenticação (mesmas regras e mensagens do token_required) ---
+async def autenticar(req, sessao, trust_claims):
+    auth_header = req.headers.get("authorization")
+    token = None
+    if auth_header:
+        partes = auth_header.split(" ")
+        if len(partes) < 2:
+            raise NaoAutenticado("Bearer token malformed")
+        token = partes[1]
+    if not token:
+        raise NaoAutenticado("Token is missing!")
+
+    cache_key = principal_cache.key_for(token)
+    principal = principal_cache.get(cache_key)
+    if principal is not None:
+        return principal
+    try:
+        data = jwt.decode(token, main.JWT_SECRET_KEY, algorithms=[main.JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise NaoAutenticado("Token has expired!")
+    except jwt.InvalidTokenError:
+        raise NaoAutenticado("Token is invalid!")
+    if trust_claims:
+        principal = Principal(data["user_id"], data.get("username"))
+    else:
+        row = (await sessao.execute(
+            select(Usuario.id, Usuario.username).where(Usuario.id == data["user_id"])
+        )).first()
+        if not row:
+            raise NaoAutenticado("User not found")
+        principal = Principal(row.id, row.username)
+    principal_cache.put(cache_key, principal, data.get("exp"))
+    return principal
+
+# --- Rotas assíncronas ---
+async def get_viagens(req, sessao, current_user):
+    versao = (await sessao.execute(consulta_versao_viagens_cambio(current_user.id))).first()
+    etag = calcular_etag(req.full_path, current_user.id, "viagens", *versao)
+    if req.nao_modificado(etag):
+        return Resposta(None, 304, etag)
+    incluir = req.args.get("with")
+    if incluir and incluir not in WITH_VALIDOS:
+        return mensagem(f"with inválido. Valores aceitos: {', '.join(sorted(WITH_VALIDOS))}", 400)
+    rows = (await sessao.execute(consulta_viagens_usuario(current_user.id))).all()
+    if not incluir:
+        return Resposta(viagem_encoder.linhas(rows), 200, etag)
+
+    gastos_rows = (await sessao.execute(consulta_gastos_viagens(current_user.id))).all()
+    cambio_cache.sincronizar(versao[1])
+    try:
+        gastos = await sessao.run_sync(lambda s: gastos_por_destino(gastos_rows, moedas_base_viagens(rows), s))
+    except TaxaIndisponivel as e:
+        return mensagem(str(e), 422)
+    destinos = await sessao.execute(consulta_destinos_usuario(current_user.id))
+    return Resposta(viagens_com_resumo_json(rows, destinos, gastos), 200, etag)
+
+async def get_despesas_por_destino(req, sessao, current_user, id_destino):
+    versao = (await sessao.execute(consulta_versao_destino(current_user.id, id_destino))).first()
+    if not versao:
+        return mensagem("Destino não encontrado ou não pertence ao usuário", 404)
+    etag = calcular_etag(req.full_path, current_user.id, "despesas", id_destino, *versao)
+    if req.nao_modificado(etag):
+        return Resposta(None, 304, etag)
+    try:
+        limit = parse_limit(req.args.get("limit"))
+        cursor = decode_cursor(req.args["cursor"]) if req.args.get("cursor") else None
+    except ValueError:
+        return mensagem("Parâmetros de paginação inválidos (limit/cursor)", 400)
+    rows = (await sessao.execute(consulta_despesas_destino(id_destino, req.args, cursor, limit))).all()
+    return Resposta(pagina_despesas(rows, limit), 200, etag)
+
+async def _relatorio(req, sessao, current_user, id_viagem, prefixo, dimensoes):
+    # Devolve (Resposta de erro/304, None) ou (None, (viagem, resultado, filtro, etag))
+    versao = (await sessao.execute(consulta_versao_viagem(current_user.id, id_viagem))).first()
+    if not versao:
+        return mensagem("Viagem não encontrada", 404), None
+    etag = calcular_etag(req.full_path, current_user.id, prefixo, id_viagem, *versao)
+    if req.nao_modificado(etag):
+        return Resposta(None, 304, etag), None
+    try:
+        filtro = FiltroRelatorio.from_args(req.args)
+    except ValueError:
+        return mensagem("Filtros inválidos", 400), None
+    cambio_cache.sincronizar(versao[2])
+    viagem = (await sessao.execute(
+        select(Viagem.id, Viagem.nome_viagem, Viagem.orcamento_total, Viagem.moeda_base).where(Viagem.id == id_viagem)
+    )).one()
+    rows = (await sessao.execute(consulta_relatorio(id_viagem, filtro, dimensoes, viagem.moeda_base))).all()
+    try:
+        # Cotações ausentes do cache são lidas pela sessão síncrona adaptada
+        resultado = await sessao.run_sync(lambda s: montar_resultado(rows, dimensoes, viagem.moeda_base, s))
+    except TaxaIndisponivel as e:
+        return mensagem(str(e), 422), None
+    return None, (viagem, resultado, filtro, etag)
+
+async def get_relatorio_geral(req, sessao, current_user, id_viagem):
+    resposta, dados = await _relatorio(req, sessao, current_user, id_viagem, "relatorio",
+                                       ("destino", "categoria", "meio_pagamento"))
+    if resposta:
+        return resposta
+    viagem, resultado, filtro, etag = dados
+    return Resposta(relatorio_geral_json(viagem, resultado, filtro), 200, etag)
+
+async def get_grafico_despesas_por_categoria(req, sessao, current_user, id_viagem):
+    resposta, dados = await _relatorio(req, sessao, current_user, id_viagem, "grafico", ("categoria",))
+    if resposta:
+        return resposta
+    return Resposta(grafico_categoria_json(dados[1]), 200, dados[3])
+
+async def get_grafico_despesas_por_dia(req, sessao, current_user, id_viagem):
+    resposta, dados = await _relatorio(req, sessao, current_user, id_viagem, "grafico", ("dia",))
+    if resposta:
+        return resposta
+    return Resposta(grafico_dia_json(dados[1]), 200, dados[3])
+
+# Só GET; o caminho completo (com o prefixo /api dos blueprints)
+ROTAS = (
+    (re.compile(r"^/api/viagens$"), get_viagens),
+    (re.compile(r"^/api/destinos/(\d+)/despesas$"), get_despesas_por_destino),
+    (re.compile(r"^/api/viagens/(\d+)/relatorio/geral$"), get_relatorio_geral),
+    (re.compile(r"^/api/viagens/(\d+)/grafico/despesas_por_categoria$"), get_grafico_despesas_por_categoria),
+    (re.compile(r"^/api/viagens/(\d+)/grafico/despesas_por_dia$"), get_grafico_despesas_por_dia),
+)
+
+class AsgiApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.trust_claims = flask_app.config.get("AUTH_TRUST_TOKEN_CLAIMS")
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)
+        self.engine = create_async_engine_for(flask_app)
+        self.sessoes = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "GET":
+            for padrao, handler in ROTAS:
+                encontrado = padrao.match(scope["path"])
+                if encontrado:
+                    args = [int(g) for g in encontrado.groups()]
+                    return await self._atender(handler, args, scope, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensagem_lifespan = await receive()
+            if mensagem_lifespan["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem_lifespan["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _atender(self, handler, args, scope, send):
+        req = Requisicao(scope)
+        try:
+            async with self.sessoes() as sessao:
+                try:
+                    current_user = await autenticar(req, sessao, self.trust_claims)
+                except NaoAutenticado as e:
+                    resposta = mensagem(str(e), 401)
+                else:
+                    resposta = await handler(req, sessao, current_user, *args)
+        except Exception as e:
+            resposta = Resposta({"message": "Erro interno", "error": str(e)}, 500)
+        await self._enviar(resposta, send)
+
+    async def _enviar(self, resposta, send):
+        headers = [(b"access-control-allow-origin", b"*")]
+        corpo = b""
+        if resposta.etag:
+            headers.append((b"etag", f'"{resposta.etag}"'.encode("latin-1")))
+        if resposta.status != 304:
+            corpo = dumps(resposta.corpo).encode("utf-8")
+            headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(corpo)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": resposta.status, "headers": headers})
+        await send({"type": "http.response.body", "body": corpo})
+
+def create_asgi_app():
+    return AsgiApp(main.create_app())
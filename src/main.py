@@ -6,14 +6,22 @@ from flask_cors import CORS
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".")))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from flask import Flask, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, request, jsonify, current_app, g
 import jwt # PyJWT
 import datetime
+import click
 from functools import wraps
 
 # Import models and db from the correct location
 from models.models import db, Usuario, Viagem, Destino, CategoriaDespesa, MeioPagamento, Despesa
+from services.principal_cache import principal_cache, Principal
+from services.senhas import gerar_hash_senha
+from services.analise_despesas import snapshot_cache
+from services.listas_cache import listas_cache
+from services.cache_relatorios import cache_relatorios, criar_backend
+from utils.database import database_config, configure_engine
+from utils.instrumentacao import init_instrumentacao
+from utils.serializacao import FastJSONProvider
 
 # Placeholder for JWT secret key - MUST BE CHANGED AND KEPT SECRET
 # For a real application, use a strong, randomly generated key stored in environment variables
@@ -21,10 +29,21 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "super-secret-key-for-dev")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_DELTA_SECONDS = 3600  # 1 hour
 
+# Cache de tokens validados (0 entradas desliga o cache)
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+# Se ligado, confia nas claims assinadas do token e não consulta Usuario no banco
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "0") == "1"
+
 # --- Authentication Decorator ---
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Sub-requisição de POST /api/batch: o lote já autenticou o usuário
+        principal_lote = g.get("principal_lote")
+        if principal_lote is not None:
+            return f(principal_lote, *args, **kwargs)
+
         token = None
         if "Authorization" in request.headers:
             auth_header = request.headers["Authorization"]
@@ -36,11 +55,22 @@ def token_required(f):
         if not token:
             return jsonify({"message": "Token is missing!"}), 401
 
+        # Token já validado recentemente: dispensa a decodificação e a consulta ao usuário
+        cache_key = principal_cache.key_for(token)
+        current_user = principal_cache.get(cache_key)
+        if current_user is not None:
+            return f(current_user, *args, **kwargs)
+
         try:
             data = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-            current_user = Usuario.query.filter_by(id=data["user_id"]).first()
-            if not current_user:
-                return jsonify({"message": "User not found"}), 401
+            if current_app.config.get("AUTH_TRUST_TOKEN_CLAIMS"):
+                current_user = Principal(data["user_id"], data.get("username"))
+            else:
+                usuario = Usuario.query.filter_by(id=data["user_id"]).first()
+                if not usuario:
+                    return jsonify({"message": "User not found"}), 401
+                current_user = Principal(usuario.id, usuario.username)
+            principal_cache.put(cache_key, current_user, data.get("exp"))
         except jwt.ExpiredSignatureError:
             return jsonify({"message": "Token has expired!"}), 401
         except jwt.InvalidTokenError:
@@ -52,14 +82,24 @@ def token_required(f):
 # --- Main Application Setup ---
 def create_app(config_name="default"):
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     CORS(app)
-    # --- Database Configuration ---
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "travel_finance.db")
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    # --- Database Configuration (DATABASE_URL, PRAGMAs do SQLite e pool; ver utils/database.py) ---
+    app.config.update(database_config())
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
+    app.config["AUTH_TRUST_TOKEN_CLAIMS"] = AUTH_TRUST_TOKEN_CLAIMS
+    principal_cache.configure(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+    snapshot_cache.clear()
+    listas_cache.clear()
+    cache_relatorios.configure(criar_backend())
 
     db.init_app(app)
+    with app.app_context():
+        configure_engine(app, db.engine)
+        # Server-Timing e /metrics (METRICS_ENABLED=0 desliga; /metrics exige METRICS_TOKEN)
+        if os.getenv("METRICS_ENABLED", "1") == "1":
+            init_instrumentacao(app, db.engine, os.getenv("METRICS_TOKEN"))
 
     # --- Blueprints --- 
     from routes.auth_routes import auth_bp
@@ -68,6 +108,8 @@ def create_app(config_name="default"):
     from routes.despesa_routes import despesa_bp
     from routes.dropdown_routes import dropdown_bp
     from routes.relatorio_routes import relatorio_bp
+    from routes.sync_routes import sync_bp
+    from routes.batch_routes import batch_bp
 
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(viagem_bp, url_prefix="/api")
@@ -75,11 +117,15 @@ def create_app(config_name="default"):
     app.register_blueprint(despesa_bp, url_prefix="/api") # Note: aninhamento real é feito nas rotas do blueprint
     app.register_blueprint(dropdown_bp, url_prefix="/api")
     app.register_blueprint(relatorio_bp, url_prefix="/api")
+    app.register_blueprint(sync_bp, url_prefix="/api")
+    app.register_blueprint(batch_bp, url_prefix="/api")
 
     with app.app_context():
         db.create_all()
+        from models.migrations import run_migrations
+        run_migrations()
         if not Usuario.query.filter_by(username="admin").first():
-            hashed_password = generate_password_hash("admin_password", method="pbkdf2:sha256")
+            hashed_password = gerar_hash_senha("admin_password")
             admin_user = Usuario(username="admin", password_hash=hashed_password)
             db.session.add(admin_user)
             db.session.commit()
@@ -91,6 +137,42 @@ def create_app(config_name="default"):
     def index():
         return "Flask Backend is running!"
 
+    # --- Comandos de manutenção (flask --app src/main.py verificar-resumos) ---
+    @app.cli.command("verificar-resumos")
+    @click.option("--viagem", "viagem_id", type=int, default=None, help="Restringe a verificação a uma viagem.")
+    @click.option("--reconstruir", is_flag=True, help="Reconstrói os resumos a partir das despesas antes de comparar.")
+    def verificar_resumos_command(viagem_id, reconstruir):
+        from services.resumo_despesas import reconstruir_resumos, verificar_resumos
+        if reconstruir:
+            reconstruir_resumos(viagem_id)
+            db.session.commit()
+        divergencias = verificar_resumos(viagem_id)
+        for d in divergencias:
+            click.echo(f"{d['chave']}: esperado={d['esperado']} atual={d['atual']}")
+        click.echo(f"{len(divergencias)} divergência(s) encontrada(s).")
+        if divergencias:
+            raise SystemExit(1)
+
+    # flask --app src/main.py carregar-cambio cotacoes.csv (colunas moeda,data,taxa)
+    @app.cli.command("carregar-cambio")
+    @click.argument("arquivo", type=click.File("r", encoding="utf-8"))
+    @click.option("--substituir", is_flag=True, help="Apaga todas as cotações antes de carregar o arquivo.")
+    def carregar_cambio_command(arquivo, substituir):
+        from services.cambio import carregar_taxas, MOEDA_REFERENCIA
+        try:
+            quantidade = carregar_taxas(arquivo, substituir)
+        except ValueError as e:
+            db.session.rollback()
+            raise click.ClickException(str(e))
+        click.echo(f"{quantidade} cotação(ões) carregada(s) (referência: {MOEDA_REFERENCIA}).")
+
+    # Apaga as viagens marcadas por DELETE ?async=true que a purga em segundo plano não concluiu
+    @app.cli.command("purgar-viagens")
+    def purgar_viagens_command():
+        from services.remocao_viagens import purgar_viagens_removidas
+        quantidade = purgar_viagens_removidas()
+        click.echo(f"{quantidade} viagem(ns) removida(s) apagada(s).")
+
     return app
 
 if __name__ == "__main__":
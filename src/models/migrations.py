@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+# Migrações versionadas do schema.
+#
+# db.create_all() só cria tabelas que ainda não existem: índices, colunas e
+# constraints novas declaradas nos modelos não chegam a um banco já existente.
+# Cada migração abaixo é aplicada uma única vez, em ordem, e a versão corrente
+# fica registrada na tabela schema_version.
+from sqlalchemy import (
+    text, inspect, select, insert, delete, func,
+    MetaData, Table, Column, Index, ForeignKey, Integer, String, Text, Date, DateTime, Numeric,
+)
+from sqlalchemy.schema import CreateTable, AddConstraint
+
+from models.models import db, MOEDA_PADRAO
+
+# Cada migração declara as tabelas como eram na sua versão (MetaData própria),
+# sem importar os modelos: mudanças futuras nos modelos não alteram o que uma
+# migração antiga faz quando é reaplicada num banco mais velho.
+
+def _has_duplicates(conn, table):
+    return conn.execute(text(
+        f'SELECT 1 FROM "{table}" GROUP BY usuario_id, nome HAVING COUNT(*) > 1 LIMIT 1'
+    )).first() is not None
+
+# --- 0001: índices dos caminhos de propriedade e filtros ---
+def _0001_indices(conn):
+    md = MetaData()
+    viagem = Table("Viagem", md, Column("usuario_id", Integer))
+    destino = Table("Destino", md, Column("viagem_id", Integer))
+    despesa = Table("Despesa", md, Column("id", Integer), Column("destino_id", Integer), Column("data", Date),
+                    Column("categoria_id", Integer), Column("meio_pagamento_id", Integer))
+    categoria = Table("CategoriaDespesa", md, Column("usuario_id", Integer), Column("nome", String(100)))
+    meio = Table("MeioPagamento", md, Column("usuario_id", Integer), Column("nome", String(100)))
+
+    for index in (
+        Index("ix_viagem_usuario", viagem.c.usuario_id),
+        Index("ix_destino_viagem", destino.c.viagem_id),
+        Index("ix_despesa_destino_data", despesa.c.destino_id, despesa.c.data, despesa.c.id),
+        Index("ix_despesa_categoria", despesa.c.categoria_id),
+        Index("ix_despesa_meio_pagamento", despesa.c.meio_pagamento_id),
+    ):
+        index.create(conn, checkfirst=True)
+
+    # Unicidade (usuario_id, nome): só é criada se os dados existentes permitirem
+    for tabela, index in (
+        (categoria, Index("uq_categoria_usuario", categoria.c.usuario_id, categoria.c.nome, unique=True)),
+        (meio, Index("uq_meiopagamento_usuario", meio.c.usuario_id, meio.c.nome, unique=True)),
+    ):
+        if _has_duplicates(conn, tabela.name):
+            print(f"Migração 0001: nomes duplicados em {tabela.name}; índice {index.name} não criado.")
+            continue
+        index.create(conn, checkfirst=True)
+
+# --- 0002: preenche ResumoDespesa a partir das despesas existentes ---
+def _0002_resumo_despesas(conn):
+    # A tabela que esta migração preenchia é recriada pela 0004 e pela 0006 e
+    # preenchida pela 0007; não há o que fazer aqui
+    pass
+
+# --- 0003: contadores de versão para ETags ---
+def _add_column(conn, table, column, ddl):
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+def _0003_versoes(conn):
+    _add_column(conn, "Viagem", "versao", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "Usuario", "versao_viagens", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "Usuario", "versao_listas", "INTEGER NOT NULL DEFAULT 1")
+
+# --- 0004: moedas (Despesa.moeda, Viagem.moeda_base) e resumo por moeda ---
+def _tabela_resumo(md, ondelete=None):
+    # ResumoDespesa com a moeda na chave (0004); a 0006 acrescenta ON DELETE CASCADE
+    for pai in ("Viagem", "Destino"):
+        if pai not in md.tables:
+            Table(pai, md, Column("id", Integer, primary_key=True))
+    resumo = Table(
+        "ResumoDespesa", md,
+        Column("id", Integer, primary_key=True),
+        Column("viagem_id", Integer, ForeignKey("Viagem.id", ondelete=ondelete), nullable=False),
+        Column("destino_id", Integer, ForeignKey("Destino.id", ondelete=ondelete), nullable=False),
+        Column("data", Date, nullable=False),
+        Column("categoria_id", Integer, nullable=False),
+        Column("meio_pagamento_id", Integer, nullable=False),
+        Column("moeda", String(3), nullable=False),
+        Column("total", Numeric(14, 2), nullable=False),
+        Column("quantidade", Integer, nullable=False),
+    )
+    Index("uq_resumo_chave", resumo.c.destino_id, resumo.c.data, resumo.c.categoria_id,
+          resumo.c.meio_pagamento_id, resumo.c.moeda, unique=True)
+    Index("ix_resumo_viagem", resumo.c.viagem_id, resumo.c.data)
+    return resumo
+
+def _0004_moedas(conn):
+    _add_column(conn, "Viagem", "moeda_base", f"VARCHAR(3) NOT NULL DEFAULT '{MOEDA_PADRAO}'")
+    _add_column(conn, "Despesa", "moeda", f"VARCHAR(3) NOT NULL DEFAULT '{MOEDA_PADRAO}'")
+    # ResumoDespesa é derivada: recriada com a moeda na chave (preenchida pela 0007)
+    resumo = _tabela_resumo(MetaData())
+    resumo.drop(conn, checkfirst=True)
+    resumo.create(conn)
+
+# --- 0005: índice de busca textual em Despesa (FTS5 no SQLite, full-text nativo nos demais) ---
+# Tabela FTS5 de conteúdo externo mantida por triggers (ver services/busca_despesas.py)
+_TRIGGERS_BUSCA_SQLITE = (
+    """CREATE TRIGGER IF NOT EXISTS despesa_busca_ai AFTER INSERT ON "Despesa" BEGIN
+        INSERT INTO "DespesaBusca"(rowid, descricao, observacoes) VALUES (new.id, new.descricao, new.observacoes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS despesa_busca_ad AFTER DELETE ON "Despesa" BEGIN
+        INSERT INTO "DespesaBusca"("DespesaBusca", rowid, descricao, observacoes)
+        VALUES ('delete', old.id, old.descricao, old.observacoes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS despesa_busca_au AFTER UPDATE OF descricao, observacoes ON "Despesa" BEGIN
+        INSERT INTO "DespesaBusca"("DespesaBusca", rowid, descricao, observacoes)
+        VALUES ('delete', old.id, old.descricao, old.observacoes);
+        INSERT INTO "DespesaBusca"(rowid, descricao, observacoes) VALUES (new.id, new.descricao, new.observacoes);
+    END""",
+)
+
+def _0005_busca_despesas(conn):
+    dialeto = conn.dialect.name
+    if dialeto == "sqlite":
+        conn.execute(text(
+            """CREATE VIRTUAL TABLE IF NOT EXISTS "DespesaBusca" USING fts5(
+            descricao, observacoes, content='Despesa', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2')"""
+        ))
+        for ddl in _TRIGGERS_BUSCA_SQLITE:
+            conn.execute(text(ddl))
+        # Indexa as despesas que já existiam
+        conn.execute(text("""INSERT INTO "DespesaBusca"("DespesaBusca") VALUES ('rebuild')"""))
+    elif dialeto == "mysql":
+        conn.execute(text("ALTER TABLE Despesa ADD FULLTEXT INDEX ft_despesa_texto (descricao, observacoes)"))
+    elif dialeto == "postgresql":
+        conn.execute(text(
+            """CREATE INDEX IF NOT EXISTS ft_despesa_texto ON "Despesa" USING GIN """
+            """(to_tsvector('simple', coalesce(descricao, '') || ' ' || coalesce(observacoes, '')))"""
+        ))
+
+# --- 0006: ON DELETE CASCADE nas chaves de Destino e Despesa; exclusão adiada de viagens ---
+def _tabelas_0006(md):
+    # Destino e Despesa completas (a recriação no SQLite copia todas as colunas)
+    Table("Viagem", md, Column("id", Integer, primary_key=True))
+    Table("CategoriaDespesa", md, Column("id", Integer, primary_key=True))
+    Table("MeioPagamento", md, Column("id", Integer, primary_key=True))
+    destino = Table(
+        "Destino", md,
+        Column("id", Integer, primary_key=True),
+        Column("nome_cidade", String(100), nullable=False),
+        Column("data_chegada", Date),
+        Column("data_partida", Date),
+        Column("orcamento_destino", Numeric(10, 2)),
+        Column("viagem_id", Integer, ForeignKey("Viagem.id", ondelete="CASCADE"), nullable=False),
+    )
+    Index("ix_destino_viagem", destino.c.viagem_id)
+    despesa = Table(
+        "Despesa", md,
+        Column("id", Integer, primary_key=True),
+        Column("descricao", String(255), nullable=False),
+        Column("valor", Numeric(10, 2), nullable=False),
+        Column("data", Date, nullable=False),
+        Column("observacoes", Text),
+        Column("moeda", String(3), nullable=False, server_default=MOEDA_PADRAO),
+        Column("destino_id", Integer, ForeignKey("Destino.id", ondelete="CASCADE"), nullable=False),
+        Column("categoria_id", Integer, ForeignKey("CategoriaDespesa.id")),
+        Column("meio_pagamento_id", Integer, ForeignKey("MeioPagamento.id")),
+    )
+    Index("ix_despesa_destino_data", despesa.c.destino_id, despesa.c.data, despesa.c.id)
+    Index("ix_despesa_categoria", despesa.c.categoria_id)
+    Index("ix_despesa_meio_pagamento", despesa.c.meio_pagamento_id)
+    return destino, despesa, _tabela_resumo(md, ondelete="CASCADE")
+
+def _fks_sem_cascata(conn, tabela):
+    # Chaves estrangeiras declaradas com ondelete que o banco ainda não tem
+    existentes = {
+        tuple(fk["constrained_columns"]): fk
+        for fk in inspect(conn).get_foreign_keys(tabela.name)
+    }
+    pendentes = []
+    for constraint in tabela.foreign_key_constraints:
+        if not constraint.ondelete:
+            continue
+        fk = existentes.get(tuple(constraint.column_keys))
+        if fk is None or (fk.get("options") or {}).get("ondelete", "").upper() != constraint.ondelete.upper():
+            pendentes.append((constraint, fk))
+    return pendentes
+
+def _recriar_tabela_sqlite(conn, tabela):
+    # O SQLite não altera constraints: cria a tabela nova, copia, apaga a antiga e
+    # renomeia (run_migrations desliga foreign_keys no SQLite antes da migração)
+    nome = tabela.name
+    temporaria = f"{nome}_nova"
+    ddl = str(CreateTable(tabela).compile(conn))
+    conn.execute(text(ddl.replace(f'CREATE TABLE "{nome}"', f'CREATE TABLE "{temporaria}"', 1)))
+    colunas = ", ".join(f'"{c.name}"' for c in tabela.columns)
+    # Linhas órfãs (pai já apagado) não são copiadas: a constraint nova as rejeitaria
+    pais = " AND ".join(
+        f'"{c.parent.name}" IN (SELECT "{c.column.name}" FROM "{c.column.table.name}")'
+        for c in tabela.foreign_keys if c.ondelete
+    )
+    filtro = f" WHERE {pais}" if pais else ""
+    conn.execute(text(f'INSERT INTO "{temporaria}" ({colunas}) SELECT {colunas} FROM "{nome}"{filtro}'))
+    conn.execute(text(f'DROP TABLE "{nome}"'))
+    conn.execute(text(f'ALTER TABLE "{temporaria}" RENAME TO "{nome}"'))
+    for index in tabela.indexes:
+        index.create(conn)
+
+def _0006_cascata(conn):
+    _add_column(conn, "Viagem", "removida_em", "DATETIME")
+    destino, despesa, resumo = _tabelas_0006(MetaData())
+    for tabela in (destino, despesa):
+        pendentes = _fks_sem_cascata(conn, tabela)
+        if not pendentes:
+            continue
+        if conn.dialect.name == "sqlite":
+            _recriar_tabela_sqlite(conn, tabela)
+            continue
+        for constraint, fk in pendentes:
+            if fk is not None and fk.get("name"):
+                if conn.dialect.name == "mysql":
+                    conn.execute(text(f'ALTER TABLE `{tabela.name}` DROP FOREIGN KEY `{fk["name"]}`'))
+                else:
+                    conn.execute(text(f'ALTER TABLE "{tabela.name}" DROP CONSTRAINT "{fk["name"]}"'))
+            conn.execute(AddConstraint(constraint))
+    if conn.dialect.name == "sqlite" and inspect(conn).has_table("DespesaBusca"):
+        # O DROP TABLE da Despesa antiga levou os triggers do índice de busca
+        for ddl in _TRIGGERS_BUSCA_SQLITE:
+            conn.execute(text(ddl))
+    # ResumoDespesa é derivada: recriada com as chaves novas (preenchida pela 0007)
+    if _fks_sem_cascata(conn, resumo):
+        resumo.drop(conn, checkfirst=True)
+        resumo.create(conn)
+
+# --- 0007: reconstrói ResumoDespesa a partir das despesas ---
+def _0007_reconstruir_resumos(conn):
+    # Preenche a tabela recriada pela 0004/0006; num banco em que elas já rodaram
+    # apenas refaz os mesmos grupos
+    md = MetaData()
+    destino = Table("Destino", md, Column("id", Integer), Column("viagem_id", Integer))
+    despesa = Table(
+        "Despesa", md,
+        Column("id", Integer), Column("destino_id", Integer), Column("data", Date),
+        Column("categoria_id", Integer), Column("meio_pagamento_id", Integer),
+        Column("moeda", String(3)), Column("valor", Numeric(10, 2)),
+    )
+    resumo = _tabela_resumo(md)
+    grupo = (
+        destino.c.viagem_id, despesa.c.destino_id, despesa.c.data,
+        func.coalesce(despesa.c.categoria_id, 0), func.coalesce(despesa.c.meio_pagamento_id, 0), despesa.c.moeda,
+    )
+    conn.execute(delete(resumo))
+    conn.execute(insert(resumo).from_select(
+        ["viagem_id", "destino_id", "data", "categoria_id", "meio_pagamento_id", "moeda", "total", "quantidade"],
+        select(*grupo, func.sum(despesa.c.valor), func.count(despesa.c.id))
+            .join(destino, despesa.c.destino_id == destino.c.id)
+            .group_by(*grupo)
+    ))
+
+# --- 0008: AUTOINCREMENT em Viagem, Destino e Despesa (SQLite) ---
+def _tabela_viagem_0008(md):
+    Table("Usuario", md, Column("id", Integer, primary_key=True))
+    viagem = Table(
+        "Viagem", md,
+        Column("id", Integer, primary_key=True),
+        Column("nome_viagem", String(255), nullable=False),
+        Column("data_inicio", Date),
+        Column("data_fim", Date),
+        Column("orcamento_total", Numeric(10, 2)),
+        Column("usuario_id", Integer, ForeignKey("Usuario.id"), nullable=False),
+        Column("moeda_base", String(3), nullable=False, server_default=MOEDA_PADRAO),
+        Column("versao", Integer, nullable=False, server_default="1"),
+        Column("removida_em", DateTime),
+        sqlite_autoincrement=True,
+    )
+    Index("ix_viagem_usuario", viagem.c.usuario_id)
+    return viagem
+
+def _0008_autoincrement(conn):
+    # Sem AUTOINCREMENT o SQLite reaproveita o maior id apagado, e o log da
+    # sincronização e os caches passariam a apontar para o registro de outro usuário
+    if conn.dialect.name != "sqlite":
+        return
+    # Destino e Despesa não mudaram desde a 0006; só ganham o AUTOINCREMENT
+    destino, despesa, _ = _tabelas_0006(MetaData())
+    for tabela in (destino, despesa):
+        tabela.dialect_options["sqlite"]["autoincrement"] = True
+    for tabela, nome_log in ((_tabela_viagem_0008(MetaData()), "viagens"), (destino, "destinos"), (despesa, "despesas")):
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": tabela.name}).scalar()
+        if "AUTOINCREMENT" not in ddl.upper():
+            _recriar_tabela_sqlite(conn, tabela)
+        # Ids apagados antes da migração também não voltam: o sqlite_sequence
+        # começa acima do maior id que o log de alterações já registrou
+        maior = conn.execute(text(
+            'SELECT max(registro_id) FROM "RegistroAlteracao" WHERE tabela = :t'), {"t": nome_log}).scalar()
+        if not maior:
+            continue
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :n"), {"n": tabela.name}).scalar()
+        if seq is None:
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:n, :s)"), {"n": tabela.name, "s": maior})
+        elif seq < maior:
+            conn.execute(text("UPDATE sqlite_sequence SET seq = :s WHERE name = :n"), {"n": tabela.name, "s": maior})
+    if inspect(conn).has_table("DespesaBusca"):
+        # O DROP TABLE da Despesa antiga levou os triggers do índice de busca
+        for ddl in _TRIGGERS_BUSCA_SQLITE:
+            conn.execute(text(ddl))
+
+MIGRATIONS = [
+    (1, "índices de propriedade e filtros", _0001_indices),
+    (2, "tabela de resumos de despesas", _0002_resumo_despesas),
+    (3, "contadores de versão", _0003_versoes),
+    (4, "moedas", _0004_moedas),
+    (5, "busca textual de despesas", _0005_busca_despesas),
+    (6, "remoção em cascata e exclusão adiada de viagens", _0006_cascata),
+    (7, "reconstrução dos resumos de despesas", _0007_reconstruir_resumos),
+    (8, "ids sem reaproveitamento em viagens, destinos e despesas", _0008_autoincrement),
+]
+
+def current_version(conn):
+    if not inspect(conn).has_table("schema_version"):
+        conn.execute(text("CREATE TABLE schema_version (version INTEGER NOT NULL)"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (0)"))
+        return 0
+    return conn.execute(text("SELECT version FROM schema_version")).scalar() or 0
+
+def _aplicar_migracoes(conn):
+    version = current_version(conn)
+    for number, descricao, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        migrate(conn)
+        conn.execute(text("UPDATE schema_version SET version = :v"), {"v": number})
+        print(f"Migração {number:04d} aplicada: {descricao}")
+
+def run_migrations():
+    with db.engine.connect() as conn:
+        # No SQLite o PRAGMA só vale fora de transação; com foreign_keys ligado o
+        # DROP TABLE das tabelas recriadas dispararia as cascatas (migração 0006)
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.commit()
+        try:
+            with conn.begin():
+                _aplicar_migracoes(conn)
+        finally:
+            if sqlite:
+                conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+                conn.commit()
@@ -2,19 +2,35 @@
 import sys
 import os
 
+# Moeda usada quando a viagem ou a despesa não informa uma (código ISO 4217)
+MOEDA_PADRAO = os.getenv("MOEDA_PADRAO", "BRL")
+
 # Adiciona o diretório src ao sys.path para permitir importações absolutas
 # Isso é crucial para que o Flask encontre os módulos corretamente
 # sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+class SessaoApp(Session):
+    # Num lote atômico (POST /api/batch) o commit das rotas só faz flush: o lote
+    # confirma ou desfaz tudo de uma vez no fim
+    def commit(self):
+        if self.info.get("lote_atomico"):
+            self.flush()
+            return
+        super().commit()
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": SessaoApp})
 
 class Usuario(db.Model):
     __tablename__ = 'Usuario'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
+    # Contadores de versão para ETags (ver services/versoes.py)
+    versao_viagens = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    versao_listas = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     viagens = db.relationship('Viagem', backref='usuario', lazy=True)
     categorias_despesa = db.relationship('CategoriaDespesa', backref='usuario', lazy=True)
@@ -31,8 +47,23 @@ class Viagem(db.Model):
     data_fim = db.Column(db.Date, nullable=True)
     orcamento_total = db.Column(db.Numeric(10, 2), nullable=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('Usuario.id'), nullable=False)
-
-    destinos = db.relationship('Destino', backref='viagem', lazy=True, cascade="all, delete-orphan")
+    # Moeda em que relatórios e gráficos da viagem são apresentados
+    moeda_base = db.Column(db.String(3), nullable=False, default=MOEDA_PADRAO, server_default=MOEDA_PADRAO)
+    versao = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Exclusão adiada (DELETE ?async=true): a viagem some das consultas na hora e
+    # os dados são apagados em segundo plano (ver services/remocao_viagens.py)
+    removida_em = db.Column(db.DateTime, nullable=True)
+
+    # AUTOINCREMENT: o SQLite não reaproveita ids apagados, que a sincronização
+    # (GET /api/sync) e os caches identificam pelo id
+    __table_args__ = (
+        db.Index('ix_viagem_usuario', 'usuario_id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    # Destinos, despesas e resumos são apagados pelo ON DELETE CASCADE do banco;
+    # passive_deletes evita que o ORM carregue os filhos só para removê-los
+    destinos = db.relationship('Destino', backref='viagem', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f'<Viagem {self.nome_viagem}>'
@@ -44,9 +75,14 @@ class Destino(db.Model):
     data_chegada = db.Column(db.Date, nullable=True)
     data_partida = db.Column(db.Date, nullable=True)
     orcamento_destino = db.Column(db.Numeric(10, 2), nullable=True)
-    viagem_id = db.Column(db.Integer, db.ForeignKey('Viagem.id'), nullable=False)
+    viagem_id = db.Column(db.Integer, db.ForeignKey('Viagem.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_destino_viagem', 'viagem_id'),
+        {'sqlite_autoincrement': True},
+    )
 
-    despesas = db.relationship('Despesa', backref='destino', lazy=True, cascade="all, delete-orphan")
+    despesas = db.relationship('Despesa', backref='destino', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f'<Destino {self.nome_cidade}>'
@@ -56,8 +92,10 @@ class CategoriaDespesa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     usuario_id = db.Column(db.Integer, db.ForeignKey('Usuario.id'), nullable=False)
-    # Adicionar unique=True se o nome da categoria deve ser único por usuário
-    # db.UniqueConstraint('nome', 'usuario_id', name='uq_categoria_usuario')
+    # Nome da categoria é único por usuário; o índice também serve a listagem ordenada por nome
+    __table_args__ = (
+        db.Index('uq_categoria_usuario', 'usuario_id', 'nome', unique=True),
+    )
 
     despesas = db.relationship('Despesa', backref='categoria', lazy=True)
 
@@ -69,8 +107,10 @@ class MeioPagamento(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     usuario_id = db.Column(db.Integer, db.ForeignKey('Usuario.id'), nullable=False)
-    # Adicionar unique=True se o nome do meio de pagamento deve ser único por usuário
-    # db.UniqueConstraint('nome', 'usuario_id', name='uq_meiopagamento_usuario')
+    # Nome do meio de pagamento é único por usuário
+    __table_args__ = (
+        db.Index('uq_meiopagamento_usuario', 'usuario_id', 'nome', unique=True),
+    )
 
     despesas = db.relationship('Despesa', backref='meio_pagamento', lazy=True)
 
@@ -84,10 +124,107 @@ class Despesa(db.Model):
     valor = db.Column(db.Numeric(10, 2), nullable=False)
     data = db.Column(db.Date, nullable=False)
     observacoes = db.Column(db.Text, nullable=True)
-    destino_id = db.Column(db.Integer, db.ForeignKey('Destino.id'), nullable=False)
+    moeda = db.Column(db.String(3), nullable=False, default=MOEDA_PADRAO, server_default=MOEDA_PADRAO)
+    destino_id = db.Column(db.Integer, db.ForeignKey('Destino.id', ondelete='CASCADE'), nullable=False)
     categoria_id = db.Column(db.Integer, db.ForeignKey('CategoriaDespesa.id'), nullable=True)
     meio_pagamento_id = db.Column(db.Integer, db.ForeignKey('MeioPagamento.id'), nullable=True)
 
+    # (destino_id, data, id) cobre a listagem paginada e os filtros por período
+    __table_args__ = (
+        db.Index('ix_despesa_destino_data', 'destino_id', 'data', 'id'),
+        db.Index('ix_despesa_categoria', 'categoria_id'),
+        db.Index('ix_despesa_meio_pagamento', 'meio_pagamento_id'),
+        {'sqlite_autoincrement': True},
+    )
+
     def __repr__(self):
         return f'<Despesa {self.descricao} - {self.valor}>'
 
+
+class ResumoDespesa(db.Model):
+    # Tabela de agregados mantida junto com as escritas em Despesa (ver services/resumo_despesas.py).
+    # Categoria e meio de pagamento ausentes são gravados como 0 para que a chave seja única.
+    __tablename__ = 'ResumoDespesa'
+    id = db.Column(db.Integer, primary_key=True)
+    viagem_id = db.Column(db.Integer, db.ForeignKey('Viagem.id', ondelete='CASCADE'), nullable=False)
+    destino_id = db.Column(db.Integer, db.ForeignKey('Destino.id', ondelete='CASCADE'), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    categoria_id = db.Column(db.Integer, nullable=False, default=0)
+    meio_pagamento_id = db.Column(db.Integer, nullable=False, default=0)
+    moeda = db.Column(db.String(3), nullable=False)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_resumo_chave', 'destino_id', 'data', 'categoria_id', 'meio_pagamento_id', 'moeda', unique=True),
+        db.Index('ix_resumo_viagem', 'viagem_id', 'data'),
+    )
+
+    def __repr__(self):
+        return f'<ResumoDespesa {self.viagem_id}/{self.destino_id} {self.data} - {self.total}>'
+
+class TaxaCambio(db.Model):
+    # Cotações carregadas de arquivo (flask carregar-cambio): unidades de "moeda"
+    # por 1 unidade da moeda de referência, na data indicada
+    __tablename__ = 'TaxaCambio'
+    id = db.Column(db.Integer, primary_key=True)
+    moeda = db.Column(db.String(3), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    taxa = db.Column(db.Numeric(18, 8), nullable=False)
+
+    __table_args__ = (
+        db.Index('uq_taxa_moeda_data', 'moeda', 'data', unique=True),
+    )
+
+    def __repr__(self):
+        return f'<TaxaCambio {self.moeda} {self.data} {self.taxa}>'
+
+class VersaoCambio(db.Model):
+    # Linha única (id=1) contada a cada carga de cotações; entra nos ETags e nas
+    # chaves de cache das respostas convertidas, em todos os processos
+    __tablename__ = 'VersaoCambio'
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<VersaoCambio {self.versao}>'
+
+class RefreshToken(db.Model):
+    # Guarda só o HMAC do token; "familia" agrupa as rotações de um mesmo login
+    __tablename__ = 'RefreshToken'
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('Usuario.id'), nullable=False)
+    token_hash = db.Column(db.String(64), nullable=False)
+    familia = db.Column(db.String(32), nullable=False)
+    criado_em = db.Column(db.DateTime, nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False)
+    revogado_em = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('uq_refresh_token_hash', 'token_hash', unique=True),
+        db.Index('ix_refresh_token_familia', 'familia'),
+        db.Index('ix_refresh_token_usuario', 'usuario_id'),
+    )
+
+    def __repr__(self):
+        return f'<RefreshToken {self.id} usuario={self.usuario_id}>'
+
+class RegistroAlteracao(db.Model):
+    # Log de alterações da sincronização incremental (GET /api/sync): o id
+    # crescente é o cursor. Preenchido por services/alteracoes.py na mesma
+    # transação da escrita; "removido" marca as exclusões (tombstones)
+    __tablename__ = 'RegistroAlteracao'
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('Usuario.id'), nullable=False)
+    tabela = db.Column(db.String(20), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    removido = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.Index('ix_alteracao_usuario', 'usuario_id', 'id'),
+        # Sem AUTOINCREMENT o SQLite pode reutilizar ids e o cursor andaria para trás
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<RegistroAlteracao {self.id} {self.tabela}/{self.registro_id}>'
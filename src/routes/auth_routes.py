@@ -6,15 +6,37 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from flask import Blueprint, request, jsonify
-from werkzeug.security import check_password_hash, generate_password_hash
 import jwt
 import datetime
 
 from models.models import db, Usuario
-from main import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_DELTA_SECONDS # Import from main
+from main import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_DELTA_SECONDS, token_required # Import from main
+from services.senhas import gerar_hash_senha, verificar_senha, SenhasOcupadas, SENHA_HASH_TIMEOUT_SECONDS
+from services import refresh_tokens
+from services.refresh_tokens import RefreshTokenInvalido
 
 auth_bp = Blueprint("auth_bp", __name__)
 
+def gerar_access_token(usuario_id, username):
+    token_payload = {
+        "user_id": usuario_id,
+        "username": username,
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=JWT_EXPIRATION_DELTA_SECONDS)
+    }
+    return jwt.encode(token_payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def resposta_tokens(usuario_id, username, refresh_token):
+    return jsonify({
+        "token": gerar_access_token(usuario_id, username),
+        "refresh_token": refresh_token,
+        "expires_in": JWT_EXPIRATION_DELTA_SECONDS
+    })
+
+def servidor_ocupado(e):
+    resposta = jsonify({"message": str(e)})
+    resposta.headers["Retry-After"] = str(int(SENHA_HASH_TIMEOUT_SECONDS))
+    return resposta, 503
+
 @auth_bp.route("/login", methods=["POST"])
 def login():
     data = request.get_json()
@@ -23,17 +45,44 @@ def login():
 
     user = Usuario.query.filter_by(username=data["username"]).first()
 
-    if not user or not check_password_hash(user.password_hash, data["password"]):
-        return jsonify({"message": "Invalid credentials"}), 401
+    # PBKDF2 no pool limitado de services/senhas.py (503 se estiver lotado)
+    try:
+        if not user or not verificar_senha(user.password_hash, data["password"]):
+            return jsonify({"message": "Invalid credentials"}), 401
+    except SenhasOcupadas as e:
+        return servidor_ocupado(e)
 
-    token_payload = {
-        "user_id": user.id,
-        "username": user.username,
-        "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=JWT_EXPIRATION_DELTA_SECONDS)
-    }
-    token = jwt.encode(token_payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    refresh_tokens.remover_expirados(user.id)
+    refresh_token = refresh_tokens.emitir(user.id, JWT_SECRET_KEY)
+    db.session.commit()
+    return resposta_tokens(user.id, user.username, refresh_token), 200
+
+# Renovação da sessão: troca o refresh token por um novo par, sem verificar a senha
+@auth_bp.route("/refresh", methods=["POST"])
+def refresh():
+    data = request.get_json(silent=True) or {}
+    try:
+        usuario_id, novo_refresh_token = refresh_tokens.rotacionar(data.get("refresh_token"), JWT_SECRET_KEY)
+    except RefreshTokenInvalido as e:
+        return jsonify({"message": str(e)}), 401
 
-    return jsonify({"token": token}), 200
+    user = db.session.get(Usuario, usuario_id)
+    if not user:
+        db.session.rollback()
+        return jsonify({"message": "User not found"}), 401
+    db.session.commit()
+    return resposta_tokens(user.id, user.username, novo_refresh_token), 200
+
+# Logout: revoga a família do refresh token ("todos": true revoga as sessões de todos os dispositivos)
+@auth_bp.route("/logout", methods=["POST"])
+def logout():
+    data = request.get_json(silent=True) or {}
+    try:
+        refresh_tokens.revogar(data.get("refresh_token"), JWT_SECRET_KEY, todos=bool(data.get("todos")))
+    except RefreshTokenInvalido as e:
+        return jsonify({"message": str(e)}), 401
+    db.session.commit()
+    return jsonify({"message": "Sessão encerrada"}), 200
 
 # Rota para criar o usuário admin se não existir (apenas para setup inicial, pode ser removida ou protegida depois)
 @auth_bp.route("/setup_admin", methods=["POST"])
@@ -42,7 +91,10 @@ def setup_admin():
         return jsonify({"message": "Admin user already exists"}), 409
     
     # Em um cenário real, a senha viria de uma config segura ou input
-    hashed_password = generate_password_hash("admin_password", method="pbkdf2:sha256")
+    try:
+        hashed_password = gerar_hash_senha("admin_password")
+    except SenhasOcupadas as e:
+        return servidor_ocupado(e)
     admin_user = Usuario(username="admin", password_hash=hashed_password)
     db.session.add(admin_user)
     db.session.commit()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# POST /api/batch: várias chamadas da API numa única ida e volta HTTP.
+#
+# Corpo: {"requests": [{"id": "v", "method": "GET", "path": "/api/viagens/1",
+#          "body": {...}, "headers": {"If-None-Match": "..."}}, ...],
+#         "atomico": false, "paralelo": false}
+#
+# O token é validado uma vez, pelo token_required do próprio lote; as
+# sub-requisições são despachadas para as rotas dos blueprints dentro do mesmo
+# contexto de aplicação, ou seja, com a mesma sessão do banco.
+# - atomico: as escritas de todas as sub-requisições ficam numa só transação
+#   (ver SessaoApp); a primeira resposta com status >= 400 interrompe o lote,
+#   as seguintes voltam com 424 e nada é gravado. As sub-respostas não levam
+#   ETag: as versões lidas dentro do lote podem nunca ser confirmadas.
+# - paralelo: GETs consecutivos rodam em paralelo num pool de threads, cada
+#   um com sua própria sessão (uma conexão do SQLite não é compartilhada entre
+#   threads); as escritas continuam em ordem entre eles. Não combina com
+#   atomico, pois as leituras paralelas não enxergariam as escritas pendentes.
+import sys
+import os
+
+# Adiciona o diretório src ao sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, request, jsonify, current_app, g
+from werkzeug.exceptions import HTTPException
+from main import token_required # Import from main
+from models.models import db
+from services.listas_cache import listas_cache
+from services.analise_despesas import snapshot_cache
+from services.cache_relatorios import cache_relatorios
+
+BATCH_MAX_REQUISICOES = int(os.getenv("BATCH_MAX_REQUISICOES", "50"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+
+METODOS = {"GET", "POST", "PUT", "DELETE"}
+CAMINHO_LOTE = "/api/batch"
+
+batch_bp = Blueprint("batch_bp", __name__)
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+def _validar(item):
+    # Devolve (sub-requisição normalizada, None) ou (None, mensagem de erro)
+    if not isinstance(item, dict):
+        return None, "cada sub-requisição deve ser um objeto"
+    metodo = str(item.get("method") or "GET").upper()
+    caminho = item.get("path")
+    headers = item.get("headers") or {}
+    if metodo not in METODOS:
+        return None, f"method inválido. Valores aceitos: {', '.join(sorted(METODOS))}"
+    if not isinstance(caminho, str) or not caminho.startswith("/"):
+        return None, "path deve ser um caminho absoluto, como /api/viagens"
+    if caminho.split("?", 1)[0].rstrip("/") == CAMINHO_LOTE:
+        return None, "lotes aninhados não são permitidos"
+    if not isinstance(headers, dict):
+        return None, "headers deve ser um objeto"
+    # O lote já autenticou: cabeçalhos de autenticação das sub-requisições são ignorados
+    headers = {k: str(v) for k, v in headers.items() if k.lower() != "authorization"}
+    return {"id": item.get("id"), "method": metodo, "path": caminho, "body": item.get("body"), "headers": headers}, None
+
+def _despachar(app, item):
+    # Executa a rota no contexto de aplicação corrente: mesma sessão e mesmo g (principal_lote)
+    kwargs = {"method": item["method"], "headers": item["headers"]}
+    if item["body"] is not None:
+        kwargs["json"] = item["body"]
+    with app.test_request_context(item["path"], **kwargs):
+        try:
+            resposta = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            return {"status": e.code, "body": {"message": e.description}}
+        except Exception as e:
+            db.session.rollback()
+            return {"status": 500, "body": {"message": "Erro interno", "error": str(e)}}
+        corpo = resposta.get_json(silent=True)
+        if corpo is None and resposta.status_code != 304:
+            # Exportações em CSV e outras respostas que não são JSON
+            corpo = resposta.get_data(as_text=True)
+        resultado = {"status": resposta.status_code, "body": corpo}
+        if resposta.headers.get("ETag") and not db.session.info.get("lote_atomico"):
+            resultado["headers"] = {"ETag": resposta.headers["ETag"]}
+        return resultado
+
+def _despachar_isolado(app, principal, item):
+    # Thread do pool: contexto de aplicação próprio, logo sessão própria
+    with app.app_context():
+        g.principal_lote = principal
+        return _despachar(app, item)
+
+def _descartar_caches(usuario_id, viagens_alteradas):
+    # Lote atômico desfeito: caches montados dentro dele podem ter visto as
+    # escritas desfeitas, e a próxima escrita real repete as mesmas versões
+    listas_cache.invalidar(usuario_id)
+    snapshot_cache.descartar(usuario_id)
+    for viagem_id in viagens_alteradas:
+        cache_relatorios.invalidar_viagem(viagem_id)
+
+@batch_bp.route("/batch", methods=["POST"])
+@token_required
+def post_batch(current_user):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("requests"), list) or not data["requests"]:
+        return jsonify({"message": "Informe em 'requests' a lista de sub-requisições"}), 400
+    if len(data["requests"]) > BATCH_MAX_REQUISICOES:
+        return jsonify({"message": f"O lote aceita no máximo {BATCH_MAX_REQUISICOES} sub-requisições"}), 400
+    atomico = bool(data.get("atomico"))
+    paralelo = bool(data.get("paralelo"))
+    if atomico and paralelo:
+        return jsonify({"message": "Os modos atomico e paralelo não podem ser combinados"}), 400
+
+    itens = []
+    for posicao, item in enumerate(data["requests"]):
+        normalizado, erro = _validar(item)
+        if erro:
+            return jsonify({"message": f"Sub-requisição {posicao}: {erro}"}), 400
+        itens.append(normalizado)
+
+    app = current_app._get_current_object()
+    g.principal_lote = current_user
+    respostas = [None] * len(itens)
+    interrompido = False
+    if atomico:
+        db.session.info["lote_atomico"] = True
+    try:
+        i = 0
+        while i < len(itens):
+            # Sequência de GETs consecutivos: vai inteira para o pool
+            fim = i
+            while paralelo and fim < len(itens) and itens[fim]["method"] == "GET":
+                fim += 1
+            if fim - i > 1:
+                futuros = [_executor.submit(_despachar_isolado, app, current_user, itens[k]) for k in range(i, fim)]
+                for k, futuro in zip(range(i, fim), futuros):
+                    respostas[k] = futuro.result()
+                i = fim
+                continue
+
+            respostas[i] = _despachar(app, itens[i])
+            if respostas[i]["status"] >= 400:
+                if atomico:
+                    interrompido = True
+                    for k in range(i + 1, len(itens)):
+                        respostas[k] = {"status": 424, "body": {"message": "Não executada: o lote atômico foi interrompido"}}
+                    break
+                # Como no fim de uma requisição comum: o que a rota deixou sem
+                # commit não pode ir junto no commit da próxima sub-requisição
+                db.session.rollback()
+            i += 1
+    finally:
+        db.session.info.pop("lote_atomico", None)
+
+    resultado = {"responses": [dict(resposta, id=item["id"]) for item, resposta in zip(itens, respostas)]}
+    if atomico:
+        viagens_alteradas = db.session.info.pop("viagens_alteradas", set())
+        if interrompido:
+            db.session.rollback()
+            _descartar_caches(current_user.id, viagens_alteradas)
+        else:
+            try:
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                _descartar_caches(current_user.id, viagens_alteradas)
+                return jsonify({"message": "Erro ao confirmar o lote", "error": str(e)}), 500
+        resultado["confirmado"] = not interrompido
+    return jsonify(resultado), 200
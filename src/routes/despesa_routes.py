@@ -5,13 +5,35 @@ import os
 # Adiciona o diretório src ao sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from main import token_required # Import from main
+from sqlalchemy import and_, or_
 from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+from utils.pagination import parse_limit, encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+from services.resumo_despesas import registrar_despesa
+from services.importacao_despesas import FORMATOS, ler_registros, importar_despesas
+from services.relatorio_engine import FiltroRelatorio
+from services.cambio import normalizar_moeda
+from services.busca_despesas import termos_busca, consulta_busca, BuscaNaoSuportada, ESCALA_RANK
+from services.listas_cache import listas_cache
+from services.versoes import incrementar_versao_viagem, versao_viagem, versao_destino, versao_despesa, versao_viagens, versao_listas
+from utils.etag import gerar_etag, nao_modificado, com_etag
+from utils.serializacao import despesa_completa_encoder, despesa_lista_encoder, despesa_busca_encoder, dumps
 from datetime import datetime
+import csv
+import io
 
 despesa_bp = Blueprint("despesa_bp", __name__)
 
+def _id_da_lista(valor, ids):
+    # Aceita o id como número ou texto ("1"), como a importação CSV;
+    # None se não for inteiro ou não estiver nas listas do usuário
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return valor if valor in ids else None
+
 # --- Despesas Endpoints (aninhados sob /api/destinos/<id_destino>/despesas) ---
 @despesa_bp.route("/destinos/<int:id_destino>/despesas", methods=["POST"])
 @token_required
@@ -21,135 +43,221 @@ def create_despesa(current_user, id_destino):
         return jsonify({"message": "Descrição, valor e data são obrigatórios"}), 400
 
     # Verificar se o destino pertence a uma viagem do usuário atual
-    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id).first()
+    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
     if not destino:
         return jsonify({"message": "Destino não encontrado ou não pertence ao usuário"}), 404
     
-    # Validar categoria_id se fornecido
-    categoria = None
+    # Validar categoria_id e meio_pagamento_id (se fornecidos) contra as listas em cache do usuário;
+    # a versão lida do banco descarta a entrada se outro processo alterou as listas
+    listas = listas_cache.obter(current_user.id, versao_listas(current_user.id))
+    categoria_id = meio_pagamento_id = None
     if data.get("categoria_id"):
-        categoria = CategoriaDespesa.query.filter_by(id=data["categoria_id"], usuario_id=current_user.id).first()
-        if not categoria:
+        categoria_id = _id_da_lista(data["categoria_id"], listas.categorias)
+        if categoria_id is None:
             return jsonify({"message": "Categoria não encontrada ou não pertence ao usuário"}), 400
-
-    # Validar meio_pagamento_id se fornecido
-    meio_pagamento = None
     if data.get("meio_pagamento_id"):
-        meio_pagamento = MeioPagamento.query.filter_by(id=data["meio_pagamento_id"], usuario_id=current_user.id).first()
-        if not meio_pagamento:
+        meio_pagamento_id = _id_da_lista(data["meio_pagamento_id"], listas.meios_pagamento)
+        if meio_pagamento_id is None:
             return jsonify({"message": "Meio de pagamento não encontrado ou não pertence ao usuário"}), 400
 
+    # Sem moeda informada, a despesa fica na moeda base da viagem
+    try:
+        moeda = normalizar_moeda(data["moeda"]) if data.get("moeda") else destino.viagem.moeda_base
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     try:
         nova_despesa = Despesa(
             descricao=data["descricao"],
             valor=data["valor"],
+            moeda=moeda,
             data=datetime.strptime(data["data"], "%Y-%m-%d").date(),
             observacoes=data.get("observacoes"),
             destino_id=id_destino,
-            categoria_id=data.get("categoria_id"),
-            meio_pagamento_id=data.get("meio_pagamento_id")
+            categoria_id=categoria_id,
+            meio_pagamento_id=meio_pagamento_id
         )
         db.session.add(nova_despesa)
+        registrar_despesa(destino.viagem_id, nova_despesa)
+        incrementar_versao_viagem(destino.viagem_id, current_user.id)
         db.session.commit()
-        return jsonify({
-            "id": nova_despesa.id,
-            "descricao": nova_despesa.descricao,
-            "valor": float(nova_despesa.valor),
-            "data": nova_despesa.data.isoformat(),
-            "observacoes": nova_despesa.observacoes,
-            "destino_id": nova_despesa.destino_id,
-            "categoria_id": nova_despesa.categoria_id,
-            "meio_pagamento_id": nova_despesa.meio_pagamento_id
-        }), 201
+        return jsonify(despesa_completa_encoder.objeto(nova_despesa)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao criar despesa", "error": str(e)}), 500
 
+# Importação em lote: array JSON, NDJSON (application/x-ndjson) ou CSV (text/csv) com cabeçalho
+@despesa_bp.route("/destinos/<int:id_destino>/despesas/lote", methods=["POST"])
+@token_required
+def importar_despesas_lote(current_user, id_destino):
+    formato = FORMATOS.get(request.mimetype)
+    if not formato:
+        return jsonify({"message": "Formato não suportado. Use application/json, application/x-ndjson ou text/csv"}), 415
+
+    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
+    if not destino:
+        return jsonify({"message": "Destino não encontrado ou não pertence ao usuário"}), 404
+
+    resultado = importar_despesas(current_user.id, destino, ler_registros(request.stream, formato))
+    status = 400 if "erro_formato" in resultado and not resultado["inseridas"] else 200
+    return jsonify(resultado), status
+
 @despesa_bp.route("/destinos/<int:id_destino>/despesas", methods=["GET"])
 @token_required
 def get_despesas_por_destino(current_user, id_destino):
-    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id).first()
-    if not destino:
+    versao = versao_destino(current_user.id, id_destino)
+    if not versao:
         return jsonify({"message": "Destino não encontrado ou não pertence ao usuário"}), 404
+    etag = gerar_etag(current_user.id, "despesas", id_destino, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        cursor = decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+    except ValueError:
+        return jsonify({"message": "Parâmetros de paginação inválidos (limit/cursor)"}), 400
+
+    rows = db.session.execute(consulta_despesas_destino(id_destino, request.args, cursor, limit)).all()
+    return com_etag(jsonify(pagina_despesas(rows, limit)), etag), 200
+
+def consulta_despesas_destino(id_destino, args, cursor, limit):
+    # SELECT da listagem paginada (também executado pelas rotas assíncronas de asgi.py)
+    # Nomes de categoria e meio de pagamento vêm na mesma consulta (sem lazy load por linha)
+    query = db.select(*despesa_lista_encoder.colunas)\
+        .outerjoin(CategoriaDespesa, Despesa.categoria_id == CategoriaDespesa.id)\
+        .outerjoin(MeioPagamento, Despesa.meio_pagamento_id == MeioPagamento.id)\
+        .where(Despesa.destino_id == id_destino)
 
     # Filtros opcionais
-    query = Despesa.query.filter_by(destino_id=id_destino)
-    if request.args.get("data_inicio"):
-        query = query.filter(Despesa.data >= datetime.strptime(request.args.get("data_inicio"), "%Y-%m-%d").date())
-    if request.args.get("data_fim"):
-        query = query.filter(Despesa.data <= datetime.strptime(request.args.get("data_fim"), "%Y-%m-%d").date())
-    if request.args.get("categoria_id"):
-        query = query.filter(Despesa.categoria_id == int(request.args.get("categoria_id")))
-    if request.args.get("meio_pagamento_id"):
-        query = query.filter(Despesa.meio_pagamento_id == int(request.args.get("meio_pagamento_id")))
-    
-    despesas = query.order_by(Despesa.data.desc()).all()
+    if args.get("data_inicio"):
+        query = query.where(Despesa.data >= datetime.strptime(args.get("data_inicio"), "%Y-%m-%d").date())
+    if args.get("data_fim"):
+        query = query.where(Despesa.data <= datetime.strptime(args.get("data_fim"), "%Y-%m-%d").date())
+    if args.get("categoria_id"):
+        query = query.where(Despesa.categoria_id == int(args.get("categoria_id")))
+    if args.get("meio_pagamento_id"):
+        query = query.where(Despesa.meio_pagamento_id == int(args.get("meio_pagamento_id")))
+
+    # Keyset: continua estritamente depois da última linha (data, id) da página anterior
+    if cursor:
+        cursor_data, cursor_id = cursor
+        query = query.where(or_(
+            Despesa.data < cursor_data,
+            and_(Despesa.data == cursor_data, Despesa.id < cursor_id)
+        ))
+
+    # Busca uma linha a mais para saber se existe próxima página
+    return query.order_by(Despesa.data.desc(), Despesa.id.desc()).limit(limit + 1)
+
+def pagina_despesas(rows, limit):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    output = despesa_lista_encoder.linhas(rows)
+    next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None
+    return {"despesas": output, "next_cursor": next_cursor, "limit": limit}
+
+# Busca textual (descricao/observacoes) em todas as viagens do usuário, por relevância
+@despesa_bp.route("/despesas/search", methods=["GET"])
+@token_required
+def search_despesas(current_user):
+    termos = termos_busca(request.args.get("q"))
+    if not termos:
+        return jsonify({"message": "Parâmetro q é obrigatório"}), 400
+
+    etag = gerar_etag(current_user.id, "busca", versao_viagens(current_user.id), versao_listas(current_user.id))
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        filtro = FiltroRelatorio.from_args(request.args)
+        viagem_id = int(request.args["viagem_id"]) if request.args.get("viagem_id") else None
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        cursor = decode_rank_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+    except ValueError:
+        return jsonify({"message": "Parâmetros de paginação inválidos (limit/cursor)"}), 400
+
+    try:
+        query = consulta_busca(current_user.id, termos, filtro, despesa_busca_encoder.colunas, cursor, limit, viagem_id)
+    except BuscaNaoSuportada as e:
+        return jsonify({"message": str(e)}), 501
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    linha = despesa_busca_encoder.linha
     output = []
-    for despesa in despesas:
-        despesa_data = {
-            "id": despesa.id,
-            "descricao": despesa.descricao,
-            "valor": float(despesa.valor),
-            "data": despesa.data.isoformat(),
-            "observacoes": despesa.observacoes,
-            "categoria_id": despesa.categoria_id,
-            "categoria_nome": despesa.categoria.nome if despesa.categoria else None, # Adicionado nome da categoria
-            "meio_pagamento_id": despesa.meio_pagamento_id,
-            "meio_pagamento_nome": despesa.meio_pagamento.nome if despesa.meio_pagamento else None # Adicionado nome do meio de pagamento
-        }
-        output.append(despesa_data)
-    return jsonify(output), 200
+    for row in rows:
+        item = linha(row[1:])
+        item["relevancia"] = -row[0] / ESCALA_RANK
+        output.append(item)
+    next_cursor = encode_rank_cursor(rows[-1][0], rows[-1][1]) if has_more else None
+    return com_etag(jsonify({"despesas": output, "next_cursor": next_cursor, "limit": limit}), etag), 200
 
 @despesa_bp.route("/despesas/<int:id_despesa>", methods=["GET"])
 @token_required
 def get_despesa_by_id(current_user, id_despesa):
-    despesa = Despesa.query.join(Destino).join(Viagem).filter(Despesa.id == id_despesa, Viagem.usuario_id == current_user.id).first()
-    if not despesa:
+    versao = versao_despesa(current_user.id, id_despesa)
+    if not versao:
         return jsonify({"message": "Despesa não encontrada"}), 404
-    
-    despesa_data = {
-        "id": despesa.id,
-        "descricao": despesa.descricao,
-        "valor": float(despesa.valor),
-        "data": despesa.data.isoformat(),
-        "observacoes": despesa.observacoes,
-        "destino_id": despesa.destino_id,
-        "categoria_id": despesa.categoria_id,
-        "meio_pagamento_id": despesa.meio_pagamento_id
-    }
-    return jsonify(despesa_data), 200
+    etag = gerar_etag(current_user.id, "despesa", id_despesa, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    despesa_data = despesa_completa_encoder.linha(db.session.execute(
+        db.select(*despesa_completa_encoder.colunas).where(Despesa.id == id_despesa)
+    ).one())
+    return com_etag(jsonify(despesa_data), etag), 200
 
 @despesa_bp.route("/despesas/<int:id_despesa>", methods=["PUT"])
 @token_required
 def update_despesa(current_user, id_despesa):
     data = request.get_json()
-    despesa = Despesa.query.join(Destino).join(Viagem).filter(Despesa.id == id_despesa, Viagem.usuario_id == current_user.id).first()
+    despesa = Despesa.query.join(Destino).join(Viagem).filter(Despesa.id == id_despesa, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
 
     if not despesa:
         return jsonify({"message": "Despesa não encontrada"}), 404
 
     try:
+        # Retira do resumo a versão antiga; a nova é somada depois das alterações
+        viagem_id = despesa.destino.viagem_id
+        registrar_despesa(viagem_id, despesa, sinal=-1)
+
         if "descricao" in data: despesa.descricao = data["descricao"]
         if "valor" in data: despesa.valor = data["valor"]
+        if "moeda" in data:
+            try:
+                despesa.moeda = normalizar_moeda(data["moeda"])
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
         if "data" in data: despesa.data = datetime.strptime(data["data"], "%Y-%m-%d").date() if data["data"] else None
         if "observacoes" in data: despesa.observacoes = data["observacoes"]
+        listas = listas_cache.obter(current_user.id, versao_listas(current_user.id))
         if "categoria_id" in data:
             if data["categoria_id"] is None:
                 despesa.categoria_id = None
             else:
-                categoria = CategoriaDespesa.query.filter_by(id=data["categoria_id"], usuario_id=current_user.id).first()
-                if not categoria:
+                categoria_id = _id_da_lista(data["categoria_id"], listas.categorias)
+                if categoria_id is None:
                     return jsonify({"message": "Categoria inválida"}), 400
-                despesa.categoria_id = data["categoria_id"]
+                despesa.categoria_id = categoria_id
         if "meio_pagamento_id" in data:
             if data["meio_pagamento_id"] is None:
                 despesa.meio_pagamento_id = None
             else:
-                meio_pagamento = MeioPagamento.query.filter_by(id=data["meio_pagamento_id"], usuario_id=current_user.id).first()
-                if not meio_pagamento:
+                meio_pagamento_id = _id_da_lista(data["meio_pagamento_id"], listas.meios_pagamento)
+                if meio_pagamento_id is None:
                     return jsonify({"message": "Meio de pagamento inválido"}), 400
-                despesa.meio_pagamento_id = data["meio_pagamento_id"]
-        
+                despesa.meio_pagamento_id = meio_pagamento_id
+
+        registrar_despesa(viagem_id, despesa)
+        incrementar_versao_viagem(viagem_id, current_user.id)
         db.session.commit()
         return jsonify({"message": "Despesa atualizada com sucesso"}), 200
     except Exception as e:
@@ -159,11 +267,14 @@ def update_despesa(current_user, id_despesa):
 @despesa_bp.route("/despesas/<int:id_despesa>", methods=["DELETE"])
 @token_required
 def delete_despesa(current_user, id_despesa):
-    despesa = Despesa.query.join(Destino).join(Viagem).filter(Despesa.id == id_despesa, Viagem.usuario_id == current_user.id).first()
+    despesa = Despesa.query.join(Destino).join(Viagem).filter(Despesa.id == id_despesa, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
     if not despesa:
         return jsonify({"message": "Despesa não encontrada"}), 404
     
     try:
+        viagem_id = despesa.destino.viagem_id
+        registrar_despesa(viagem_id, despesa, sinal=-1)
+        incrementar_versao_viagem(viagem_id, current_user.id)
         db.session.delete(despesa)
         db.session.commit()
         return jsonify({"message": "Despesa deletada com sucesso"}), 200
@@ -171,3 +282,83 @@ def delete_despesa(current_user, id_despesa):
         db.session.rollback()
         return jsonify({"message": "Erro ao deletar despesa", "error": str(e)}), 500
 
+
+# --- Exportação (streaming) das despesas de uma viagem ---
+EXPORT_COLUNAS = ("id", "data", "descricao", "valor", "observacoes", "destino_id", "destino",
+                  "categoria_id", "categoria", "meio_pagamento_id", "meio_pagamento", "moeda")
+EXPORT_LOTE = 1000
+
+@despesa_bp.route("/viagens/<int:id_viagem>/despesas/export", methods=["GET"])
+@token_required
+def export_despesas_viagem(current_user, id_viagem):
+    formato = request.args.get("format", "csv")
+    if formato not in ("csv", "ndjson"):
+        return jsonify({"message": "Formato inválido. Use csv ou ndjson"}), 400
+
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
+        return jsonify({"message": "Viagem não encontrada"}), 404
+    etag = gerar_etag(current_user.id, "export", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        filtro = FiltroRelatorio.from_args(request.args)
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+
+    # Só colunas (sem objetos ORM), lidas do cursor do banco em lotes
+    query = db.select(
+            Despesa.id,
+            Despesa.data,
+            Despesa.descricao,
+            Despesa.valor,
+            Despesa.observacoes,
+            Despesa.destino_id,
+            Destino.nome_cidade,
+            Despesa.categoria_id,
+            CategoriaDespesa.nome,
+            Despesa.meio_pagamento_id,
+            MeioPagamento.nome,
+            Despesa.moeda
+        ).join(Destino, Despesa.destino_id == Destino.id)\
+        .outerjoin(CategoriaDespesa, Despesa.categoria_id == CategoriaDespesa.id)\
+        .outerjoin(MeioPagamento, Despesa.meio_pagamento_id == MeioPagamento.id)\
+        .where(Destino.viagem_id == id_viagem)
+    query = filtro.apply(query).order_by(Despesa.data, Despesa.id)\
+        .execution_options(stream_results=True, yield_per=EXPORT_LOTE)
+
+    def gerar_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUNAS)
+        for partition in db.session.execute(query).partitions():
+            for row in partition:
+                writer.writerow((row[0], row[1].isoformat(), row[2], row[3]) + tuple(row[4:]))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    def gerar_ndjson():
+        for partition in db.session.execute(query).partitions():
+            linhas = []
+            for row in partition:
+                item = dict(zip(EXPORT_COLUNAS, row))
+                item["data"] = row[1].isoformat()
+                item["valor"] = float(row[3])
+                linhas.append(dumps(item))
+            linhas.append("")
+            yield "\n".join(linhas)
+
+    if formato == "csv":
+        body, mimetype = gerar_csv(), "text/csv"
+    else:
+        body, mimetype = gerar_ndjson(), "application/x-ndjson"
+    nome_arquivo = f"viagem_{id_viagem}_despesas.{formato}"
+    return com_etag(Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={nome_arquivo}"}
+    ), etag)
@@ -7,7 +7,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 from flask import Blueprint, request, jsonify
 from main import token_required # Import from main
-from models.models import db, Viagem, Destino
+from models.models import db, Viagem, Destino, Despesa
+from services.alteracoes import registrar_filhos_removidos
+from services.versoes import incrementar_versao_viagem, versao_viagem, versao_destino
+from routes.viagem_routes import consulta_destinos_viagem
+from utils.etag import gerar_etag, nao_modificado, com_etag
+from utils.serializacao import destino_encoder, destino_completo_encoder, despesa_encoder
 from datetime import datetime
 
 destino_bp = Blueprint("destino_bp", __name__)
@@ -20,7 +25,7 @@ def create_destino(current_user, id_viagem):
     if not data or not data.get("nome_cidade"):
         return jsonify({"message": "Nome da cidade é obrigatório"}), 400
 
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
+    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id, removida_em=None).first()
     if not viagem:
         return jsonify({"message": "Viagem não encontrada"}), 404
 
@@ -33,15 +38,9 @@ def create_destino(current_user, id_viagem):
             viagem_id=id_viagem
         )
         db.session.add(novo_destino)
+        incrementar_versao_viagem(id_viagem, current_user.id)
         db.session.commit()
-        return jsonify({
-            "id": novo_destino.id,
-            "nome_cidade": novo_destino.nome_cidade,
-            "data_chegada": novo_destino.data_chegada.isoformat() if novo_destino.data_chegada else None,
-            "data_partida": novo_destino.data_partida.isoformat() if novo_destino.data_partida else None,
-            "orcamento_destino": float(novo_destino.orcamento_destino) if novo_destino.orcamento_destino else None,
-            "viagem_id": novo_destino.viagem_id
-        }), 201
+        return jsonify(destino_completo_encoder.objeto(novo_destino)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao criar destino", "error": str(e)}), 500
@@ -49,57 +48,43 @@ def create_destino(current_user, id_viagem):
 @destino_bp.route("/viagens/<int:id_viagem>/destinos", methods=["GET"])
 @token_required
 def get_destinos_por_viagem(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
-    if not viagem:
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
         return jsonify({"message": "Viagem não encontrada"}), 404
+    etag = gerar_etag(current_user.id, "destinos", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
 
-    destinos = Destino.query.filter_by(viagem_id=id_viagem).all()
-    output = []
-    for destino in destinos:
-        destino_data = {
-            "id": destino.id,
-            "nome_cidade": destino.nome_cidade,
-            "data_chegada": destino.data_chegada.isoformat() if destino.data_chegada else None,
-            "data_partida": destino.data_partida.isoformat() if destino.data_partida else None,
-            "orcamento_destino": float(destino.orcamento_destino) if destino.orcamento_destino else None
-        }
-        output.append(destino_data)
-    return jsonify(output), 200
+    rows = db.session.execute(consulta_destinos_viagem(id_viagem))
+    output = destino_encoder.linhas(rows)
+    return com_etag(jsonify(output), etag), 200
 
 @destino_bp.route("/destinos/<int:id_destino>", methods=["GET"])
 @token_required
 def get_destino_by_id(current_user, id_destino):
-    # Verificar se o destino pertence a uma viagem do usuário atual
-    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id).first()
-    if not destino:
+    # Verificar se o destino pertence a uma viagem do usuário atual (e ler a versão da viagem)
+    versao = versao_destino(current_user.id, id_destino)
+    if not versao:
         return jsonify({"message": "Destino não encontrado"}), 404
-    
-    destino_data = {
-        "id": destino.id,
-        "nome_cidade": destino.nome_cidade,
-        "data_chegada": destino.data_chegada.isoformat() if destino.data_chegada else None,
-        "data_partida": destino.data_partida.isoformat() if destino.data_partida else None,
-        "orcamento_destino": float(destino.orcamento_destino) if destino.orcamento_destino else None,
-        "viagem_id": destino.viagem_id,
-        "despesas": [
-            {
-                "id": d.id,
-                "descricao": d.descricao,
-                "valor": float(d.valor),
-                "data": d.data.isoformat(),
-                "observacoes": d.observacoes,
-                "categoria_id": d.categoria_id,
-                "meio_pagamento_id": d.meio_pagamento_id
-            } for d in destino.despesas
-        ]
-    }
-    return jsonify(destino_data), 200
+    etag = gerar_etag(current_user.id, "destino", id_destino, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    destino_data = destino_completo_encoder.linha(db.session.execute(
+        db.select(*destino_completo_encoder.colunas).where(Destino.id == id_destino)
+    ).one())
+    destino_data["despesas"] = despesa_encoder.linhas(db.session.execute(
+        db.select(*despesa_encoder.colunas).where(Despesa.destino_id == id_destino).order_by(Despesa.data, Despesa.id)
+    ))
+    return com_etag(jsonify(destino_data), etag), 200
 
 @destino_bp.route("/destinos/<int:id_destino>", methods=["PUT"])
 @token_required
 def update_destino(current_user, id_destino):
     data = request.get_json()
-    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id).first()
+    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
 
     if not destino:
         return jsonify({"message": "Destino não encontrado"}), 404
@@ -109,7 +94,8 @@ def update_destino(current_user, id_destino):
         if "data_chegada" in data: destino.data_chegada = datetime.strptime(data["data_chegada"], "%Y-%m-%d").date() if data["data_chegada"] else None
         if "data_partida" in data: destino.data_partida = datetime.strptime(data["data_partida"], "%Y-%m-%d").date() if data["data_partida"] else None
         if "orcamento_destino" in data: destino.orcamento_destino = data["orcamento_destino"]
-        
+
+        incrementar_versao_viagem(destino.viagem_id, current_user.id)
         db.session.commit()
         return jsonify({"message": "Destino atualizado com sucesso"}), 200
     except Exception as e:
@@ -119,11 +105,14 @@ def update_destino(current_user, id_destino):
 @destino_bp.route("/destinos/<int:id_destino>", methods=["DELETE"])
 @token_required
 def delete_destino(current_user, id_destino):
-    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id).first()
+    destino = Destino.query.join(Viagem).filter(Destino.id == id_destino, Viagem.usuario_id == current_user.id, Viagem.removida_em.is_(None)).first()
     if not destino:
         return jsonify({"message": "Destino não encontrado"}), 404
     
     try:
+        incrementar_versao_viagem(destino.viagem_id, current_user.id)
+        # Despesas e resumos do destino saem pelo ON DELETE CASCADE
+        registrar_filhos_removidos(current_user.id, destino_id=destino.id)
         db.session.delete(destino)
         db.session.commit()
         return jsonify({"message": "Destino deletado com sucesso"}), 200
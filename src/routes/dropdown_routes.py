@@ -7,10 +7,46 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 from flask import Blueprint, request, jsonify
 from main import token_required # Import from main
-from models.models import db, CategoriaDespesa, MeioPagamento
+from sqlalchemy import exists
+from models.models import db, CategoriaDespesa, MeioPagamento, Destino, Despesa
+from services.alteracoes import registrar_despesas_alteradas
+from services.resumo_despesas import reconstruir_resumos
+from services.versoes import incrementar_versao_listas, incrementar_versao_viagem, versao_listas
+from services.listas_cache import listas_cache
+from utils.etag import gerar_etag, nao_modificado, com_etag
+from utils.serializacao import categoria_encoder, meio_pagamento_encoder
 
 dropdown_bp = Blueprint("dropdown_bp", __name__)
 
+# --- Uso e mesclagem (compartilhados por categorias e meios de pagamento) ---
+def consulta_em_uso(coluna, id_registro):
+    # EXISTS pelo índice da coluna em Despesa, sem carregar as despesas
+    return db.select(exists().where(coluna == id_registro))
+
+def _em_uso(coluna, id_registro):
+    return db.session.scalar(consulta_em_uso(coluna, id_registro))
+
+def _mesclar(usuario_id, origem, coluna, id_alvo):
+    # Reatribui as despesas de origem para id_alvo com um único UPDATE e apaga a
+    # origem. Os resumos usam a categoria/meio de pagamento na chave: os das
+    # viagens afetadas são reconstruídos. Devolve o número de despesas alteradas
+    viagens = db.session.scalars(
+        db.select(Destino.viagem_id).join(Despesa, Despesa.destino_id == Destino.id)
+        .where(coluna == origem.id).distinct()
+    ).all()
+    registrar_despesas_alteradas(usuario_id, coluna == origem.id)
+    atualizadas = db.session.execute(
+        db.update(Despesa).where(coluna == origem.id).values({coluna.key: id_alvo})
+    ).rowcount
+    db.session.delete(origem)
+    for viagem_id in viagens:
+        reconstruir_resumos(viagem_id)
+        incrementar_versao_viagem(viagem_id, usuario_id)
+    incrementar_versao_listas(usuario_id)
+    db.session.commit()
+    listas_cache.invalidar(usuario_id)
+    return atualizadas
+
 # --- Categorias de Despesa Endpoints ---
 @dropdown_bp.route("/categorias", methods=["POST"])
 @token_required
@@ -30,8 +66,10 @@ def create_categoria(current_user):
             usuario_id=current_user.id
         )
         db.session.add(nova_categoria)
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
-        return jsonify({"id": nova_categoria.id, "nome": nova_categoria.nome}), 201
+        listas_cache.invalidar(current_user.id)
+        return jsonify(categoria_encoder.objeto(nova_categoria)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao criar categoria", "error": str(e)}), 500
@@ -39,12 +77,15 @@ def create_categoria(current_user):
 @dropdown_bp.route("/categorias", methods=["GET"])
 @token_required
 def get_categorias(current_user):
-    categorias = CategoriaDespesa.query.filter_by(usuario_id=current_user.id).order_by(CategoriaDespesa.nome).all()
-    output = []
-    for categoria in categorias:
-        categoria_data = {"id": categoria.id, "nome": categoria.nome}
-        output.append(categoria_data)
-    return jsonify(output), 200
+    versao = versao_listas(current_user.id)
+    etag = gerar_etag(current_user.id, "categorias", versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    # Lista já ordenada por nome, do cache do usuário
+    output = listas_cache.obter(current_user.id, versao).categorias_json
+    return com_etag(jsonify(output), etag), 200
 
 @dropdown_bp.route("/categorias/<int:id_categoria>", methods=["PUT"])
 @token_required
@@ -67,7 +108,9 @@ def update_categoria(current_user, id_categoria):
 
     try:
         categoria.nome = novo_nome
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
+        listas_cache.invalidar(current_user.id)
         return jsonify({"id": categoria.id, "nome": categoria.nome, "message": "Categoria atualizada com sucesso"}), 200
     except Exception as e:
         db.session.rollback()
@@ -81,17 +124,39 @@ def delete_categoria(current_user, id_categoria):
         return jsonify({"message": "Categoria não encontrada"}), 404
     
     # Verificar se a categoria está em uso por alguma despesa
-    if categoria.despesas:
+    if _em_uso(Despesa.categoria_id, categoria.id):
         return jsonify({"message": "Categoria não pode ser deletada pois está em uso por despesas."}), 400
 
     try:
         db.session.delete(categoria)
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
+        listas_cache.invalidar(current_user.id)
         return jsonify({"message": "Categoria deletada com sucesso"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao deletar categoria", "error": str(e)}), 500
 
+@dropdown_bp.route("/categorias/<int:id_categoria>/merge_into/<int:id_alvo>", methods=["POST"])
+@token_required
+def merge_categoria(current_user, id_categoria, id_alvo):
+    if id_categoria == id_alvo:
+        return jsonify({"message": "Uma categoria não pode ser mesclada nela mesma"}), 400
+    categoria = CategoriaDespesa.query.filter_by(id=id_categoria, usuario_id=current_user.id).first()
+    alvo = CategoriaDespesa.query.filter_by(id=id_alvo, usuario_id=current_user.id).first()
+    if not categoria or not alvo:
+        return jsonify({"message": "Categoria não encontrada"}), 404
+
+    try:
+        atualizadas = _mesclar(current_user.id, categoria, Despesa.categoria_id, alvo.id)
+        return jsonify({
+            "id": alvo.id, "nome": alvo.nome, "despesas_atualizadas": atualizadas,
+            "message": "Categoria mesclada com sucesso"
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Erro ao mesclar categoria", "error": str(e)}), 500
+
 # --- Meios de Pagamento Endpoints ---
 @dropdown_bp.route("/meios_pagamento", methods=["POST"])
 @token_required
@@ -110,8 +175,10 @@ def create_meio_pagamento(current_user):
             usuario_id=current_user.id
         )
         db.session.add(novo_meio_pagamento)
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
-        return jsonify({"id": novo_meio_pagamento.id, "nome": novo_meio_pagamento.nome}), 201
+        listas_cache.invalidar(current_user.id)
+        return jsonify(meio_pagamento_encoder.objeto(novo_meio_pagamento)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao criar meio de pagamento", "error": str(e)}), 500
@@ -119,12 +186,14 @@ def create_meio_pagamento(current_user):
 @dropdown_bp.route("/meios_pagamento", methods=["GET"])
 @token_required
 def get_meios_pagamento(current_user):
-    meios_pagamento = MeioPagamento.query.filter_by(usuario_id=current_user.id).order_by(MeioPagamento.nome).all()
-    output = []
-    for mp in meios_pagamento:
-        mp_data = {"id": mp.id, "nome": mp.nome}
-        output.append(mp_data)
-    return jsonify(output), 200
+    versao = versao_listas(current_user.id)
+    etag = gerar_etag(current_user.id, "meios_pagamento", versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    output = listas_cache.obter(current_user.id, versao).meios_pagamento_json
+    return com_etag(jsonify(output), etag), 200
 
 @dropdown_bp.route("/meios_pagamento/<int:id_meio_pagamento>", methods=["PUT"])
 @token_required
@@ -146,7 +215,9 @@ def update_meio_pagamento(current_user, id_meio_pagamento):
 
     try:
         meio_pagamento.nome = novo_nome
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
+        listas_cache.invalidar(current_user.id)
         return jsonify({"id": meio_pagamento.id, "nome": meio_pagamento.nome, "message": "Meio de pagamento atualizado com sucesso"}), 200
     except Exception as e:
         db.session.rollback()
@@ -159,14 +230,36 @@ def delete_meio_pagamento(current_user, id_meio_pagamento):
     if not meio_pagamento:
         return jsonify({"message": "Meio de pagamento não encontrado"}), 404
 
-    if meio_pagamento.despesas:
+    if _em_uso(Despesa.meio_pagamento_id, meio_pagamento.id):
         return jsonify({"message": "Meio de pagamento não pode ser deletado pois está em uso por despesas."}), 400
 
     try:
         db.session.delete(meio_pagamento)
+        incrementar_versao_listas(current_user.id)
         db.session.commit()
+        listas_cache.invalidar(current_user.id)
         return jsonify({"message": "Meio de pagamento deletado com sucesso"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao deletar meio de pagamento", "error": str(e)}), 500
 
+@dropdown_bp.route("/meios_pagamento/<int:id_meio_pagamento>/merge_into/<int:id_alvo>", methods=["POST"])
+@token_required
+def merge_meio_pagamento(current_user, id_meio_pagamento, id_alvo):
+    if id_meio_pagamento == id_alvo:
+        return jsonify({"message": "Um meio de pagamento não pode ser mesclado nele mesmo"}), 400
+    meio_pagamento = MeioPagamento.query.filter_by(id=id_meio_pagamento, usuario_id=current_user.id).first()
+    alvo = MeioPagamento.query.filter_by(id=id_alvo, usuario_id=current_user.id).first()
+    if not meio_pagamento or not alvo:
+        return jsonify({"message": "Meio de pagamento não encontrado"}), 404
+
+    try:
+        atualizadas = _mesclar(current_user.id, meio_pagamento, Despesa.meio_pagamento_id, alvo.id)
+        return jsonify({
+            "id": alvo.id, "nome": alvo.nome, "despesas_atualizadas": atualizadas,
+            "message": "Meio de pagamento mesclado com sucesso"
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Erro ao mesclar meio de pagamento", "error": str(e)}), 500
+
@@ -5,129 +5,186 @@ import os
 # Adiciona o diretório src ao sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from flask import Blueprint, request, jsonify
-from sqlalchemy import func, extract
+from flask import Blueprint, request, jsonify, current_app
 from main import token_required # Import from main
-from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa
+from models.models import db, Viagem, MOEDA_PADRAO
+from services.relatorio_engine import FiltroRelatorio, gerar_relatorio, SEM_CATEGORIA, SEM_MEIO_PAGAMENTO
+from services.cambio import TaxaIndisponivel, normalizar_moeda, cambio_cache
+from services.analise_despesas import snapshot_cache, PERIODOS
+from services.versoes import versao_viagem, versao_viagens_cambio, versao_listas
+from services.cache_relatorios import cache_relatorios, chave_relatorio
+from utils.etag import gerar_etag, nao_modificado, com_etag
+from utils.serializacao import dumps
 from datetime import datetime
 
 relatorio_bp = Blueprint("relatorio_bp", __name__)
 
-# --- Relatórios e Gráficos Endpoints ---
-@relatorio_bp.route("/viagens/<int:id_viagem>/relatorio/geral", methods=["GET"])
-@token_required
-def get_relatorio_geral(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
-    if not viagem:
-        return jsonify({"message": "Viagem não encontrada"}), 404
+def moeda_base_viagem(id_viagem):
+    return db.session.scalar(db.select(Viagem.moeda_base).where(Viagem.id == id_viagem))
 
-    query_despesas = Despesa.query.join(Destino).filter(Destino.viagem_id == id_viagem)
-
-    # Filtros opcionais
-    data_inicio_str = request.args.get("data_inicio")
-    data_fim_str = request.args.get("data_fim")
-    id_destino_str = request.args.get("id_destino")
-    meio_pagamento_id_str = request.args.get("meio_pagamento_id")
-    categoria_id_str = request.args.get("categoria_id")
-
-    if data_inicio_str:
-        query_despesas = query_despesas.filter(Despesa.data >= datetime.strptime(data_inicio_str, "%Y-%m-%d").date())
-    if data_fim_str:
-        query_despesas = query_despesas.filter(Despesa.data <= datetime.strptime(data_fim_str, "%Y-%m-%d").date())
-    if id_destino_str:
-        query_despesas = query_despesas.filter(Despesa.destino_id == int(id_destino_str))
-    if meio_pagamento_id_str:
-        query_despesas = query_despesas.filter(Despesa.meio_pagamento_id == int(meio_pagamento_id_str))
-    if categoria_id_str:
-        query_despesas = query_despesas.filter(Despesa.categoria_id == int(categoria_id_str))
-
-    total_gasto = query_despesas.with_entities(func.sum(Despesa.valor)).scalar() or 0
-    
-    despesas_por_categoria = query_despesas.join(CategoriaDespesa)\
-        .group_by(CategoriaDespesa.nome)\
-        .with_entities(CategoriaDespesa.nome, func.sum(Despesa.valor).label("total"))\
-        .all()
-    
-    despesas_por_destino_q = db.session.query(
-            Destino.nome_cidade, 
-            func.sum(Despesa.valor).label("total_gasto_destino")
-        ).join(Despesa, Despesa.destino_id == Destino.id)\
-        .filter(Destino.viagem_id == id_viagem)
-    
-    if data_inicio_str: despesas_por_destino_q = despesas_por_destino_q.filter(Despesa.data >= datetime.strptime(data_inicio_str, "%Y-%m-%d").date())
-    if data_fim_str: despesas_por_destino_q = despesas_por_destino_q.filter(Despesa.data <= datetime.strptime(data_fim_str, "%Y-%m-%d").date())
-    if id_destino_str: despesas_por_destino_q = despesas_por_destino_q.filter(Destino.id == int(id_destino_str))
-    if meio_pagamento_id_str: despesas_por_destino_q = despesas_por_destino_q.filter(Despesa.meio_pagamento_id == int(meio_pagamento_id_str))
-    if categoria_id_str: despesas_por_destino_q = despesas_por_destino_q.filter(Despesa.categoria_id == int(categoria_id_str))
-    
-    despesas_por_destino = despesas_por_destino_q.group_by(Destino.nome_cidade).all()
-
-    relatorio = {
-        "viagem_id": id_viagem,
+# --- Montagem das respostas (compartilhada com as rotas assíncronas de asgi.py) ---
+def relatorio_geral_json(viagem, resultado, filtro):
+    # viagem: objeto ou linha com id, nome_viagem, orcamento_total e moeda_base
+    total_gasto = resultado.total
+    return {
+        "viagem_id": viagem.id,
         "nome_viagem": viagem.nome_viagem,
+        "moeda": viagem.moeda_base,
         "orcamento_total_viagem": float(viagem.orcamento_total) if viagem.orcamento_total else None,
         "total_gasto_geral": float(total_gasto),
         "saldo_geral": (float(viagem.orcamento_total) - float(total_gasto)) if viagem.orcamento_total else None,
-        "despesas_por_categoria": [{ "categoria": cat, "total": float(tot) } for cat, tot in despesas_por_categoria],
-        "despesas_por_destino": [{ "destino": dest, "total": float(tot) } for dest, tot in despesas_por_destino],
-        "filtros_aplicados": {
-            "data_inicio": data_inicio_str,
-            "data_fim": data_fim_str,
-            "id_destino": id_destino_str,
-            "meio_pagamento_id": meio_pagamento_id_str,
-            "categoria_id": categoria_id_str
-        }
+        "despesas_por_categoria": [
+            { "categoria_id": cat_id, "categoria": cat or SEM_CATEGORIA, "total": float(tot) }
+            for (cat_id, cat), tot in resultado.por("categoria")
+        ],
+        "despesas_por_destino": [
+            { "destino_id": dest_id, "destino": dest, "total": float(tot) }
+            for (dest_id, dest), tot in resultado.por("destino")
+        ],
+        "despesas_por_meio_pagamento": [
+            { "meio_pagamento_id": mp_id, "meio_pagamento": mp or SEM_MEIO_PAGAMENTO, "total": float(tot) }
+            for (mp_id, mp), tot in resultado.por("meio_pagamento")
+        ],
+        "filtros_aplicados": filtro.as_dict()
     }
-    return jsonify(relatorio), 200
+
+def grafico_categoria_json(resultado):
+    return [{ "name": cat or SEM_CATEGORIA, "value": float(tot) } for (cat_id, cat), tot in resultado.por("categoria")]
+
+def grafico_dia_json(resultado):
+    return [{ "date": data.isoformat(), "value": float(total) } for data, total in resultado.por("dia")]
+
+# --- Cache das respostas (services/cache_relatorios.py) ---
+def resposta_em_cache(tipo, usuario_id, id_viagem, filtro, versao, montar):
+    # Corpo JSON (bytes) do cache ou de montar(), que devolve o objeto a serializar.
+    # Num lote atômico a versão lida pode nunca ser confirmada: não usa o cache
+    if db.session.info.get("lote_atomico"):
+        return dumps(montar()).encode("utf-8")
+    chave = chave_relatorio(tipo, usuario_id, id_viagem, filtro, versao)
+    corpo = cache_relatorios.obter(chave)
+    if corpo is None:
+        corpo = dumps(montar()).encode("utf-8")
+        cache_relatorios.guardar(chave, id_viagem, corpo)
+    return corpo
+
+def resposta_json(corpo, etag):
+    return com_etag(current_app.response_class(corpo, mimetype="application/json"), etag)
+
+# --- Relatórios e Gráficos Endpoints ---
+@relatorio_bp.route("/viagens/<int:id_viagem>/relatorio/geral", methods=["GET"])
+@token_required
+def get_relatorio_geral(current_user, id_viagem):
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
+        return jsonify({"message": "Viagem não encontrada"}), 404
+    etag = gerar_etag(current_user.id, "relatorio", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        filtro = FiltroRelatorio.from_args(request.args)
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+    # versao = (viagem, listas, câmbio): as séries de cotação seguem a versão do câmbio
+    cambio_cache.sincronizar(versao[2])
+
+    def montar():
+        # Total e todas as quebras saem de uma única consulta agregada, já na moeda da viagem
+        viagem = db.session.get(Viagem, id_viagem)
+        resultado = gerar_relatorio(id_viagem, filtro, ("destino", "categoria", "meio_pagamento"), viagem.moeda_base)
+        dados = relatorio_geral_json(viagem, resultado, filtro)
+        # A chave usa o filtro normalizado: o cache guarda o relatório sem os filtros
+        del dados["filtros_aplicados"]
+        return dados
+
+    try:
+        corpo = resposta_em_cache("geral", current_user.id, id_viagem, filtro, versao, montar)
+    except TaxaIndisponivel as e:
+        return jsonify({"message": str(e)}), 422
+    # Os filtros como o cliente os enviou entram como último campo, direto nos bytes
+    filtros = b',"filtros_aplicados":' + dumps(filtro.as_dict()).encode("utf-8")
+    return resposta_json(corpo[:-1] + filtros + b"}", etag), 200
 
 @relatorio_bp.route("/viagens/<int:id_viagem>/grafico/despesas_por_categoria", methods=["GET"])
 @token_required
 def get_grafico_despesas_por_categoria(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
-    if not viagem:
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
         return jsonify({"message": "Viagem não encontrada"}), 404
-
-    query_despesas = Despesa.query.join(Destino).filter(Destino.viagem_id == id_viagem)
-    
-    data_inicio_str = request.args.get("data_inicio")
-    data_fim_str = request.args.get("data_fim")
-    id_destino_str = request.args.get("id_destino")
-
-    if data_inicio_str: query_despesas = query_despesas.filter(Despesa.data >= datetime.strptime(data_inicio_str, "%Y-%m-%d").date())
-    if data_fim_str: query_despesas = query_despesas.filter(Despesa.data <= datetime.strptime(data_fim_str, "%Y-%m-%d").date())
-    if id_destino_str: query_despesas = query_despesas.filter(Despesa.destino_id == int(id_destino_str))
-
-    resultado = query_despesas.join(CategoriaDespesa)\
-        .group_by(CategoriaDespesa.nome)\
-        .with_entities(CategoriaDespesa.nome, func.sum(Despesa.valor).label("total"))\
-        .order_by(func.sum(Despesa.valor).desc())\
-        .all()
-    
-    dados_grafico = [{ "name": cat, "value": float(tot) } for cat, tot in resultado]
-    return jsonify(dados_grafico), 200
+    etag = gerar_etag(current_user.id, "grafico", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        filtro = FiltroRelatorio.from_args(request.args)
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+    # versao = (viagem, listas, câmbio): as séries de cotação seguem a versão do câmbio
+    cambio_cache.sincronizar(versao[2])
+
+    try:
+        corpo = resposta_em_cache("categoria", current_user.id, id_viagem, filtro, versao, lambda: grafico_categoria_json(
+            gerar_relatorio(id_viagem, filtro, ("categoria",), moeda_base_viagem(id_viagem))))
+    except TaxaIndisponivel as e:
+        return jsonify({"message": str(e)}), 422
+    return resposta_json(corpo, etag), 200
 
 @relatorio_bp.route("/viagens/<int:id_viagem>/grafico/despesas_por_dia", methods=["GET"])
 @token_required
 def get_grafico_despesas_por_dia(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
-    if not viagem:
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
         return jsonify({"message": "Viagem não encontrada"}), 404
-
-    query_despesas = Despesa.query.join(Destino).filter(Destino.viagem_id == id_viagem)
-
-    data_inicio_str = request.args.get("data_inicio")
-    data_fim_str = request.args.get("data_fim")
-    id_destino_str = request.args.get("id_destino")
-
-    if data_inicio_str: query_despesas = query_despesas.filter(Despesa.data >= datetime.strptime(data_inicio_str, "%Y-%m-%d").date())
-    if data_fim_str: query_despesas = query_despesas.filter(Despesa.data <= datetime.strptime(data_fim_str, "%Y-%m-%d").date())
-    if id_destino_str: query_despesas = query_despesas.filter(Despesa.destino_id == int(id_destino_str))
-    
-    resultado = query_despesas.group_by(Despesa.data)\
-        .with_entities(Despesa.data, func.sum(Despesa.valor).label("total"))\
-        .order_by(Despesa.data.asc())\
-        .all()
-
-    dados_grafico = [{ "date": data.isoformat(), "value": float(total) } for data, total in resultado]
-    return jsonify(dados_grafico), 200
-
+    etag = gerar_etag(current_user.id, "grafico", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    try:
+        filtro = FiltroRelatorio.from_args(request.args)
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+    # versao = (viagem, listas, câmbio): as séries de cotação seguem a versão do câmbio
+    cambio_cache.sincronizar(versao[2])
+
+    try:
+        corpo = resposta_em_cache("dia", current_user.id, id_viagem, filtro, versao, lambda: grafico_dia_json(
+            gerar_relatorio(id_viagem, filtro, ("dia",), moeda_base_viagem(id_viagem))))
+    except TaxaIndisponivel as e:
+        return jsonify({"message": str(e)}), 422
+    return resposta_json(corpo, etag), 200
+
+# --- Análise de todas as viagens do usuário (snapshot colunar em memória) ---
+@relatorio_bp.route("/analytics", methods=["GET"])
+@token_required
+def get_analytics(current_user):
+    # (viagens, câmbio, listas): uma carga de cotações muda os totais convertidos
+    versao = (*versao_viagens_cambio(current_user.id), versao_listas(current_user.id))
+    etag = gerar_etag(current_user.id, "analytics", *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    periodo = request.args.get("periodo", "mes")
+    if periodo not in PERIODOS:
+        return jsonify({"message": f"periodo inválido. Valores aceitos: {', '.join(PERIODOS)}"}), 400
+    try:
+        data_inicio = datetime.strptime(request.args["data_inicio"], "%Y-%m-%d").date() if request.args.get("data_inicio") else None
+        data_fim = datetime.strptime(request.args["data_fim"], "%Y-%m-%d").date() if request.args.get("data_fim") else None
+        moeda = normalizar_moeda(request.args["moeda"]) if request.args.get("moeda") else None
+    except ValueError:
+        return jsonify({"message": "Filtros inválidos"}), 400
+
+    cambio_cache.sincronizar(versao[1])
+    snapshot = snapshot_cache.obter(current_user.id, versao)
+    # Sem moeda pedida: a moeda base comum das viagens, ou a padrão se houver mais de uma
+    if not moeda:
+        moeda = snapshot.moedas_base[0] if len(snapshot.moedas_base) == 1 else MOEDA_PADRAO
+    try:
+        analise = snapshot.agregar(moeda, periodo, data_inicio, data_fim)
+    except TaxaIndisponivel as e:
+        return jsonify({"message": str(e)}), 422
+    analise["filtros_aplicados"] = {"data_inicio": request.args.get("data_inicio"), "data_fim": request.args.get("data_fim")}
+    return com_etag(jsonify(analise), etag), 200
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Sincronização incremental para clientes offline.
+#
+# GET /api/sync sem "since" devolve todos os dados do usuário e o cursor atual;
+# GET /api/sync?since=<cursor> devolve só o que mudou depois dele, lido do log
+# de alterações (services/alteracoes.py): o custo depende do volume de
+# mudanças, não do tamanho dos dados. O cliente aplica viagens, destinos e
+# despesas nessa ordem, depois os "removidos", e repete enquanto has_more.
+import sys
+import os
+
+# Adiciona o diretório src ao sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Blueprint, request, jsonify
+from main import token_required # Import from main
+from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+from services.alteracoes import TABELAS, alteracoes_desde, ultimo_cursor
+from utils.pagination import parse_limit
+from utils.serializacao import (
+    viagem_encoder, destino_completo_encoder, despesa_completa_encoder, categoria_encoder, meio_pagamento_encoder
+)
+
+sync_bp = Blueprint("sync_bp", __name__)
+
+# Modelo -> encoder de cada tabela sincronizada (destinos e despesas levam o id do pai)
+ENCODERS = {
+    Viagem: viagem_encoder,
+    Destino: destino_completo_encoder,
+    Despesa: despesa_completa_encoder,
+    CategoriaDespesa: categoria_encoder,
+    MeioPagamento: meio_pagamento_encoder,
+}
+
+def _consulta_usuario(modelo, usuario_id):
+    query = db.select(*ENCODERS[modelo].colunas)
+    if modelo is Destino:
+        query = query.join(Viagem, Destino.viagem_id == Viagem.id)\
+            .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+    elif modelo is Despesa:
+        query = query.join(Destino, Despesa.destino_id == Destino.id)\
+            .join(Viagem, Destino.viagem_id == Viagem.id)\
+            .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+    elif modelo is Viagem:
+        query = query.where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+    else:
+        query = query.where(modelo.usuario_id == usuario_id)
+    return query.order_by(modelo.id)
+
+@sync_bp.route("/sync", methods=["GET"])
+@token_required
+def get_sync(current_user):
+    try:
+        since = request.args.get("since")
+        cursor = int(since) if since else None
+        if cursor is not None and cursor < 0:
+            raise ValueError("since negativo")
+        limit = parse_limit(request.args.get("limit"))
+    except ValueError:
+        return jsonify({"message": "Parâmetros de sincronização inválidos (since/limit)"}), 400
+
+    resposta = {}
+    if cursor is None:
+        # Carga completa: o cursor é lido antes dos dados, então uma escrita
+        # concorrente no meio volta na próxima sincronização em vez de se perder
+        resposta["cursor"] = ultimo_cursor(current_user.id)
+        resposta["has_more"] = False
+        resposta["completo"] = True
+        for modelo, encoder in ENCODERS.items():
+            resposta[TABELAS[modelo]] = encoder.linhas(db.session.execute(_consulta_usuario(modelo, current_user.id)))
+        resposta["removidos"] = {tabela: [] for tabela in TABELAS.values()}
+        return jsonify(resposta), 200
+
+    alterados, removidos, novo_cursor, has_more = alteracoes_desde(current_user.id, cursor, limit)
+    resposta["cursor"] = novo_cursor
+    resposta["has_more"] = has_more
+    resposta["completo"] = False
+    for modelo, encoder in ENCODERS.items():
+        ids = alterados[TABELAS[modelo]]
+        # Estado atual de cada registro alterado; os removidos depois da página
+        # não aparecem aqui e chegam como tombstone nas próximas. O filtro de dono
+        # vale aqui também: um id do log pode ter sido reaproveitado por outro usuário
+        resposta[TABELAS[modelo]] = encoder.linhas(db.session.execute(
+            _consulta_usuario(modelo, current_user.id).where(modelo.id.in_(ids))
+        )) if ids else []
+    resposta["removidos"] = removidos
+    return jsonify(resposta), 200
@@ -5,13 +5,71 @@ import os
 # Adiciona o diretório src ao sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from main import token_required # Import from main
-from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+from models.models import db, Viagem, Destino, Despesa
+from services.alteracoes import registrar_filhos_removidos, registrar_viagem_removida
+from services.remocao_viagens import purga_viagens
+from services.cache_relatorios import cache_relatorios
+from services.cambio import normalizar_moeda, TaxaIndisponivel, cambio_cache
+from services.listas_cache import consulta_categorias, consulta_meios_pagamento
+from services.relatorio_engine import consulta_gastos_viagens, gastos_por_destino
+from services.versoes import incrementar_versao_viagem, incrementar_versao_viagens, versao_viagem, versao_viagens_cambio
+from utils.etag import gerar_etag, nao_modificado, com_etag
+from utils.serializacao import viagem_encoder, destino_encoder, despesa_encoder, categoria_encoder, meio_pagamento_encoder
 from datetime import datetime
+from decimal import Decimal
 
 viagem_bp = Blueprint("viagem_bp", __name__)
 
+EXPAND_VALIDOS = {"destinos", "despesas", "categorias", "meios_pagamento"}
+WITH_VALIDOS = {"summary"}
+
+# --- Lista com resumo de gastos (compartilhada com a rota assíncrona de asgi.py) ---
+def consulta_viagens_usuario(usuario_id):
+    return db.select(*viagem_encoder.colunas)\
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None)).order_by(Viagem.id)
+
+def consulta_destinos_viagem(id_viagem):
+    return db.select(*destino_encoder.colunas).where(Destino.viagem_id == id_viagem).order_by(Destino.id)
+
+def consulta_destinos_usuario(usuario_id):
+    return db.select(Destino.viagem_id, *destino_encoder.colunas)\
+        .join(Viagem, Destino.viagem_id == Viagem.id)\
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None)).order_by(Destino.id)
+
+def moedas_base_viagens(viagens):
+    # viagens: linhas de viagem_encoder
+    return {v.id: v.moeda_base for v in viagens}
+
+def viagens_com_resumo_json(viagens, destinos, gastos):
+    # viagens: linhas de viagem_encoder; destinos: (viagem_id, *destino_encoder);
+    # gastos: {destino_id: total na moeda base} de gastos_por_destino
+    output = viagem_encoder.linhas(viagens)
+    destinos_por_viagem = {v["id"]: [] for v in output}
+    for row in destinos:
+        destino = destino_encoder.linha(row[1:])
+        gasto = gastos.get(destino["id"], Decimal(0))
+        orcamento = destino["orcamento_destino"]
+        destinos_por_viagem[row[0]].append({
+            "destino_id": destino["id"],
+            "nome_cidade": destino["nome_cidade"],
+            "orcamento_destino": orcamento,
+            "total_gasto": float(gasto),
+            "saldo": (orcamento - float(gasto)) if orcamento else None
+        })
+    for viagem_data in output:
+        resumo_destinos = destinos_por_viagem[viagem_data["id"]]
+        total_gasto = sum(d["total_gasto"] for d in resumo_destinos)
+        orcamento = viagem_data["orcamento_total"]
+        viagem_data["resumo"] = {
+            "moeda": viagem_data["moeda_base"],
+            "total_gasto": total_gasto,
+            "saldo": (orcamento - total_gasto) if orcamento else None,
+            "destinos": resumo_destinos
+        }
+    return output
+
 # --- Viagens Endpoints ---
 @viagem_bp.route("/viagens", methods=["POST"])
 @token_required
@@ -19,6 +77,10 @@ def create_viagem(current_user):
     data = request.get_json()
     if not data or not data.get("nome_viagem"):
         return jsonify({"message": "Nome da viagem é obrigatório"}), 400
+    try:
+        moeda_base = normalizar_moeda(data["moeda_base"]) if data.get("moeda_base") else None
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
     try:
         nova_viagem = Viagem(
@@ -26,17 +88,13 @@ def create_viagem(current_user):
             data_inicio=datetime.strptime(data["data_inicio"], "%Y-%m-%d").date() if data.get("data_inicio") else None,
             data_fim=datetime.strptime(data["data_fim"], "%Y-%m-%d").date() if data.get("data_fim") else None,
             orcamento_total=data.get("orcamento_total"),
+            moeda_base=moeda_base,
             usuario_id=current_user.id
         )
         db.session.add(nova_viagem)
+        incrementar_versao_viagens(current_user.id)
         db.session.commit()
-        return jsonify({
-            "id": nova_viagem.id,
-            "nome_viagem": nova_viagem.nome_viagem,
-            "data_inicio": nova_viagem.data_inicio.isoformat() if nova_viagem.data_inicio else None,
-            "data_fim": nova_viagem.data_fim.isoformat() if nova_viagem.data_fim else None,
-            "orcamento_total": float(nova_viagem.orcamento_total) if nova_viagem.orcamento_total else None
-        }), 201
+        return jsonify(viagem_encoder.objeto(nova_viagem)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Erro ao criar viagem", "error": str(e)}), 500
@@ -44,49 +102,80 @@ def create_viagem(current_user):
 @viagem_bp.route("/viagens", methods=["GET"])
 @token_required
 def get_viagens(current_user):
-    viagens = Viagem.query.filter_by(usuario_id=current_user.id).all()
-    output = []
-    for viagem in viagens:
-        viagem_data = {
-            "id": viagem.id,
-            "nome_viagem": viagem.nome_viagem,
-            "data_inicio": viagem.data_inicio.isoformat() if viagem.data_inicio else None,
-            "data_fim": viagem.data_fim.isoformat() if viagem.data_fim else None,
-            "orcamento_total": float(viagem.orcamento_total) if viagem.orcamento_total else None
-        }
-        output.append(viagem_data)
-    return jsonify(output), 200
+    # A versão do câmbio entra porque with=summary devolve totais convertidos
+    versao = versao_viagens_cambio(current_user.id)
+    etag = gerar_etag(current_user.id, "viagens", *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    # with=summary: total gasto e saldo de cada viagem e destino, de uma consulta agrupada para todas
+    incluir = request.args.get("with")
+    if incluir and incluir not in WITH_VALIDOS:
+        return jsonify({"message": f"with inválido. Valores aceitos: {', '.join(sorted(WITH_VALIDOS))}"}), 400
+
+    rows = db.session.execute(consulta_viagens_usuario(current_user.id)).all()
+    if not incluir:
+        return com_etag(jsonify(viagem_encoder.linhas(rows)), etag), 200
+
+    cambio_cache.sincronizar(versao[1])
+    try:
+        gastos = gastos_por_destino(db.session.execute(consulta_gastos_viagens(current_user.id)), moedas_base_viagens(rows))
+    except TaxaIndisponivel as e:
+        return jsonify({"message": str(e)}), 422
+    destinos = db.session.execute(consulta_destinos_usuario(current_user.id))
+    output = viagens_com_resumo_json(rows, destinos, gastos)
+    return com_etag(jsonify(output), etag), 200
 
 @viagem_bp.route("/viagens/<int:id_viagem>", methods=["GET"])
 @token_required
 def get_viagem_by_id(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
-    if not viagem:
+    versao = versao_viagem(current_user.id, id_viagem)
+    if not versao:
         return jsonify({"message": "Viagem não encontrada"}), 404
-    
-    viagem_data = {
-        "id": viagem.id,
-        "nome_viagem": viagem.nome_viagem,
-        "data_inicio": viagem.data_inicio.isoformat() if viagem.data_inicio else None,
-        "data_fim": viagem.data_fim.isoformat() if viagem.data_fim else None,
-        "orcamento_total": float(viagem.orcamento_total) if viagem.orcamento_total else None,
-        "destinos": [
-            {
-                "id": d.id, 
-                "nome_cidade": d.nome_cidade,
-                "data_chegada": d.data_chegada.isoformat() if d.data_chegada else None,
-                "data_partida": d.data_partida.isoformat() if d.data_partida else None,
-                "orcamento_destino": float(d.orcamento_destino) if d.orcamento_destino else None
-            } for d in viagem.destinos
-        ]
-    }
-    return jsonify(viagem_data), 200
+    etag = gerar_etag(current_user.id, "viagem", id_viagem, *versao)
+    resposta_304 = nao_modificado(etag)
+    if resposta_304:
+        return resposta_304
+
+    # expand=destinos,despesas,categorias,meios_pagamento: árvore aninhada com número fixo de consultas
+    expand = {e.strip() for e in request.args.get("expand", "").split(",") if e.strip()}
+    if expand - EXPAND_VALIDOS:
+        return jsonify({"message": f"expand inválido. Valores aceitos: {', '.join(sorted(EXPAND_VALIDOS))}"}), 400
+
+    # Propriedade já conferida pela leitura da versão
+    viagem_data = viagem_encoder.linha(db.session.execute(
+        db.select(*viagem_encoder.colunas).where(Viagem.id == id_viagem)
+    ).one())
+    destinos = db.session.execute(consulta_destinos_viagem(id_viagem)).all()
+    viagem_data["destinos"] = destino_encoder.linhas(destinos)
+
+    # Todas as despesas da viagem numa única consulta, agrupadas por destino em memória
+    if "despesas" in expand:
+        despesas_por_destino = {d["id"]: [] for d in viagem_data["destinos"]}
+        rows = db.session.execute(
+            db.select(Despesa.destino_id, *despesa_encoder.colunas)
+            .join(Destino, Despesa.destino_id == Destino.id)
+            .where(Destino.viagem_id == id_viagem)
+            .order_by(Despesa.data.desc(), Despesa.id.desc())
+        )
+        linha = despesa_encoder.linha
+        for row in rows:
+            despesas_por_destino[row[0]].append(linha(row[1:]))
+        for destino_data in viagem_data["destinos"]:
+            destino_data["despesas"] = despesas_por_destino[destino_data["id"]]
+
+    if "categorias" in expand:
+        viagem_data["categorias"] = categoria_encoder.linhas(db.session.execute(consulta_categorias(current_user.id)))
+    if "meios_pagamento" in expand:
+        viagem_data["meios_pagamento"] = meio_pagamento_encoder.linhas(db.session.execute(consulta_meios_pagamento(current_user.id)))
+    return com_etag(jsonify(viagem_data), etag), 200
 
 @viagem_bp.route("/viagens/<int:id_viagem>", methods=["PUT"])
 @token_required
 def update_viagem(current_user, id_viagem):
     data = request.get_json()
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
+    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id, removida_em=None).first()
 
     if not viagem:
         return jsonify({"message": "Viagem não encontrada"}), 404
@@ -96,7 +185,13 @@ def update_viagem(current_user, id_viagem):
         if "data_inicio" in data: viagem.data_inicio = datetime.strptime(data["data_inicio"], "%Y-%m-%d").date() if data["data_inicio"] else None
         if "data_fim" in data: viagem.data_fim = datetime.strptime(data["data_fim"], "%Y-%m-%d").date() if data["data_fim"] else None
         if "orcamento_total" in data: viagem.orcamento_total = data["orcamento_total"]
-        
+        if "moeda_base" in data:
+            try:
+                viagem.moeda_base = normalizar_moeda(data["moeda_base"])
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
+
+        incrementar_versao_viagem(viagem.id, current_user.id)
         db.session.commit()
         return jsonify({"message": "Viagem atualizada com sucesso"}), 200
     except Exception as e:
@@ -106,13 +201,27 @@ def update_viagem(current_user, id_viagem):
 @viagem_bp.route("/viagens/<int:id_viagem>", methods=["DELETE"])
 @token_required
 def delete_viagem(current_user, id_viagem):
-    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id).first()
+    viagem = Viagem.query.filter_by(id=id_viagem, usuario_id=current_user.id, removida_em=None).first()
     if not viagem:
         return jsonify({"message": "Viagem não encontrada"}), 404
     
+    # async=true: marca a viagem e deixa a exclusão dos dados para a purga em segundo plano
+    adiada = request.args.get("async", "").lower() in ("1", "true")
     try:
+        incrementar_versao_viagens(current_user.id)
+        if adiada:
+            registrar_viagem_removida(current_user.id, viagem.id)
+            db.session.execute(db.update(Viagem).where(Viagem.id == viagem.id).values(removida_em=datetime.utcnow()))
+            db.session.commit()
+            # Só depois do commit: antes dele um GET ainda poderia recolocar a viagem no cache
+            cache_relatorios.invalidar_viagem(id_viagem)
+            purga_viagens.agendar(current_app._get_current_object())
+            return jsonify({"message": "Viagem removida; os dados serão apagados em segundo plano"}), 202
+        # Destinos, despesas e resumos saem pelo ON DELETE CASCADE, no mesmo DELETE
+        registrar_filhos_removidos(current_user.id, viagem_id=viagem.id)
         db.session.delete(viagem)
         db.session.commit()
+        cache_relatorios.invalidar_viagem(id_viagem)
         return jsonify({"message": "Viagem deletada com sucesso"}), 200
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Log de alterações para a sincronização incremental (GET /api/sync).
+#
+# Os eventos de flush da sessão registram em RegistroAlteracao cada Viagem,
+# Destino, Despesa, CategoriaDespesa e MeioPagamento inserido, alterado ou
+# removido, na mesma transação da escrita. Os filhos apagados pelo ON DELETE
+# CASCADE do banco (delete_viagem, delete_destino) não passam pela sessão: as
+# rotas chamam registrar_filhos_removidos antes do DELETE. Escritas feitas
+# direto no Core chamam registrar_despesas_inseridas (importação em lote) e
+# registrar_despesas_alteradas (mesclagem de categorias e meios de pagamento).
+#
+# O cursor é o id do log, lido sempre por usuário. Ele só funciona se os ids
+# de um usuário forem confirmados em ordem crescente. No SQLite as escritas já
+# são serializadas. No MySQL e no PostgreSQL duas transações podem confirmar
+# ids fora de ordem, então toda escrita no log trava antes a linha do usuário
+# em Usuario (SELECT ... FOR UPDATE) até o commit (ver _serializar). Assim a
+# transação seguinte do mesmo usuário só recebe um id depois que a anterior
+# terminou. A carga completa trava a mesma linha para ler o cursor.
+from sqlalchemy import event, insert, select, func, literal, true, false
+from flask_sqlalchemy.session import Session
+
+from models.models import db, Usuario, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento, RegistroAlteracao
+
+# Modelo -> nome da tabela no log (também a chave na resposta do /sync)
+TABELAS = {
+    Viagem: "viagens",
+    Destino: "destinos",
+    Despesa: "despesas",
+    CategoriaDespesa: "categorias",
+    MeioPagamento: "meios_pagamento",
+}
+
+_REMOVIDOS = "alteracoes_removidos"
+
+def _consulta_dono(modelo, ids):
+    # (id, usuario_id) dos registros; destinos e despesas chegam ao usuário pela viagem
+    if modelo is Destino:
+        return select(Destino.id, Viagem.usuario_id)\
+            .join(Viagem, Destino.viagem_id == Viagem.id).where(Destino.id.in_(ids))
+    if modelo is Despesa:
+        return select(Despesa.id, Viagem.usuario_id)\
+            .join(Destino, Despesa.destino_id == Destino.id)\
+            .join(Viagem, Destino.viagem_id == Viagem.id).where(Despesa.id.in_(ids))
+    return select(modelo.id, modelo.usuario_id).where(modelo.id.in_(ids))
+
+def _serializar(session, usuario_ids):
+    # Trava as linhas dos usuários até o fim da transação; em ordem de id para
+    # não haver deadlock entre transações que tocam mais de um usuário
+    if session.get_bind().dialect.name == "sqlite":
+        return
+    session.execute(
+        select(Usuario.id).where(Usuario.id.in_(sorted(usuario_ids))).order_by(Usuario.id).with_for_update()
+    )
+
+def _donos(session, objetos):
+    # {(tabela, id): usuario_id}; uma consulta por modelo, não por objeto
+    por_modelo = {}
+    for obj in objetos:
+        por_modelo.setdefault(type(obj), set()).add(obj.id)
+    donos = {}
+    for modelo, ids in por_modelo.items():
+        for registro_id, usuario_id in session.execute(_consulta_dono(modelo, ids)):
+            donos[(TABELAS[modelo], registro_id)] = usuario_id
+    return donos
+
+@event.listens_for(Session, "before_flush")
+def _antes_do_flush(session, flush_context, instances):
+    # Os donos dos removidos são lidos antes do DELETE, enquanto as linhas existem
+    removidos = [obj for obj in session.deleted if type(obj) in TABELAS]
+    if removidos:
+        session.info.setdefault(_REMOVIDOS, {}).update(_donos(session, removidos))
+
+@event.listens_for(Session, "after_flush")
+def _depois_do_flush(session, flush_context):
+    # new/dirty ainda mostram o estado de antes do flush, mas os ids já existem
+    removidos = session.info.pop(_REMOVIDOS, {})
+    alterados = [obj for obj in session.new if type(obj) in TABELAS]
+    alterados += [obj for obj in session.dirty
+                  if type(obj) in TABELAS and session.is_modified(obj, include_collections=False)]
+    linhas = [
+        {"usuario_id": usuario_id, "tabela": tabela, "registro_id": registro_id, "removido": False}
+        for (tabela, registro_id), usuario_id in _donos(session, alterados).items()
+    ]
+    linhas += [
+        {"usuario_id": usuario_id, "tabela": tabela, "registro_id": registro_id, "removido": True}
+        for (tabela, registro_id), usuario_id in removidos.items()
+    ]
+    if linhas:
+        _serializar(session, {linha["usuario_id"] for linha in linhas})
+        session.execute(insert(RegistroAlteracao), linhas)
+
+@event.listens_for(Session, "after_rollback")
+def _depois_do_rollback(session):
+    session.info.pop(_REMOVIDOS, None)
+
+# --- Escritas em lote (Core) ---
+def ultimo_id_despesa():
+    return db.session.scalar(select(func.max(Despesa.id))) or 0
+
+def registrar_despesas_inseridas(usuario_id, destino_id, id_anterior):
+    # Um INSERT ... SELECT para as despesas do destino criadas depois de id_anterior
+    _serializar(db.session, {usuario_id})
+    db.session.execute(insert(RegistroAlteracao).from_select(
+        ["usuario_id", "tabela", "registro_id", "removido"],
+        select(literal(usuario_id), literal(TABELAS[Despesa]), Despesa.id, false())
+        .where(Despesa.destino_id == destino_id, Despesa.id > id_anterior)
+    ))
+
+def _registrar(usuario_id, modelo, consulta, removido):
+    # consulta: select(modelo.id) com os filtros; vira um único INSERT ... SELECT
+    _serializar(db.session, {usuario_id})
+    db.session.execute(insert(RegistroAlteracao).from_select(
+        ["usuario_id", "tabela", "registro_id", "removido"],
+        consulta.with_only_columns(literal(usuario_id), literal(TABELAS[modelo]), modelo.id, true() if removido else false())
+    ))
+
+def registrar_despesas_alteradas(usuario_id, *condicoes):
+    # UPDATE em lote pelo Core (mesclagem de categorias e meios de pagamento):
+    # chamado antes do UPDATE, enquanto as condições ainda selecionam as despesas.
+    # As de viagens com exclusão adiada ficam de fora: já têm tombstone
+    _registrar(usuario_id, Despesa, select(Despesa.id)
+               .join(Destino, Despesa.destino_id == Destino.id)
+               .join(Viagem, Destino.viagem_id == Viagem.id)
+               .where(Viagem.removida_em.is_(None), *condicoes), False)
+
+def registrar_filhos_removidos(usuario_id, viagem_id=None, destino_id=None):
+    # Tombstones dos destinos e despesas que o ON DELETE CASCADE vai apagar
+    # junto com a viagem (ou só das despesas, para um destino)
+    if viagem_id is not None:
+        _registrar(usuario_id, Destino, select(Destino.id).where(Destino.viagem_id == viagem_id), True)
+        despesas = select(Despesa.id).join(Destino, Despesa.destino_id == Destino.id)\
+            .where(Destino.viagem_id == viagem_id)
+    else:
+        despesas = select(Despesa.id).where(Despesa.destino_id == destino_id)
+    _registrar(usuario_id, Despesa, despesas, True)
+
+def registrar_viagem_removida(usuario_id, viagem_id):
+    # Exclusão adiada: a viagem é só marcada (UPDATE pelo Core), então o
+    # tombstone dela e dos filhos é gravado aqui, já no momento da marcação
+    _registrar(usuario_id, Viagem, select(Viagem.id).where(Viagem.id == viagem_id), True)
+    registrar_filhos_removidos(usuario_id, viagem_id=viagem_id)
+
+# --- Leitura ---
+def ultimo_cursor(usuario_id):
+    # Com a linha do usuário travada, nenhuma escrita dele fica pendente com id menor
+    _serializar(db.session, {usuario_id})
+    return db.session.scalar(
+        select(func.max(RegistroAlteracao.id)).where(RegistroAlteracao.usuario_id == usuario_id)
+    ) or 0
+
+def alteracoes_desde(usuario_id, cursor, limit):
+    # Entradas do usuário depois do cursor, pela ordem do log. Devolve
+    # ({tabela: ids alterados}, {tabela: ids removidos}, novo cursor, has_more);
+    # vale a última operação de cada registro dentro da página
+    rows = db.session.execute(
+        select(RegistroAlteracao.id, RegistroAlteracao.tabela, RegistroAlteracao.registro_id, RegistroAlteracao.removido)
+        .where(RegistroAlteracao.usuario_id == usuario_id, RegistroAlteracao.id > cursor)
+        .order_by(RegistroAlteracao.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    ultima = {}
+    for _, tabela, registro_id, removido in rows:
+        ultima[(tabela, registro_id)] = removido
+    alterados = {tabela: [] for tabela in TABELAS.values()}
+    removidos = {tabela: [] for tabela in TABELAS.values()}
+    for (tabela, registro_id), removido in ultima.items():
+        (removidos if removido else alterados)[tabela].append(registro_id)
+    return alterados, removidos, (rows[-1].id if rows else cursor), has_more
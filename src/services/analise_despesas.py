@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Análise de gastos de todas as viagens do usuário (GET /api/analytics).
+#
+# Cada usuário tem um snapshot colunar em memória montado a partir de
+# ResumoDespesa: uma coluna por campo (array do módulo array, sem objetos por
+# linha), ordenado por data. O snapshot é válido enquanto os contadores
+# (versao_viagens, versão do câmbio, versao_listas) não mudam; a primeira
+# consulta depois de uma escrita ou de uma carga de cotações o reconstrói.
+# A versão do câmbio vem do banco (VersaoCambio), então uma carga feita pelo
+# comando "flask carregar-cambio" em outro processo também vale aqui. Filtros de data e quebras viram fatias
+# contíguas (bisect) somadas em C. A conversão para a moeda pedida (valores) e
+# a coluna reordenada de cada quebra (_somar_por) ainda percorrem as linhas em
+# Python, mas uma vez por snapshot e moeda: ficam guardadas no snapshot.
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from models.models import db, Viagem, CategoriaDespesa, MeioPagamento, ResumoDespesa
+from services.cambio import cambio_cache
+from services.relatorio_engine import SEM_CATEGORIA, SEM_MEIO_PAGAMENTO
+
+ANALISE_CACHE_MAX_USUARIOS = int(os.getenv("ANALISE_CACHE_MAX_USUARIOS", "256"))
+
+PERIODOS = ("mes", "trimestre", "ano")
+# Coluna do snapshot usada em cada quebra
+DIMENSOES = {"categoria": "categoria_ids", "meio_pagamento": "meio_pagamento_ids", "viagem": "viagem_ids"}
+
+def _rotulo_periodo(periodo, chave):
+    # chave = (ano*12 + mes-1) // divisor: ano*12 + mes-1, ano*4 + trimestre-1 ou o ano
+    if periodo == "mes":
+        return f"{chave // 12:04d}-{chave % 12 + 1:02d}"
+    if periodo == "trimestre":
+        return f"{chave // 4:04d}-T{chave % 4 + 1}"
+    return f"{chave:04d}"
+
+class SnapshotColunar:
+    def __init__(self, versao, rows, viagens, categorias, meios_pagamento):
+        self.versao = versao
+        self.viagens = viagens
+        self.categorias = categorias
+        self.meios_pagamento = meios_pagamento
+        self.moedas_base = sorted({moeda for _, moeda in viagens.values()})
+
+        self.datas = []
+        self.ordinais = array("l")
+        self.meses = array("l")
+        self.viagem_ids = array("l")
+        self.categoria_ids = array("l")
+        self.meio_pagamento_ids = array("l")
+        self.moeda_idx = array("h")
+        self.totais = array("d")
+        self.quantidades = array("l")
+        self.moedas = []
+        indices_moeda = {}
+        for viagem_id, data, categoria_id, meio_pagamento_id, moeda, total, quantidade in rows:
+            if moeda not in indices_moeda:
+                indices_moeda[moeda] = len(self.moedas)
+                self.moedas.append(moeda)
+            self.datas.append(data)
+            self.ordinais.append(data.toordinal())
+            self.meses.append(data.year * 12 + data.month - 1)
+            self.viagem_ids.append(viagem_id)
+            self.categoria_ids.append(categoria_id)
+            self.meio_pagamento_ids.append(meio_pagamento_id)
+            self.moeda_idx.append(indices_moeda[moeda])
+            self.totais.append(float(total or 0))
+            self.quantidades.append(quantidade)
+        self._convertidos = {}
+        self._grupos = {}
+        self._lock = threading.Lock()
+
+    def valores(self, moeda_alvo):
+        # Coluna de totais na moeda pedida; convertida uma vez por snapshot e moeda
+        with self._lock:
+            convertidos = self._convertidos.get(moeda_alvo)
+            if convertidos is not None:
+                return convertidos
+        if all(m == moeda_alvo for m in self.moedas):
+            convertidos = self.totais
+        else:
+            fatores = {}
+            convertidos = array("d", self.totais)
+            for i, (idx, data) in enumerate(zip(self.moeda_idx, self.datas)):
+                moeda = self.moedas[idx]
+                if moeda == moeda_alvo:
+                    continue
+                fator = fatores.get((idx, data))
+                if fator is None:
+                    fator = fatores[(idx, data)] = float(cambio_cache.fator(moeda, moeda_alvo, data))
+                convertidos[i] *= fator
+        with self._lock:
+            self._convertidos[moeda_alvo] = convertidos
+        return convertidos
+
+    def _grupo(self, dimensao):
+        # Permutação das linhas agrupadas por dimensão (estável: a data continua
+        # crescente dentro de cada grupo) e os limites [inicio, fim) de cada grupo
+        with self._lock:
+            grupo = self._grupos.get(dimensao)
+        if grupo is None:
+            coluna = getattr(self, DIMENSOES[dimensao])
+            ordem = sorted(range(len(coluna)), key=coluna.__getitem__)
+            chaves, limites = [], []
+            for pos, i in enumerate(ordem):
+                if not chaves or coluna[i] != chaves[-1]:
+                    if limites:
+                        limites[-1] = (limites[-1][0], pos)
+                    chaves.append(coluna[i])
+                    limites.append((pos, len(ordem)))
+            grupo = (chaves, limites, ordem, array("l", (self.ordinais[i] for i in ordem)))
+            with self._lock:
+                self._grupos[dimensao] = grupo
+        return grupo
+
+    def _somar_por(self, dimensao, moeda_alvo, ordinal_inicio, ordinal_fim):
+        chaves, limites, ordem, ordinais = self._grupo(dimensao)
+        chave_cache = (dimensao, moeda_alvo)
+        with self._lock:
+            valores = self._convertidos.get(chave_cache)
+        if valores is None:
+            convertidos = self.valores(moeda_alvo)
+            valores = array("d", (convertidos[i] for i in ordem))
+            with self._lock:
+                self._convertidos[chave_cache] = valores
+        somas = {}
+        for chave, (a, b) in zip(chaves, limites):
+            i = bisect_left(ordinais, ordinal_inicio, a, b)
+            j = bisect_right(ordinais, ordinal_fim, a, b)
+            if j > i:
+                somas[chave] = sum(valores[i:j])
+        return sorted(somas.items(), key=lambda item: item[1], reverse=True)
+
+    def agregar(self, moeda_alvo, periodo="mes", data_inicio=None, data_fim=None):
+        # Somas de fatias contíguas (sum/bisect em C); só a primeira consulta por moeda percorre as linhas
+        valores = self.valores(moeda_alvo)
+        ordinal_inicio = data_inicio.toordinal() if data_inicio else 0
+        ordinal_fim = data_fim.toordinal() if data_fim else 10 ** 9
+        inicio = bisect_left(self.ordinais, ordinal_inicio)
+        fim = max(inicio, bisect_right(self.ordinais, ordinal_fim))
+
+        # Linhas ordenadas por data: cada período é um bloco contíguo da coluna de meses
+        divisor = {"mes": 1, "trimestre": 3, "ano": 12}[periodo]
+        por_periodo = []
+        pos = inicio
+        while pos < fim:
+            chave = self.meses[pos] // divisor
+            proximo = bisect_left(self.meses, (chave + 1) * divisor, pos, fim)
+            por_periodo.append({
+                "periodo": _rotulo_periodo(periodo, chave),
+                "total": round(sum(valores[pos:proximo]), 2),
+                "quantidade": sum(self.quantidades[pos:proximo]),
+            })
+            pos = proximo
+
+        return {
+            "moeda": moeda_alvo,
+            "periodo": periodo,
+            "total": round(sum(valores[inicio:fim]), 2),
+            "quantidade": sum(self.quantidades[inicio:fim]),
+            "por_periodo": por_periodo,
+            "por_categoria": [
+                {"categoria_id": cat_id or None, "categoria": self.categorias.get(cat_id, SEM_CATEGORIA), "total": round(total, 2)}
+                for cat_id, total in self._somar_por("categoria", moeda_alvo, ordinal_inicio, ordinal_fim)
+            ],
+            "por_meio_pagamento": [
+                {"meio_pagamento_id": mp_id or None, "meio_pagamento": self.meios_pagamento.get(mp_id, SEM_MEIO_PAGAMENTO), "total": round(total, 2)}
+                for mp_id, total in self._somar_por("meio_pagamento", moeda_alvo, ordinal_inicio, ordinal_fim)
+            ],
+            "por_viagem": [
+                {"viagem_id": viagem_id, "nome_viagem": self.viagens[viagem_id][0], "total": round(total, 2)}
+                for viagem_id, total in self._somar_por("viagem", moeda_alvo, ordinal_inicio, ordinal_fim)
+            ],
+        }
+
+def _montar_snapshot(usuario_id, versao):
+    viagens = {r.id: (r.nome_viagem, r.moeda_base) for r in db.session.execute(
+        db.select(Viagem.id, Viagem.nome_viagem, Viagem.moeda_base)
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None)))}
+    categorias = dict(db.session.execute(
+        db.select(CategoriaDespesa.id, CategoriaDespesa.nome).where(CategoriaDespesa.usuario_id == usuario_id)).all())
+    meios_pagamento = dict(db.session.execute(
+        db.select(MeioPagamento.id, MeioPagamento.nome).where(MeioPagamento.usuario_id == usuario_id)).all())
+    # Lido direto do cursor para as colunas, sem lista intermediária de linhas
+    rows = db.session.execute(
+        db.select(
+            ResumoDespesa.viagem_id, ResumoDespesa.data, ResumoDespesa.categoria_id,
+            ResumoDespesa.meio_pagamento_id, ResumoDespesa.moeda, ResumoDespesa.total, ResumoDespesa.quantidade
+        ).join(Viagem, ResumoDespesa.viagem_id == Viagem.id)
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None), ResumoDespesa.quantidade > 0)
+        .order_by(ResumoDespesa.data)
+    )
+    return SnapshotColunar(versao, rows, viagens, categorias, meios_pagamento)
+
+class SnapshotCache:
+    # LRU por usuário; a entrada é descartada quando a versão do usuário muda
+    def __init__(self, max_usuarios=ANALISE_CACHE_MAX_USUARIOS):
+        self.max_usuarios = max_usuarios
+        self.reconstrucoes = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id, versao):
+        with self._lock:
+            snapshot = self._snapshots.get(usuario_id)
+            if snapshot is not None and snapshot.versao == versao:
+                self._snapshots.move_to_end(usuario_id)
+                return snapshot
+        snapshot = _montar_snapshot(usuario_id, versao)
+        with self._lock:
+            self.reconstrucoes += 1
+            self._snapshots[usuario_id] = snapshot
+            self._snapshots.move_to_end(usuario_id)
+            while len(self._snapshots) > self.max_usuarios:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def descartar(self, usuario_id):
+        with self._lock:
+            self._snapshots.pop(usuario_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Busca textual nas despesas (descricao e observacoes) de todas as viagens do usuário.
+#
+# No SQLite o índice é a tabela virtual FTS5 DespesaBusca, de conteúdo externo
+# (lê o texto da própria Despesa) e mantida por triggers de INSERT, UPDATE e
+# DELETE, criados pela migração 0005: vale para as rotas, a importação em lote
+# (executemany) e as remoções em cascata. MySQL e PostgreSQL usam o índice full-text nativo.
+#
+# A relevância vira um rank em que menor é melhor (bm25 do FTS5; nos outros
+# bancos, o score nativo com sinal trocado), e a paginação é keyset sobre
+# (rank, id). O rank é arredondado para um inteiro (ESCALA_RANK) antes de
+# ordenar e comparar: igualdade entre floats calculados de novo a cada página
+# não é confiável, e empates no inteiro são decididos pelo id.
+import re
+
+from sqlalchemy import and_, or_, func, cast, literal_column, table, column, BigInteger
+
+from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+
+TABELA_BUSCA = "DespesaBusca"
+# Peso de cada coluna no bm25: a descrição conta mais que as observações
+PESO_DESCRICAO = 2.0
+PESO_OBSERVACOES = 1.0
+# Casas decimais do rank preservadas no inteiro usado para ordenar e paginar
+ESCALA_RANK = 10 ** 9
+
+_TERMO = re.compile(r"\w+", re.UNICODE)
+
+despesa_busca = table(TABELA_BUSCA, column("rowid"))
+
+class BuscaNaoSuportada(Exception):
+    def __init__(self, dialeto):
+        super().__init__(f"Busca textual não suportada no banco {dialeto}")
+        self.dialeto = dialeto
+
+def _texto_postgresql():
+    return func.to_tsvector("simple", func.coalesce(Despesa.descricao, "") + " " + func.coalesce(Despesa.observacoes, ""))
+
+def termos_busca(q):
+    # Palavras do texto digitado (sem operadores): evita erros de sintaxe do MATCH
+    return _TERMO.findall(q or "")
+
+def _criterio_e_rank(termos):
+    # (condição WHERE, expressão de rank em que menor é melhor) conforme o banco
+    dialeto = db.engine.dialect.name
+    if dialeto == "sqlite":
+        # Cada termo é um prefixo entre aspas; termos separados por espaço = AND
+        consulta = " ".join(f'"{t}"*' for t in termos)
+        tabela = literal_column(f'"{TABELA_BUSCA}"')
+        return tabela.op("MATCH")(consulta), func.bm25(tabela, PESO_DESCRICAO, PESO_OBSERVACOES)
+    if dialeto == "mysql":
+        from sqlalchemy.dialects.mysql import match
+        score = match(Despesa.descricao, Despesa.observacoes, against=" ".join(f"+{t}*" for t in termos)).in_boolean_mode()
+        return score, -score
+    if dialeto == "postgresql":
+        consulta = func.to_tsquery("simple", " & ".join(f"{t}:*" for t in termos))
+        return _texto_postgresql().op("@@")(consulta), -func.ts_rank(_texto_postgresql(), consulta)
+    raise BuscaNaoSuportada(dialeto)
+
+def consulta_busca(usuario_id, termos, filtro, colunas, cursor=None, limit=50, viagem_id=None):
+    # SELECT (rank, *colunas) das despesas do usuário que casam com os termos;
+    # rank é inteiro: relevância nativa * ESCALA_RANK, com sinal trocado
+    criterio, rank = _criterio_e_rank(termos)
+    rank = cast(func.round(rank * ESCALA_RANK), BigInteger).label("relevancia")
+    query = db.select(rank, *colunas).select_from(Despesa)
+    if db.engine.dialect.name == "sqlite":
+        query = query.join(despesa_busca, despesa_busca.c.rowid == Despesa.id)
+    query = query.where(criterio)\
+        .join(Destino, Despesa.destino_id == Destino.id)\
+        .join(Viagem, Destino.viagem_id == Viagem.id)\
+        .outerjoin(CategoriaDespesa, Despesa.categoria_id == CategoriaDespesa.id)\
+        .outerjoin(MeioPagamento, Despesa.meio_pagamento_id == MeioPagamento.id)\
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+    if viagem_id:
+        query = query.where(Destino.viagem_id == viagem_id)
+    query = filtro.apply(query)
+
+    # Keyset: continua depois da última linha (rank, id) da página anterior
+    if cursor:
+        cursor_rank, cursor_id = cursor
+        query = query.where(or_(
+            rank > cursor_rank,
+            and_(rank == cursor_rank, Despesa.id < cursor_id)
+        ))
+    return query.order_by(rank, Despesa.id.desc()).limit(limit + 1)
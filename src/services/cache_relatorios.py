@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Cache das respostas de relatorio/geral e dos gráficos por categoria e por dia.
+#
+# A chave é (tipo, usuario_id, viagem_id, filtro normalizado, versão dos
+# dados): a versão é o par (Viagem.versao, Usuario.versao_listas) já lido para
+# o ETag, então uma escrita nunca serve resultado antigo. incrementar_versao_viagem
+# também descarta as entradas da viagem alterada (e só dela), para liberar
+# espaço; a remoção da viagem também, pois o SQLite reaproveita o id. O dono na
+# chave garante que um id reaproveitado por outro usuário nunca acerta o cache.
+# O valor guardado é o corpo JSON já serializado (bytes UTF-8).
+#
+# Backends (RELATORIO_CACHE_BACKEND):
+# - "memoria": LRU em processo, limitado por número de entradas e por bytes.
+# - "sqlite": arquivo SQLite local (RELATORIO_CACHE_PATH) compartilhado pelos
+#   workers do gunicorn na mesma máquina, com a mesma política de despejo.
+# - "off": desligado.
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RELATORIO_CACHE_BACKEND = os.getenv("RELATORIO_CACHE_BACKEND", "memoria")
+RELATORIO_CACHE_MAX_ENTRADAS = int(os.getenv("RELATORIO_CACHE_MAX_ENTRADAS", "2048"))
+RELATORIO_CACHE_MAX_BYTES = int(os.getenv("RELATORIO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RELATORIO_CACHE_PATH = os.getenv("RELATORIO_CACHE_PATH", os.path.join(tempfile.gettempdir(), "travel_finance_relatorios.db"))
+
+def chave_relatorio(tipo, usuario_id, viagem_id, filtro, versao):
+    # Texto estável para qualquer backend; filtro.key() já normaliza datas e ids
+    return repr((tipo, usuario_id, viagem_id, tuple(versao), filtro.key()))
+
+class BackendMemoria:
+    nome = "memoria"
+
+    def __init__(self, max_entradas, max_bytes):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entradas = OrderedDict()  # chave -> (viagem_id, corpo)
+        self._por_viagem = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada[1]
+
+    def guardar(self, chave, viagem_id, corpo):
+        tamanho = len(corpo)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            self._remover(chave)
+            self._entradas[chave] = (viagem_id, corpo)
+            self._por_viagem.setdefault(viagem_id, set()).add(chave)
+            self.bytes += tamanho
+            while len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+
+    def _remover(self, chave):
+        entrada = self._entradas.pop(chave, None)
+        if entrada is None:
+            return
+        viagem_id, corpo = entrada
+        self.bytes -= len(corpo)
+        chaves = self._por_viagem.get(viagem_id)
+        if chaves is not None:
+            chaves.discard(chave)
+            if not chaves:
+                del self._por_viagem[viagem_id]
+
+    def invalidar_viagem(self, viagem_id):
+        with self._lock:
+            for chave in list(self._por_viagem.get(viagem_id, ())):
+                self._remover(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._por_viagem.clear()
+            self.bytes = 0
+
+    def uso(self):
+        with self._lock:
+            return len(self._entradas), self.bytes
+
+class BackendSQLite:
+    # Uma conexão por thread; o arquivo é o ponto de encontro dos processos
+    nome = "sqlite"
+    _DDL = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=OFF",
+        """CREATE TABLE IF NOT EXISTS relatorio_cache (
+            chave TEXT PRIMARY KEY, viagem_id INTEGER NOT NULL, corpo BLOB NOT NULL,
+            tamanho INTEGER NOT NULL, acesso REAL NOT NULL)""",
+        "CREATE INDEX IF NOT EXISTS ix_relatorio_cache_viagem ON relatorio_cache (viagem_id)",
+        "CREATE INDEX IF NOT EXISTS ix_relatorio_cache_acesso ON relatorio_cache (acesso)",
+    )
+
+    def __init__(self, caminho, max_entradas, max_bytes):
+        self.caminho = os.path.abspath(caminho)
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            for ddl in self._DDL:
+                conexao.execute(ddl)
+            self._local.conexao = conexao
+        return conexao
+
+    def obter(self, chave):
+        conexao = self._conexao()
+        row = conexao.execute("SELECT corpo FROM relatorio_cache WHERE chave = ?", (chave,)).fetchone()
+        if row is None:
+            return None
+        conexao.execute("UPDATE relatorio_cache SET acesso = ? WHERE chave = ?", (time.time(), chave))
+        return row[0]
+
+    def guardar(self, chave, viagem_id, corpo):
+        tamanho = len(corpo)
+        if tamanho > self.max_bytes:
+            return
+        conexao = self._conexao()
+        with conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute(
+                "INSERT OR REPLACE INTO relatorio_cache (chave, viagem_id, corpo, tamanho, acesso) VALUES (?, ?, ?, ?, ?)",
+                (chave, viagem_id, corpo, tamanho, time.time())
+            )
+            entradas, total = conexao.execute("SELECT count(*), coalesce(sum(tamanho), 0) FROM relatorio_cache").fetchone()
+            # Despeja as menos usadas recentemente até caber nos dois limites
+            while entradas > self.max_entradas or total > self.max_bytes:
+                chave_antiga, tamanho_antigo = conexao.execute(
+                    "SELECT chave, tamanho FROM relatorio_cache ORDER BY acesso LIMIT 1").fetchone()
+                conexao.execute("DELETE FROM relatorio_cache WHERE chave = ?", (chave_antiga,))
+                entradas -= 1
+                total -= tamanho_antigo
+
+    def invalidar_viagem(self, viagem_id):
+        self._conexao().execute("DELETE FROM relatorio_cache WHERE viagem_id = ?", (viagem_id,))
+
+    def limpar(self):
+        self._conexao().execute("DELETE FROM relatorio_cache")
+
+    def uso(self):
+        entradas, total = self._conexao().execute(
+            "SELECT count(*), coalesce(sum(tamanho), 0) FROM relatorio_cache").fetchone()
+        return entradas, total
+
+class CacheRelatorios:
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def configure(self, backend):
+        self.backend = backend
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def obter(self, chave):
+        if self.backend is None:
+            return None
+        corpo = self.backend.obter(chave)
+        with self._lock:
+            if corpo is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return corpo
+
+    def guardar(self, chave, viagem_id, corpo):
+        if self.backend is not None:
+            self.backend.guardar(chave, viagem_id, corpo)
+
+    def invalidar_viagem(self, viagem_id):
+        if self.backend is not None:
+            self.backend.invalidar_viagem(viagem_id)
+
+    def limpar(self):
+        if self.backend is not None:
+            self.backend.limpar()
+
+    def stats(self):
+        entradas, usados = self.backend.uso() if self.backend is not None else (0, 0)
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.backend.nome if self.backend is not None else "off",
+                "entries": entradas,
+                "max_entries": self.backend.max_entradas if self.backend is not None else 0,
+                "bytes": usados,
+                "max_bytes": self.backend.max_bytes if self.backend is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None
+            }
+
+def criar_backend(nome=RELATORIO_CACHE_BACKEND):
+    if nome == "memoria":
+        return BackendMemoria(RELATORIO_CACHE_MAX_ENTRADAS, RELATORIO_CACHE_MAX_BYTES)
+    if nome == "sqlite":
+        return BackendSQLite(RELATORIO_CACHE_PATH, RELATORIO_CACHE_MAX_ENTRADAS, RELATORIO_CACHE_MAX_BYTES)
+    if nome == "off":
+        return None
+    raise ValueError(f"RELATORIO_CACHE_BACKEND inválido: {nome}")
+
+cache_relatorios = CacheRelatorios(criar_backend())
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Conversão de moedas a partir da tabela local TaxaCambio (sem acesso à rede).
+#
+# As cotações são carregadas de arquivo CSV (moeda,data,taxa) pelo comando
+# "flask carregar-cambio" e expressam quantas unidades de "moeda" valem 1
+# unidade da moeda de referência (MOEDA_REFERENCIA, padrão EUR, como nas séries
+# do BCE). A conversão de X para B numa data usa a última cotação de cada moeda
+# até aquela data (ou a primeira posterior, se não houver anterior).
+#
+# O cache guarda, por moeda, as listas ordenadas de datas e taxas; a busca é um
+# bisect, então converter os grupos de um relatório não consulta o banco. As
+# rotas que convertem passam a versão do câmbio lida do banco (VersaoCambio,
+# ver services/versoes.py) para sincronizar(): uma carga feita por outro
+# processo descarta as séries na requisição seguinte, sem esperar o TTL.
+import csv
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from models.models import db, TaxaCambio, MOEDA_PADRAO
+from services.versoes import incrementar_versao_cambio
+
+MOEDA_REFERENCIA = os.getenv("MOEDA_REFERENCIA", "EUR")
+CAMBIO_CACHE_TTL_SECONDS = int(os.getenv("CAMBIO_CACHE_TTL_SECONDS", "600"))
+
+_CODIGO_MOEDA = re.compile(r"^[A-Z]{3}$")
+
+class TaxaIndisponivel(LookupError):
+    def __init__(self, moeda):
+        super().__init__(f"Sem cotação cadastrada para {moeda}")
+        self.moeda = moeda
+
+class CambioCache:
+    # As consultas rodam fora do lock: sob run_sync (asgi.py) a consulta cede o
+    # laço de eventos, e outra corrotina da mesma thread que chegasse aqui
+    # travaria no lock para sempre. O lock só protege a leitura e a publicação;
+    # a geração descarta resultados lidos antes de uma invalidação.
+    def __init__(self, ttl_seconds=CAMBIO_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._series = {}
+        self._moedas = None
+        self._carregado_em = 0.0
+        self._geracao = 0
+        self._versao = None
+        self._lock = threading.Lock()
+
+    def _expirar(self):
+        if time.time() - self._carregado_em > self.ttl_seconds:
+            self._series.clear()
+            self._moedas = None
+            self._carregado_em = time.time()
+            self._geracao += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._series.clear()
+            self._moedas = None
+            self._geracao += 1
+
+    def sincronizar(self, versao):
+        # versao: contador VersaoCambio da requisição; mudou desde a última carga?
+        with self._lock:
+            if versao != self._versao:
+                self._series.clear()
+                self._moedas = None
+                self._versao = versao
+                self._geracao += 1
+
+    def moedas(self):
+        # Moedas com ao menos uma cotação, mais a de referência
+        with self._lock:
+            self._expirar()
+            if self._moedas is not None:
+                return self._moedas
+            geracao = self._geracao
+        moedas = set(db.session.scalars(db.select(TaxaCambio.moeda).distinct()))
+        moedas.add(MOEDA_REFERENCIA)
+        with self._lock:
+            if geracao == self._geracao:
+                self._moedas = moedas
+        return moedas
+
+    def _serie(self, moeda, sessao=None):
+        # sessao: Session síncrona explícita (asgi.py via run_sync); padrão db.session
+        with self._lock:
+            self._expirar()
+            serie = self._series.get(moeda)
+            if serie is not None:
+                return serie
+            geracao = self._geracao
+        rows = (sessao or db.session).execute(
+            db.select(TaxaCambio.data, TaxaCambio.taxa)
+            .where(TaxaCambio.moeda == moeda).order_by(TaxaCambio.data)
+        ).all()
+        serie = ([r[0] for r in rows], [Decimal(r[1]) for r in rows])
+        with self._lock:
+            if geracao == self._geracao:
+                self._series[moeda] = serie
+        return serie
+
+    def taxa(self, moeda, data, sessao=None):
+        if moeda == MOEDA_REFERENCIA:
+            return Decimal(1)
+        datas, taxas = self._serie(moeda, sessao)
+        if not datas:
+            raise TaxaIndisponivel(moeda)
+        pos = bisect_right(datas, data)
+        return taxas[pos - 1] if pos else taxas[0]
+
+    def fator(self, origem, destino, data, sessao=None):
+        # Multiplicador que leva um valor de "origem" para "destino" na data
+        if origem == destino:
+            return Decimal(1)
+        return self.taxa(destino, data, sessao) / self.taxa(origem, data, sessao)
+
+cambio_cache = CambioCache()
+
+def normalizar_moeda(codigo, aceitas=None):
+    # Devolve o código em maiúsculas ou levanta ValueError se não for ISO 4217
+    # ou não tiver cotação (a moeda padrão e a de referência são sempre aceitas)
+    codigo = str(codigo or "").strip().upper()
+    if not _CODIGO_MOEDA.match(codigo):
+        raise ValueError("Moeda inválida (use o código ISO 4217, ex.: BRL)")
+    if codigo in (MOEDA_PADRAO, MOEDA_REFERENCIA):
+        return codigo
+    if codigo not in (aceitas if aceitas is not None else cambio_cache.moedas()):
+        raise ValueError(f"Sem cotação cadastrada para {codigo}")
+    return codigo
+
+def carregar_taxas(arquivo, substituir=False):
+    # arquivo: texto CSV com cabeçalho moeda,data,taxa. Devolve o número de linhas gravadas
+    linhas = {}
+    for numero, registro in enumerate(csv.DictReader(arquivo), start=2):
+        try:
+            moeda = str(registro["moeda"]).strip().upper()
+            data = datetime.strptime(registro["data"].strip(), "%Y-%m-%d").date()
+            taxa = Decimal(registro["taxa"].strip())
+        except (KeyError, AttributeError, ValueError, InvalidOperation):
+            raise ValueError(f"Linha {numero} inválida (esperado moeda,data,taxa)")
+        if not _CODIGO_MOEDA.match(moeda) or taxa <= 0:
+            raise ValueError(f"Linha {numero} inválida (esperado moeda,data,taxa)")
+        linhas[(moeda, data)] = taxa
+
+    if substituir:
+        db.session.execute(db.delete(TaxaCambio))
+    else:
+        # Upsert: remove as datas recarregadas de cada moeda e insere tudo de uma vez
+        datas_por_moeda = {}
+        for moeda, data in linhas:
+            datas_por_moeda.setdefault(moeda, []).append(data)
+        for moeda, datas in datas_por_moeda.items():
+            db.session.execute(db.delete(TaxaCambio).where(TaxaCambio.moeda == moeda, TaxaCambio.data.in_(datas)))
+    if linhas:
+        db.session.execute(db.insert(TaxaCambio), [
+            {"moeda": moeda, "data": data, "taxa": taxa} for (moeda, data), taxa in linhas.items()
+        ])
+    # Muda os ETags e as chaves de cache das respostas convertidas em todos os processos
+    incrementar_versao_cambio()
+    db.session.commit()
+    cambio_cache.invalidar()
+    return len(linhas)
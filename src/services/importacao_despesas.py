@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Importação em lote de despesas (array JSON, NDJSON ou CSV).
+#
+# O corpo é lido em streaming, linha a linha; categorias e meios de pagamento
+# do usuário são carregados uma única vez e as linhas válidas são gravadas com
+# executemany em blocos, cada bloco em sua própria transação. Erros de linha
+# são acumulados e devolvidos sem interromper o lote.
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert
+
+from models.models import db, Despesa
+from services.cambio import cambio_cache, normalizar_moeda
+from services.listas_cache import listas_cache
+from services.resumo_despesas import aplicar_delta
+from services.versoes import incrementar_versao_viagem, versao_listas
+from services.alteracoes import ultimo_id_despesa, registrar_despesas_inseridas
+
+TAMANHO_BLOCO = 500
+MAX_ERROS_REPORTADOS = 1000
+
+FORMATOS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+class ErroFormato(ValueError):
+    pass
+
+# --- Leitores em streaming: produzem (numero_linha, registro) ---
+def _ler_json_array(texto, tamanho_leitura=65536):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    iniciado = False
+    fim_arquivo = False
+    numero = 0
+    while True:
+        buffer = buffer.lstrip()
+        if buffer and not iniciado:
+            if buffer[0] != "[":
+                raise ErroFormato("O corpo deve ser um array JSON")
+            buffer = buffer[1:]
+            iniciado = True
+            continue
+        if buffer and buffer[0] == ",":
+            buffer = buffer[1:]
+            continue
+        if buffer and buffer[0] == "]":
+            return
+        if buffer:
+            try:
+                registro, fim = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if fim_arquivo:
+                    raise ErroFormato(f"JSON inválido após o registro {numero}")
+            else:
+                # Só aceita o valor se ele não puder continuar no próximo trecho lido
+                if fim < len(buffer) or fim_arquivo:
+                    numero += 1
+                    buffer = buffer[fim:]
+                    yield numero, registro
+                    continue
+        if fim_arquivo:
+            raise ErroFormato("Array JSON incompleto")
+        trecho = texto.read(tamanho_leitura)
+        if not trecho:
+            fim_arquivo = True
+        buffer += trecho
+
+def _ler_ndjson(texto):
+    for numero, linha in enumerate(texto, start=1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            yield numero, json.loads(linha)
+        except json.JSONDecodeError:
+            yield numero, None
+
+def _ler_csv(texto):
+    # numero = linha de dados (o cabeçalho não conta)
+    for numero, registro in enumerate(csv.DictReader(texto), start=1):
+        yield numero, {k: (v if v != "" else None) for k, v in registro.items() if k}
+
+def ler_registros(stream, formato):
+    texto = io.TextIOWrapper(stream, encoding="utf-8", newline="" if formato == "csv" else None)
+    if formato == "json":
+        return _ler_json_array(texto)
+    if formato == "ndjson":
+        return _ler_ndjson(texto)
+    return _ler_csv(texto)
+
+# --- Validação ---
+def _validar(registro, categorias, meios_pagamento, moeda_padrao, moedas):
+    # Devolve (valores, None) ou (None, mensagem de erro)
+    if not isinstance(registro, dict):
+        return None, "Registro inválido"
+    if not registro.get("descricao") or registro.get("valor") is None or not registro.get("data"):
+        return None, "Descrição, valor e data são obrigatórios"
+    try:
+        valor = Decimal(str(registro["valor"]))
+    except InvalidOperation:
+        return None, "Valor inválido"
+    # Decimal aceita NaN e Infinity, que corromperiam os totais dos resumos
+    if not valor.is_finite():
+        return None, "Valor inválido"
+    try:
+        data = datetime.strptime(str(registro["data"]), "%Y-%m-%d").date()
+    except ValueError:
+        return None, "Data inválida (use AAAA-MM-DD)"
+    try:
+        categoria_id = int(registro["categoria_id"]) if registro.get("categoria_id") else None
+        meio_pagamento_id = int(registro["meio_pagamento_id"]) if registro.get("meio_pagamento_id") else None
+    except (TypeError, ValueError):
+        return None, "categoria_id/meio_pagamento_id devem ser inteiros"
+    if categoria_id is not None and categoria_id not in categorias:
+        return None, "Categoria não encontrada ou não pertence ao usuário"
+    if meio_pagamento_id is not None and meio_pagamento_id not in meios_pagamento:
+        return None, "Meio de pagamento não encontrado ou não pertence ao usuário"
+    try:
+        moeda = normalizar_moeda(registro["moeda"], moedas) if registro.get("moeda") else moeda_padrao
+    except ValueError as e:
+        return None, str(e)
+    return {
+        "descricao": str(registro["descricao"]),
+        "valor": valor,
+        "moeda": moeda,
+        "data": data,
+        "observacoes": registro.get("observacoes"),
+        "categoria_id": categoria_id,
+        "meio_pagamento_id": meio_pagamento_id,
+    }, None
+
+# --- Gravação ---
+def _gravar_bloco(usuario_id, viagem_id, destino_id, bloco):
+    for linha in bloco:
+        linha["destino_id"] = destino_id
+    # executemany não passa pelos eventos do ORM: o log de alterações é gravado à parte
+    id_anterior = ultimo_id_despesa()
+    db.session.execute(insert(Despesa), bloco)
+    registrar_despesas_inseridas(usuario_id, destino_id, id_anterior)
+
+    # Um delta por grupo do resumo, não por despesa
+    grupos = {}
+    for linha in bloco:
+        chave = (linha["data"], linha["categoria_id"], linha["meio_pagamento_id"], linha["moeda"])
+        total, quantidade = grupos.get(chave, (Decimal(0), 0))
+        grupos[chave] = (total + linha["valor"], quantidade + 1)
+    for (data, categoria_id, meio_pagamento_id, moeda), (total, quantidade) in grupos.items():
+        aplicar_delta(viagem_id, destino_id, data, categoria_id, meio_pagamento_id, moeda, total, quantidade)
+    incrementar_versao_viagem(viagem_id, usuario_id)
+    db.session.commit()
+
+def importar_despesas(usuario_id, destino, registros, tamanho_bloco=TAMANHO_BLOCO):
+    # Ids lidos antes do primeiro commit (que expira o objeto destino)
+    viagem_id, destino_id = destino.viagem_id, destino.id
+    moeda_padrao = destino.viagem.moeda_base
+    moedas = cambio_cache.moedas()
+    listas = listas_cache.obter(usuario_id, versao_listas(usuario_id))
+    categorias, meios_pagamento = listas.categorias, listas.meios_pagamento
+
+    resultado = {"inseridas": 0, "rejeitadas": 0, "erros": []}
+
+    def registrar_erro(numero, mensagem):
+        resultado["rejeitadas"] += 1
+        if len(resultado["erros"]) < MAX_ERROS_REPORTADOS:
+            resultado["erros"].append({"linha": numero, "erro": mensagem})
+
+    def descarregar(bloco, numeros):
+        try:
+            _gravar_bloco(usuario_id, viagem_id, destino_id, bloco)
+            resultado["inseridas"] += len(bloco)
+        except Exception as e:
+            db.session.rollback()
+            for numero in numeros:
+                registrar_erro(numero, f"Erro ao gravar bloco: {e}")
+
+    bloco, numeros = [], []
+    try:
+        for numero, registro in registros:
+            valores, erro = _validar(registro, categorias, meios_pagamento, moeda_padrao, moedas)
+            if erro:
+                registrar_erro(numero, erro)
+                continue
+            bloco.append(valores)
+            numeros.append(numero)
+            if len(bloco) >= tamanho_bloco:
+                descarregar(bloco, numeros)
+                bloco, numeros = [], []
+    except (ErroFormato, csv.Error, UnicodeDecodeError) as e:
+        resultado["erro_formato"] = str(e)
+    if bloco:
+        descarregar(bloco, numeros)
+    return resultado
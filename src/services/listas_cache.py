@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Cache em processo das listas de categorias e meios de pagamento (dropdowns).
+#
+# Uma entrada por usuário com os dois mapas id -> nome e as listas já
+# ordenadas por nome, prontas para o GET. As rotas de dropdown_routes.py
+# invalidam a entrada do usuário depois de cada escrita; as despesas validam
+# categoria_id/meio_pagamento_id contra os mapas. Leituras e escritas passam
+# Usuario.versao_listas (um SELECT pela chave primária) e a entrada é
+# descartada se a versão mudou: uma categoria apagada ou mesclada por outro
+# processo deixa de ser aceita na hora, sem esperar o TTL.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models.models import db, Usuario, CategoriaDespesa, MeioPagamento
+from utils.serializacao import categoria_encoder, meio_pagamento_encoder
+
+LISTAS_CACHE_MAX_USUARIOS = int(os.getenv("LISTAS_CACHE_MAX_USUARIOS", "1024"))
+LISTAS_CACHE_TTL_SECONDS = int(os.getenv("LISTAS_CACHE_TTL_SECONDS", "60"))
+
+class Listas:
+    __slots__ = ("versao", "categorias", "meios_pagamento", "categorias_json", "meios_pagamento_json", "expira_em")
+
+    def __init__(self, versao, categorias, meios_pagamento, expira_em):
+        self.versao = versao
+        self.categorias_json = categoria_encoder.linhas(categorias)
+        self.meios_pagamento_json = meio_pagamento_encoder.linhas(meios_pagamento)
+        self.categorias = {c["id"]: c["nome"] for c in self.categorias_json}
+        self.meios_pagamento = {m["id"]: m["nome"] for m in self.meios_pagamento_json}
+        self.expira_em = expira_em
+
+def consulta_categorias(usuario_id):
+    return db.select(*categoria_encoder.colunas).where(CategoriaDespesa.usuario_id == usuario_id).order_by(CategoriaDespesa.nome)
+
+def consulta_meios_pagamento(usuario_id):
+    return db.select(*meio_pagamento_encoder.colunas).where(MeioPagamento.usuario_id == usuario_id).order_by(MeioPagamento.nome)
+
+def _carregar(usuario_id, ttl_seconds):
+    # A versão é lida antes das listas: uma escrita no meio só deixa a entrada
+    # mais nova que a versão, e o próximo GET a descarta
+    versao = db.session.scalar(db.select(Usuario.versao_listas).where(Usuario.id == usuario_id))
+    categorias = db.session.execute(consulta_categorias(usuario_id))
+    meios_pagamento = db.session.execute(consulta_meios_pagamento(usuario_id))
+    return Listas(versao, categorias, meios_pagamento, time.time() + ttl_seconds)
+
+class ListasCache:
+    def __init__(self, max_usuarios=LISTAS_CACHE_MAX_USUARIOS, ttl_seconds=LISTAS_CACHE_TTL_SECONDS):
+        self.max_usuarios = max_usuarios
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Muda a cada invalidação: uma carga que começou antes dela não é guardada
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id, versao=None):
+        # versao: Usuario.versao_listas lida do banco pela rota (ETag ou validação de escrita)
+        now = time.time()
+        with self._lock:
+            listas = self._entries.get(usuario_id)
+            if listas is not None and listas.expira_em > now and (versao is None or listas.versao == versao):
+                self._entries.move_to_end(usuario_id)
+                self.hits += 1
+                return listas
+            self.misses += 1
+            geracao = self._geracao
+        listas = _carregar(usuario_id, self.ttl_seconds)
+        with self._lock:
+            if self.max_usuarios > 0 and geracao == self._geracao:
+                self._entries[usuario_id] = listas
+                self._entries.move_to_end(usuario_id)
+                while len(self._entries) > self.max_usuarios:
+                    self._entries.popitem(last=False)
+        return listas
+
+    def invalidar(self, usuario_id):
+        with self._lock:
+            self._geracao += 1
+            self._entries.pop(usuario_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_usuarios": self.max_usuarios,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None
+            }
+
+listas_cache = ListasCache()
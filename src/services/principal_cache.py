@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Cache em processo dos tokens já validados pelo token_required.
+#
+# A chave é o hash SHA-256 do token; o valor é o Principal (id e username do
+# usuário). Cada entrada vale até o menor entre o TTL configurado e o "exp" do
+# próprio token. Alterações e remoções de Usuario invalidam as entradas dele.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models.models import Usuario
+
+class Principal:
+    # Representação leve do usuário autenticado passada às rotas como current_user
+    __slots__ = ("id", "username")
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f'<Principal {self.username}>'
+
+class PrincipalCache:
+    def __init__(self, max_entries=1024, ttl_seconds=60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries, ttl_seconds):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl_seconds = ttl_seconds
+            self._entries.clear()
+
+    @staticmethod
+    def key_for(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, principal, exp=None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[key] = (principal, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (p, _) in self._entries.items() if p.id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else None
+            }
+
+principal_cache = PrincipalCache()
+
+# Usuário alterado ou removido: os tokens dele voltam a passar pelo banco
+@event.listens_for(Usuario, "after_update")
+@event.listens_for(Usuario, "after_delete")
+def _invalidate_usuario(mapper, connection, target):
+    principal_cache.invalidate_user(target.id)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Refresh tokens opacos: emissão no login, rotação a cada uso e revogação.
+#
+# O cliente recebe um valor aleatório; o banco guarda apenas o HMAC-SHA256
+# dele, então renovar a sessão custa um HMAC e uma leitura indexada, sem KDF.
+# Cada uso revoga o token e emite outro da mesma família. Reapresentar um
+# token já rotacionado indica vazamento: a família inteira é revogada.
+import datetime
+import hashlib
+import hmac
+import os
+import secrets
+
+from sqlalchemy import update
+
+from models.models import db, RefreshToken
+
+REFRESH_TOKEN_EXPIRATION_SECONDS = int(os.getenv("REFRESH_TOKEN_EXPIRATION_SECONDS", str(30 * 24 * 3600)))
+
+class RefreshTokenInvalido(ValueError):
+    pass
+
+def _agora():
+    return datetime.datetime.utcnow()
+
+def _hash(token, chave):
+    return hmac.new(chave.encode("utf-8"), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def emitir(usuario_id, chave, familia=None):
+    # Adiciona o registro à sessão (o commit fica com a rota) e devolve o token em claro
+    token = secrets.token_urlsafe(32)
+    agora = _agora()
+    db.session.add(RefreshToken(
+        usuario_id=usuario_id,
+        token_hash=_hash(token, chave),
+        familia=familia or secrets.token_hex(16),
+        criado_em=agora,
+        expira_em=agora + datetime.timedelta(seconds=REFRESH_TOKEN_EXPIRATION_SECONDS)
+    ))
+    return token
+
+def _buscar(token, chave):
+    if not token or not isinstance(token, str):
+        raise RefreshTokenInvalido("Refresh token ausente")
+    registro = RefreshToken.query.filter_by(token_hash=_hash(token, chave)).first()
+    if not registro:
+        raise RefreshTokenInvalido("Refresh token inválido")
+    return registro
+
+def rotacionar(token, chave):
+    # Devolve (usuario_id, novo token). Levanta RefreshTokenInvalido
+    registro = _buscar(token, chave)
+    agora = _agora()
+    if registro.revogado_em is not None:
+        # Reuso de token já rotacionado ou revogado: derruba a família toda
+        revogar_familia(registro.familia)
+        db.session.commit()
+        raise RefreshTokenInvalido("Refresh token revogado")
+    if registro.expira_em <= agora:
+        raise RefreshTokenInvalido("Refresh token expirado")
+    # UPDATE condicional: duas renovações simultâneas não rotacionam o mesmo token
+    resultado = db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == registro.id, RefreshToken.revogado_em.is_(None))
+        .values(revogado_em=agora)
+    )
+    if resultado.rowcount != 1:
+        db.session.rollback()
+        raise RefreshTokenInvalido("Refresh token revogado")
+    return registro.usuario_id, emitir(registro.usuario_id, chave, registro.familia)
+
+def revogar(token, chave, todos=False):
+    # Revoga a família do token (logout) ou todos os tokens do usuário
+    registro = _buscar(token, chave)
+    if todos:
+        revogar_usuario(registro.usuario_id)
+    else:
+        revogar_familia(registro.familia)
+    return registro.usuario_id
+
+def revogar_familia(familia):
+    db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.familia == familia, RefreshToken.revogado_em.is_(None))
+        .values(revogado_em=_agora())
+    )
+
+def revogar_usuario(usuario_id):
+    db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.usuario_id == usuario_id, RefreshToken.revogado_em.is_(None))
+        .values(revogado_em=_agora())
+    )
+
+def remover_expirados(usuario_id):
+    db.session.execute(
+        db.delete(RefreshToken).where(RefreshToken.usuario_id == usuario_id, RefreshToken.expira_em <= _agora())
+    )
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# Motor de relatórios: um filtro compilado uma única vez e uma única consulta
+# agregada (GROUP BY) por relatório, da qual saem o total e todas as quebras
+# pedidas (destino, categoria, meio de pagamento, dia).
+#
+# A consulta lê a tabela ResumoDespesa, então o custo depende do número de
+# grupos (destino, dia, categoria, meio de pagamento, moeda) e não do de despesas.
+# Com moeda_base, cada grupo (moeda, dia) é convertido por um fator do cache de
+# câmbio, e não despesa por despesa.
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, case, or_
+
+from models.models import db, Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento, ResumoDespesa
+from services.cambio import cambio_cache
+
+SEM_CATEGORIA = "Sem categoria"
+SEM_MEIO_PAGAMENTO = "Sem meio de pagamento"
+
+class FiltroRelatorio:
+    # Parâmetros aceitos na query string, na ordem usada pela chave normalizada
+    CAMPOS = ("data_inicio", "data_fim", "id_destino", "meio_pagamento_id", "categoria_id")
+
+    def __init__(self, data_inicio=None, data_fim=None, id_destino=None, meio_pagamento_id=None, categoria_id=None, raw=None):
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.id_destino = id_destino
+        self.meio_pagamento_id = meio_pagamento_id
+        self.categoria_id = categoria_id
+        self.raw = raw or {}
+
+    @classmethod
+    def from_args(cls, args):
+        # Levanta ValueError se alguma data ou id não puder ser convertido
+        raw = {campo: args.get(campo) for campo in cls.CAMPOS}
+        return cls(
+            data_inicio=datetime.strptime(raw["data_inicio"], "%Y-%m-%d").date() if raw["data_inicio"] else None,
+            data_fim=datetime.strptime(raw["data_fim"], "%Y-%m-%d").date() if raw["data_fim"] else None,
+            id_destino=int(raw["id_destino"]) if raw["id_destino"] else None,
+            meio_pagamento_id=int(raw["meio_pagamento_id"]) if raw["meio_pagamento_id"] else None,
+            categoria_id=int(raw["categoria_id"]) if raw["categoria_id"] else None,
+            raw=raw
+        )
+
+    def key(self):
+        return (self.data_inicio, self.data_fim, self.id_destino, self.meio_pagamento_id, self.categoria_id)
+
+    def apply(self, query, modelo=Despesa):
+        # modelo: Despesa ou ResumoDespesa, que expõem as mesmas colunas filtráveis
+        if self.data_inicio: query = query.filter(modelo.data >= self.data_inicio)
+        if self.data_fim: query = query.filter(modelo.data <= self.data_fim)
+        if self.id_destino: query = query.filter(modelo.destino_id == self.id_destino)
+        if self.meio_pagamento_id: query = query.filter(modelo.meio_pagamento_id == self.meio_pagamento_id)
+        if self.categoria_id: query = query.filter(modelo.categoria_id == self.categoria_id)
+        return query
+
+    def as_dict(self):
+        return dict(self.raw)
+
+# Colunas de agrupamento de cada dimensão (id 0 no resumo = "sem categoria"/"sem meio")
+DIMENSOES = {
+    "destino": (ResumoDespesa.destino_id, Destino.nome_cidade),
+    "categoria": (ResumoDespesa.categoria_id, CategoriaDespesa.nome),
+    "meio_pagamento": (ResumoDespesa.meio_pagamento_id, MeioPagamento.nome),
+    "dia": (ResumoDespesa.data,),
+}
+
+class ResultadoRelatorio:
+    def __init__(self, dimensoes):
+        self.total = Decimal(0)
+        self.quantidade = 0
+        self.grupos = {dimensao: {} for dimensao in dimensoes}
+
+    def adicionar(self, dimensao, chave, total):
+        grupo = self.grupos[dimensao]
+        grupo[chave] = grupo.get(chave, Decimal(0)) + total
+
+    def por(self, dimensao):
+        # Lista de (chave, total); "dia" em ordem cronológica, demais por total decrescente
+        itens = list(self.grupos[dimensao].items())
+        if dimensao == "dia":
+            return sorted(itens)
+        return sorted(itens, key=lambda item: item[1], reverse=True)
+
+def consulta_relatorio(id_viagem, filtro, dimensoes=("destino", "categoria", "meio_pagamento"), moeda_base=None):
+    # SELECT agregado do relatório; executado por gerar_relatorio ou pelas rotas de asgi.py
+    colunas = []
+    for dimensao in dimensoes:
+        colunas.extend(DIMENSOES[dimensao])
+    if moeda_base:
+        colunas.extend((ResumoDespesa.moeda, ResumoDespesa.data))
+
+    query = db.select(*colunas, func.sum(ResumoDespesa.total), func.sum(ResumoDespesa.quantidade))\
+        .select_from(ResumoDespesa)
+    if "destino" in dimensoes:
+        query = query.join(Destino, ResumoDespesa.destino_id == Destino.id)
+    # LEFT JOIN: o id 0 (despesas sem categoria / sem meio de pagamento) não tem correspondente
+    if "categoria" in dimensoes:
+        query = query.outerjoin(CategoriaDespesa, ResumoDespesa.categoria_id == CategoriaDespesa.id)
+    if "meio_pagamento" in dimensoes:
+        query = query.outerjoin(MeioPagamento, ResumoDespesa.meio_pagamento_id == MeioPagamento.id)
+    query = filtro.apply(query.where(ResumoDespesa.viagem_id == id_viagem), ResumoDespesa)
+    if colunas:
+        query = query.group_by(*colunas)
+    return query
+
+def montar_resultado(rows, dimensoes=("destino", "categoria", "meio_pagamento"), moeda_base=None, sessao=None):
+    # sessao: Session usada para carregar cotações ausentes do cache (padrão db.session)
+    largura_dimensoes = sum(len(DIMENSOES[dimensao]) for dimensao in dimensoes)
+    resultado = ResultadoRelatorio(dimensoes)
+    fatores = {}
+    for row in rows:
+        total, quantidade = row[-2], row[-1]
+        if not quantidade:
+            continue
+        total = Decimal(total or 0)
+        if moeda_base:
+            moeda, data = row[largura_dimensoes], row[largura_dimensoes + 1]
+            if moeda != moeda_base:
+                fator = fatores.get((moeda, data))
+                if fator is None:
+                    fator = fatores[(moeda, data)] = cambio_cache.fator(moeda, moeda_base, data, sessao)
+                total = total * fator
+        resultado.total += total
+        resultado.quantidade += quantidade
+        pos = 0
+        for dimensao in dimensoes:
+            largura = len(DIMENSOES[dimensao])
+            if largura == 1:
+                chave = row[pos]
+            else:
+                chave = (row[pos] or None,) + tuple(row[pos + 1:pos + largura])
+            resultado.adicionar(dimensao, chave, total)
+            pos += largura
+    return resultado
+
+def gerar_relatorio(id_viagem, filtro, dimensoes=("destino", "categoria", "meio_pagamento"), moeda_base=None):
+    # moeda_base: converte os totais para essa moeda (TaxaIndisponivel se faltar cotação)
+    rows = db.session.execute(consulta_relatorio(id_viagem, filtro, dimensoes, moeda_base)).all()
+    return montar_resultado(rows, dimensoes, moeda_base)
+
+# --- Gastos de todas as viagens do usuário (GET /viagens?with=summary) ---
+def consulta_gastos_viagens(usuario_id):
+    # Um GROUP BY para todas as viagens: (viagem_id, destino_id, moeda, data, total).
+    # A data só separa grupos em moeda diferente da base, que precisam de cotação do dia
+    data_cotacao = case(
+        (or_(Viagem.moeda_base.is_(None), ResumoDespesa.moeda == Viagem.moeda_base), None),
+        else_=ResumoDespesa.data
+    ).label("data_cotacao")
+    return db.select(
+        ResumoDespesa.viagem_id, ResumoDespesa.destino_id, ResumoDespesa.moeda, data_cotacao,
+        func.sum(ResumoDespesa.total)
+    ).join(Viagem, ResumoDespesa.viagem_id == Viagem.id)\
+        .where(Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None), ResumoDespesa.quantidade > 0)\
+        .group_by(ResumoDespesa.viagem_id, ResumoDespesa.destino_id, ResumoDespesa.moeda, data_cotacao)
+
+def gastos_por_destino(rows, moedas_base, sessao=None):
+    # {destino_id: total na moeda base da viagem}; moedas_base: {viagem_id: moeda ou None}
+    gastos = {}
+    fatores = {}
+    for viagem_id, destino_id, moeda, data, total in rows:
+        total = Decimal(total or 0)
+        moeda_base = moedas_base.get(viagem_id)
+        if data is not None and moeda_base and moeda != moeda_base:
+            fator = fatores.get((moeda, moeda_base, data))
+            if fator is None:
+                fator = fatores[(moeda, moeda_base, data)] = cambio_cache.fator(moeda, moeda_base, data, sessao)
+            total = total * fator
+        gastos[destino_id] = gastos.get(destino_id, Decimal(0)) + total
+    return gastos
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Exclusão adiada de viagens grandes (DELETE /api/viagens/<id>?async=true).
+#
+# A rota só marca Viagem.removida_em e grava os tombstones da sincronização:
+# a viagem some de todas as consultas na hora e a requisição responde 202. A
+# purga apaga as despesas em lotes de PURGA_LOTE_DESPESAS, com um commit por
+# lote, para não segurar a trava de escrita do SQLite enquanto as outras
+# requisições esperam; no fim o DELETE da viagem leva destinos e resumos pelo
+# ON DELETE CASCADE. Roda numa thread (agendada pela rota) e também pelo
+# comando "flask purgar-viagens", que recolhe o que ficou para trás se o
+# processo terminou no meio. Uma purga que falha vai para o log do app e é
+# reagendada até PURGA_MAX_TENTATIVAS vezes, com espera dobrando a cada vez.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, delete
+
+from models.models import db, Viagem, Destino, Despesa
+from services.cache_relatorios import cache_relatorios
+
+PURGA_LOTE_DESPESAS = int(os.getenv("PURGA_LOTE_DESPESAS", "5000"))
+PURGA_MAX_TENTATIVAS = int(os.getenv("PURGA_MAX_TENTATIVAS", "5"))
+PURGA_ESPERA_SECONDS = float(os.getenv("PURGA_ESPERA_SECONDS", "30"))
+
+def purgar_viagens_removidas(lote=PURGA_LOTE_DESPESAS):
+    # Devolve quantas viagens foram apagadas
+    ids = db.session.scalars(select(Viagem.id).where(Viagem.removida_em.is_not(None)).order_by(Viagem.id)).all()
+    for viagem_id in ids:
+        while True:
+            despesas = select(Despesa.id).join(Destino, Despesa.destino_id == Destino.id)\
+                .where(Destino.viagem_id == viagem_id).limit(lote)
+            apagadas = db.session.execute(delete(Despesa).where(Despesa.id.in_(despesas))).rowcount
+            db.session.commit()
+            if apagadas < lote:
+                break
+        db.session.execute(delete(Viagem).where(Viagem.id == viagem_id))
+        db.session.commit()
+        # A rota já descartou os relatórios; uma entrada gravada depois dela sai aqui
+        cache_relatorios.invalidar_viagem(viagem_id)
+    return len(ids)
+
+class PurgaViagens:
+    # Uma thread só; pedidos feitos enquanto uma purga espera na fila são
+    # atendidos por ela, que lê todas as viagens marcadas
+    def __init__(self, max_tentativas=PURGA_MAX_TENTATIVAS, espera_seconds=PURGA_ESPERA_SECONDS):
+        self.max_tentativas = max_tentativas
+        self.espera_seconds = espera_seconds
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purga")
+        self._pendente = False
+        self._lock = threading.Lock()
+
+    def agendar(self, app, tentativa=1):
+        with self._lock:
+            if self._pendente:
+                return None
+            self._pendente = True
+        return self._executor.submit(self._executar, app, tentativa)
+
+    def _executar(self, app, tentativa):
+        with self._lock:
+            # Marcações feitas a partir daqui agendam uma nova purga
+            self._pendente = False
+        with app.app_context():
+            try:
+                return purgar_viagens_removidas()
+            except Exception:
+                db.session.rollback()
+                if tentativa >= self.max_tentativas:
+                    app.logger.exception("Falha na purga de viagens removidas (tentativa %d); "
+                                         "rode 'flask purgar-viagens' para concluí-la", tentativa)
+                    return 0
+                espera = self.espera_seconds * 2 ** (tentativa - 1)
+                app.logger.exception("Falha na purga de viagens removidas (tentativa %d); nova tentativa em %.0fs",
+                                     tentativa, espera)
+        # As viagens continuam marcadas: a próxima tentativa as encontra de novo
+        timer = threading.Timer(espera, self.agendar, (app, tentativa + 1))
+        timer.daemon = True
+        timer.start()
+        return 0
+
+purga_viagens = PurgaViagens()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Manutenção incremental da tabela ResumoDespesa.
+#
+# Cada escrita em Despesa aplica um delta (total, quantidade) ao grupo
+# (viagem, destino, dia, categoria, meio de pagamento, moeda) na mesma sessão,
+# antes do commit da rota. Relatórios e gráficos leem apenas os grupos.
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, func, insert, select, update
+
+from models.models import db, Destino, Despesa, ResumoDespesa, MOEDA_PADRAO
+
+def _chave(destino_id, data, categoria_id, meio_pagamento_id, moeda):
+    return and_(
+        ResumoDespesa.destino_id == destino_id,
+        ResumoDespesa.data == data,
+        ResumoDespesa.categoria_id == (categoria_id or 0),
+        ResumoDespesa.meio_pagamento_id == (meio_pagamento_id or 0),
+        ResumoDespesa.moeda == moeda
+    )
+
+def aplicar_delta(viagem_id, destino_id, data, categoria_id, meio_pagamento_id, moeda, valor, quantidade):
+    valor = Decimal(str(valor))
+    chave = _chave(destino_id, data, categoria_id, meio_pagamento_id, moeda)
+    atualizados = db.session.execute(
+        update(ResumoDespesa).where(chave).values(
+            total=ResumoDespesa.total + valor,
+            quantidade=ResumoDespesa.quantidade + quantidade
+        )
+    ).rowcount
+    if not atualizados:
+        db.session.execute(insert(ResumoDespesa).values(
+            viagem_id=viagem_id,
+            destino_id=destino_id,
+            data=data,
+            categoria_id=categoria_id or 0,
+            meio_pagamento_id=meio_pagamento_id or 0,
+            moeda=moeda,
+            total=valor,
+            quantidade=quantidade
+        ))
+    elif quantidade < 0:
+        # Grupo esvaziado: remove a linha para o custo continuar proporcional aos grupos existentes
+        db.session.execute(delete(ResumoDespesa).where(chave, ResumoDespesa.quantidade <= 0))
+
+def registrar_despesa(viagem_id, despesa, sinal=1):
+    # sinal=1 soma a despesa ao resumo, sinal=-1 retira
+    aplicar_delta(
+        viagem_id, despesa.destino_id, despesa.data, despesa.categoria_id, despesa.meio_pagamento_id,
+        despesa.moeda or MOEDA_PADRAO, Decimal(str(despesa.valor)) * sinal, sinal
+    )
+
+# --- Verificação de consistência ---
+def _agregado_despesas(viagem_id=None):
+    # Os grupos como deveriam estar, calculados direto de Despesa
+    query = select(
+            Destino.viagem_id,
+            Despesa.destino_id,
+            Despesa.data,
+            func.coalesce(Despesa.categoria_id, 0),
+            func.coalesce(Despesa.meio_pagamento_id, 0),
+            Despesa.moeda,
+            func.sum(Despesa.valor),
+            func.count(Despesa.id)
+        ).join(Destino, Despesa.destino_id == Destino.id)\
+        .group_by(Destino.viagem_id, Despesa.destino_id, Despesa.data,
+                  func.coalesce(Despesa.categoria_id, 0), func.coalesce(Despesa.meio_pagamento_id, 0), Despesa.moeda)
+    if viagem_id is not None:
+        query = query.where(Destino.viagem_id == viagem_id)
+    return query
+
+def reconstruir_resumos(viagem_id=None, conn=None):
+    conn = conn if conn is not None else db.session
+    limpar = delete(ResumoDespesa)
+    if viagem_id is not None:
+        limpar = limpar.where(ResumoDespesa.viagem_id == viagem_id)
+    conn.execute(limpar)
+    conn.execute(insert(ResumoDespesa).from_select(
+        ["viagem_id", "destino_id", "data", "categoria_id", "meio_pagamento_id", "moeda", "total", "quantidade"],
+        _agregado_despesas(viagem_id)
+    ))
+
+def verificar_resumos(viagem_id=None):
+    # Compara os grupos esperados com os gravados; devolve a lista de divergências
+    esperado = {
+        tuple(row[:6]): (Decimal(str(row[6] or 0)), row[7])
+        for row in db.session.execute(_agregado_despesas(viagem_id))
+    }
+    query = select(
+            ResumoDespesa.viagem_id,
+            ResumoDespesa.destino_id,
+            ResumoDespesa.data,
+            ResumoDespesa.categoria_id,
+            ResumoDespesa.meio_pagamento_id,
+            ResumoDespesa.moeda,
+            ResumoDespesa.total,
+            ResumoDespesa.quantidade
+        )
+    if viagem_id is not None:
+        query = query.where(ResumoDespesa.viagem_id == viagem_id)
+    atual = {
+        tuple(row[:6]): (Decimal(str(row[6] or 0)), row[7])
+        for row in db.session.execute(query)
+    }
+
+    divergencias = []
+    for chave in sorted(set(esperado) | set(atual), key=str):
+        if esperado.get(chave) != atual.get(chave):
+            divergencias.append({"chave": chave, "esperado": esperado.get(chave), "atual": atual.get(chave)})
+    return divergencias
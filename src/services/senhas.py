@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Hash e verificação de senhas fora do fluxo normal da requisição.
+#
+# O PBKDF2 roda num pool de threads pequeno e limitado (hashlib libera o GIL
+# durante o cálculo). Quando o pool e a fila estão ocupados, a chamada falha
+# na hora com SenhasOcupadas em vez de empilhar requisições atrás de um pico
+# de logins; a rota responde 503 com Retry-After.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Custo do PBKDF2 para hashes novos (hashes antigos guardam o próprio custo)
+SENHA_PBKDF2_ITERACOES = int(os.getenv("SENHA_PBKDF2_ITERACOES", "1000000"))
+SENHA_HASH_WORKERS = int(os.getenv("SENHA_HASH_WORKERS", "2"))
+# Máximo de cálculos aceitos ao mesmo tempo (em execução + aguardando no pool)
+SENHA_HASH_FILA_MAX = int(os.getenv("SENHA_HASH_FILA_MAX", "16"))
+SENHA_HASH_TIMEOUT_SECONDS = float(os.getenv("SENHA_HASH_TIMEOUT_SECONDS", "10"))
+
+class SenhasOcupadas(RuntimeError):
+    pass
+
+class ExecutorSenhas:
+    def __init__(self, workers, fila_max, timeout):
+        self.timeout = timeout
+        self.rejeitadas = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="senhas")
+        self._vagas = threading.BoundedSemaphore(max(fila_max, workers))
+
+    def executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            self.rejeitadas += 1
+            raise SenhasOcupadas("Muitas verificações de senha em andamento")
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise SenhasOcupadas("Tempo esgotado na verificação de senha")
+
+executor_senhas = ExecutorSenhas(SENHA_HASH_WORKERS, SENHA_HASH_FILA_MAX, SENHA_HASH_TIMEOUT_SECONDS)
+
+def gerar_hash_senha(senha):
+    return executor_senhas.executar(
+        generate_password_hash, senha, f"pbkdf2:sha256:{SENHA_PBKDF2_ITERACOES}")
+
+def verificar_senha(senha_hash, senha):
+    return executor_senhas.executar(check_password_hash, senha_hash, senha)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Contadores de versão usados nos ETags das rotas GET.
+#
+# Viagem.versao muda a cada escrita na viagem, nos destinos ou nas despesas
+# dela; Usuario.versao_viagens muda com qualquer uma dessas escritas do
+# usuário (lista de viagens); Usuario.versao_listas muda com as categorias e
+# meios de pagamento. Os incrementos são UPDATEs na mesma transação da rota.
+# VersaoCambio muda a cada carga de cotações (flask carregar-cambio): entra na
+# versão das viagens, que alimenta os ETags dos relatórios e da lista com
+# resumo e as chaves do cache de relatórios, e faz cada processo recarregar
+# as séries do cambio_cache.
+from sqlalchemy import select, update, insert, func
+
+from models.models import db, Usuario, Viagem, Destino, Despesa, VersaoCambio
+from services.cache_relatorios import cache_relatorios
+
+def incrementar_versao_viagem(viagem_id, usuario_id):
+    db.session.execute(update(Viagem).where(Viagem.id == viagem_id).values(versao=Viagem.versao + 1))
+    incrementar_versao_viagens(usuario_id)
+    # Os relatórios em cache das outras viagens continuam válidos
+    cache_relatorios.invalidar_viagem(viagem_id)
+    if db.session.info.get("lote_atomico"):
+        # Lote atômico (POST /api/batch): se for desfeito, o lote descarta de novo
+        # os relatórios destas viagens, pois a versão N+1 ainda não existe
+        db.session.info.setdefault("viagens_alteradas", set()).add(viagem_id)
+
+def incrementar_versao_viagens(usuario_id):
+    db.session.execute(update(Usuario).where(Usuario.id == usuario_id).values(versao_viagens=Usuario.versao_viagens + 1))
+
+def incrementar_versao_listas(usuario_id):
+    db.session.execute(update(Usuario).where(Usuario.id == usuario_id).values(versao_listas=Usuario.versao_listas + 1))
+
+def incrementar_versao_cambio():
+    if not db.session.execute(update(VersaoCambio).where(VersaoCambio.id == 1).values(versao=VersaoCambio.versao + 1)).rowcount:
+        db.session.execute(insert(VersaoCambio).values(id=1, versao=1))
+
+# --- Leituras: uma consulta por requisição, que também confere a propriedade ---
+# As consultas_* devolvem o SELECT (executado também pelas rotas assíncronas de asgi.py)
+def _versao_cambio():
+    # 0 antes da primeira carga de cotações
+    return select(func.coalesce(func.max(VersaoCambio.versao), 0)).scalar_subquery()
+
+def consulta_versao_viagem(usuario_id, viagem_id):
+    # (versao da viagem, versao das listas, versao do câmbio) ou nenhuma linha se a
+    # viagem não for do usuário ou estiver removida (exclusão adiada)
+    return select(Viagem.versao, Usuario.versao_listas, _versao_cambio())\
+        .join(Usuario, Viagem.usuario_id == Usuario.id)\
+        .where(Viagem.id == viagem_id, Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+
+def consulta_versao_destino(usuario_id, destino_id):
+    return select(Viagem.versao, Usuario.versao_listas)\
+        .select_from(Destino)\
+        .join(Viagem, Destino.viagem_id == Viagem.id)\
+        .join(Usuario, Viagem.usuario_id == Usuario.id)\
+        .where(Destino.id == destino_id, Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+
+def consulta_versao_viagens(usuario_id):
+    return select(Usuario.versao_viagens).where(Usuario.id == usuario_id)
+
+def consulta_versao_viagens_cambio(usuario_id):
+    # (versao_viagens, versao do câmbio): para respostas com totais convertidos
+    return select(Usuario.versao_viagens, _versao_cambio()).where(Usuario.id == usuario_id)
+
+def versao_viagem(usuario_id, viagem_id):
+    return db.session.execute(consulta_versao_viagem(usuario_id, viagem_id)).first()
+
+def versao_destino(usuario_id, destino_id):
+    return db.session.execute(consulta_versao_destino(usuario_id, destino_id)).first()
+
+def versao_despesa(usuario_id, despesa_id):
+    return db.session.execute(
+        select(Viagem.versao, Usuario.versao_listas)
+        .select_from(Despesa)
+        .join(Destino, Despesa.destino_id == Destino.id)
+        .join(Viagem, Destino.viagem_id == Viagem.id)
+        .join(Usuario, Viagem.usuario_id == Usuario.id)
+        .where(Despesa.id == despesa_id, Viagem.usuario_id == usuario_id, Viagem.removida_em.is_(None))
+    ).first()
+
+def versao_viagens(usuario_id):
+    return db.session.execute(consulta_versao_viagens(usuario_id)).scalar()
+
+def versao_viagens_cambio(usuario_id):
+    return db.session.execute(consulta_versao_viagens_cambio(usuario_id)).first()
+
+def versao_listas(usuario_id):
+    return db.session.execute(select(Usuario.versao_listas).where(Usuario.id == usuario_id)).scalar()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Configuração do engine do banco a partir de variáveis de ambiente.
+#
+# DATABASE_URL escolhe o backend (padrão: SQLite em travel_finance.db na raiz
+# do projeto). Para SQLite são aplicados PRAGMAs em cada nova conexão
+# (foreign_keys e, com SQLITE_TUNING, WAL, synchronous=NORMAL, busy_timeout,
+# mmap, cache); para MySQL / PostgreSQL são usadas as opções de pool.
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "travel_finance.db")
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+def _env_bool(name, default):
+    return os.getenv(name, "1" if default else "0").lower() in ("1", "true", "yes", "on")
+
+def database_config():
+    url = os.getenv("DATABASE_URL") or f"sqlite:///{os.path.abspath(DEFAULT_SQLITE_PATH)}"
+    config = {
+        "SQLALCHEMY_DATABASE_URI": url,
+        # PRAGMAs aplicados às conexões SQLite (SQLITE_TUNING=0 mantém os padrões do SQLite)
+        "SQLITE_TUNING": _env_bool("SQLITE_TUNING", True),
+        "SQLITE_JOURNAL_MODE": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "SQLITE_SYNCHRONOUS": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "SQLITE_BUSY_TIMEOUT_MS": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "SQLITE_MMAP_SIZE": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        "SQLITE_CACHE_SIZE_KB": _env_int("SQLITE_CACHE_SIZE_KB", 64 * 1024),
+    }
+    if url.startswith("sqlite"):
+        config["SQLALCHEMY_ENGINE_OPTIONS"] = {}
+    else:
+        config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_size": _env_int("DB_POOL_SIZE", 10),
+            "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+            "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+            "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+            "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        }
+    return config
+
+def configure_engine(app, engine):
+    # Chamado uma vez por app, com o engine já criado pelo Flask-SQLAlchemy
+    if engine.dialect.name != "sqlite":
+        return
+
+    # foreign_keys não é ajuste de desempenho: o ON DELETE CASCADE depende dele
+    pragmas = ["PRAGMA foreign_keys=ON"]
+    if app.config.get("SQLITE_TUNING"):
+        pragmas += _pragmas_desempenho(app)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+def _pragmas_desempenho(app):
+    return [
+        f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}",
+        # Valor negativo = tamanho em KiB, independente do page_size
+        f"PRAGMA cache_size=-{int(app.config['SQLITE_CACHE_SIZE_KB'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+# --- Modo assíncrono (asgi.py): mesmo DATABASE_URL com o driver async equivalente ---
+DRIVERS_ASYNC = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_database_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in DRIVERS_ASYNC:
+        raise ValueError(f"Backend sem driver assíncrono configurado: {backend}")
+    return url.set(drivername=DRIVERS_ASYNC[backend])
+
+def create_async_engine_for(app):
+    # Engine assíncrono com as mesmas opções de pool e os mesmos PRAGMAs do engine síncrono
+    from sqlalchemy.ext.asyncio import create_async_engine
+    engine = create_async_engine(
+        async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    )
+    configure_engine(app, engine.sync_engine)
+    return engine
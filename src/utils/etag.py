@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+from flask import request, make_response
+
+def calcular_etag(caminho, usuario_id, *partes):
+    # caminho no formato de request.full_path ("/rota?query"), para o mesmo ETag em WSGI e ASGI.
+    # O usuário entra no hash: contadores iguais de usuários diferentes não geram o mesmo ETag
+    raw = f"{usuario_id}|" + ":".join(str(p) for p in partes) + "|" + caminho
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+def gerar_etag(usuario_id, *partes):
+    # Combina o usuário e os contadores de versão com o caminho e a query string da requisição
+    return calcular_etag(request.full_path, usuario_id, *partes)
+
+def nao_modificado(etag):
+    # Resposta 304 se o cliente já tem esta versão (If-None-Match), senão None
+    if request.if_none_match and request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def com_etag(response, etag):
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Instrumentação por requisição: tempo total, número de comandos SQL e tempo
+# gasto no banco, medidos com eventos do engine do SQLAlchemy.
+#
+# Cada resposta recebe um cabeçalho Server-Timing e os valores alimentam
+# histogramas por endpoint expostos em formato texto do Prometheus em /metrics.
+# O cabeçalho sai antes do corpo; os histogramas são gravados quando a resposta
+# é fechada, para contar também os comandos das exportações em streaming.
+#
+# /metrics só existe com METRICS_TOKEN definido e exige
+# "Authorization: Bearer <METRICS_TOKEN>".
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import request, Response, jsonify
+from sqlalchemy import event
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_QUERIES = (1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# [quantidade de comandos, segundos no banco] da requisição corrente
+_sql_atual = ContextVar("sql_atual", default=None)
+
+class Histograma:
+    def __init__(self, nome, descricao, buckets):
+        self.nome = nome
+        self.descricao = descricao
+        self.buckets = buckets
+        self._series = {}
+
+    def observar(self, labels, valor):
+        serie = self._series.get(labels)
+        if serie is None:
+            serie = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                serie[0][i] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        for labels, (contagens, soma, total) in sorted(self._series.items()):
+            base = ",".join(f'{k}="{v}"' for k, v in labels)
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append(f'{self.nome}_bucket{{{base},le="{limite}"}} {contagem}')
+            linhas.append(f'{self.nome}_bucket{{{base},le="+Inf"}} {total}')
+            linhas.append(f"{self.nome}_sum{{{base}}} {soma}")
+            linhas.append(f"{self.nome}_count{{{base}}} {total}")
+        return linhas
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencia = Histograma("http_request_duration_seconds", "Tempo total da requisição por endpoint.", BUCKETS_LATENCIA)
+        self.queries = Histograma("sql_queries_per_request", "Comandos SQL emitidos por requisição.", BUCKETS_QUERIES)
+        self.tempo_sql = Histograma("sql_duration_seconds", "Tempo gasto no banco por requisição.", BUCKETS_LATENCIA)
+
+    def registrar(self, endpoint, metodo, status, duracao, queries, tempo_sql):
+        labels = (("endpoint", endpoint), ("method", metodo), ("status", str(status)))
+        with self._lock:
+            self.latencia.observar(labels, duracao)
+            self.queries.observar(labels, queries)
+            self.tempo_sql.observar(labels, tempo_sql)
+
+    def exportar(self, extras=()):
+        with self._lock:
+            linhas = self.latencia.exportar() + self.queries.exportar() + self.tempo_sql.exportar()
+        linhas.extend(extras)
+        return "\n".join(linhas) + "\n"
+
+metricas = Metricas()
+
+def _metricas_cache_tokens():
+    from services.principal_cache import principal_cache
+    stats = principal_cache.stats()
+    return [
+        "# TYPE auth_cache_hits_total counter",
+        f"auth_cache_hits_total {stats['hits']}",
+        "# TYPE auth_cache_misses_total counter",
+        f"auth_cache_misses_total {stats['misses']}",
+        "# TYPE auth_cache_entries gauge",
+        f"auth_cache_entries {stats['entries']}",
+    ]
+
+def _metricas_cache_listas():
+    from services.listas_cache import listas_cache
+    from services.senhas import executor_senhas
+    stats = listas_cache.stats()
+    return [
+        "# TYPE listas_cache_hits_total counter",
+        f"listas_cache_hits_total {stats['hits']}",
+        "# TYPE listas_cache_misses_total counter",
+        f"listas_cache_misses_total {stats['misses']}",
+        "# TYPE listas_cache_entries gauge",
+        f"listas_cache_entries {stats['entries']}",
+        "# TYPE senhas_rejeitadas_total counter",
+        f"senhas_rejeitadas_total {executor_senhas.rejeitadas}",
+    ]
+
+def _metricas_cache_relatorios():
+    from services.cache_relatorios import cache_relatorios
+    stats = cache_relatorios.stats()
+    return [
+        "# TYPE relatorio_cache_hits_total counter",
+        f"relatorio_cache_hits_total {stats['hits']}",
+        "# TYPE relatorio_cache_misses_total counter",
+        f"relatorio_cache_misses_total {stats['misses']}",
+        "# TYPE relatorio_cache_entries gauge",
+        f"relatorio_cache_entries {stats['entries']}",
+        "# TYPE relatorio_cache_bytes gauge",
+        f"relatorio_cache_bytes {stats['bytes']}",
+    ]
+
+def init_instrumentacao(app, engine, token=None):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes_sql(conn, cursor, statement, parameters, context, executemany):
+        conn.info["sql_inicio"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _depois_sql(conn, cursor, statement, parameters, context, executemany):
+        atual = _sql_atual.get()
+        if atual is not None:
+            atual[0] += 1
+            atual[1] += time.perf_counter() - conn.info.pop("sql_inicio", time.perf_counter())
+
+    @app.before_request
+    def _inicio_requisicao():
+        request.environ["instrumentacao.inicio"] = time.perf_counter()
+        _sql_atual.set([0, 0.0])
+
+    @app.after_request
+    def _fim_requisicao(response):
+        inicio = request.environ.get("instrumentacao.inicio")
+        atual = _sql_atual.get()
+        if inicio is None or atual is None:
+            return response
+        duracao = time.perf_counter() - inicio
+        queries, tempo_sql = atual
+        response.headers.add(
+            "Server-Timing",
+            f'app;dur={duracao * 1000:.1f}, db;dur={tempo_sql * 1000:.1f};desc="{queries} queries"'
+        )
+        endpoint, metodo, status = request.endpoint or "desconhecido", request.method, response.status_code
+
+        def _registrar():
+            # Depois do último pedaço do corpo: inclui o que o gerador consultou
+            _sql_atual.set(None)
+            metricas.registrar(endpoint, metodo, status, time.perf_counter() - inicio, atual[0], atual[1])
+        response.call_on_close(_registrar)
+        return response
+
+    if not token:
+        return
+
+    @app.route("/metrics")
+    def metrics():
+        cabecalho = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(cabecalho.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return jsonify({"message": "Token de métricas inválido"}), 401
+        return Response(metricas.exportar(_metricas_cache_tokens() + _metricas_cache_listas() + _metricas_cache_relatorios()), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import base64
+from datetime import datetime
+
+# --- Paginação por cursor (keyset) sobre a chave (data, id) ---
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+def parse_limit(limit_str):
+    # Aplica o default e o teto ao parâmetro "limit" da query string
+    if not limit_str:
+        return DEFAULT_PAGE_LIMIT
+    limit = int(limit_str)
+    if limit < 1:
+        raise ValueError("limit deve ser positivo")
+    return min(limit, MAX_PAGE_LIMIT)
+
+def encode_cursor(data, id_):
+    # Cursor opaco gerado a partir da última linha (data, id) da página
+    raw = f"{data.isoformat()}|{id_}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    # Inverso de encode_cursor; levanta ValueError se o cursor for inválido
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        data_str, id_str = raw.split("|", 1)
+        return datetime.strptime(data_str, "%Y-%m-%d").date(), int(id_str)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("cursor inválido") from e
+
+# --- Cursor para ordenações por relevância: chave (rank, id) ---
+def encode_rank_cursor(rank, id_):
+    # rank já arredondado para inteiro pela consulta: a comparação da próxima página é exata
+    raw = f"{int(rank)}|{id_}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_rank_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        rank_str, id_str = raw.split("|", 1)
+        return int(rank_str), int(id_str)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("cursor inválido") from e
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Camada de serialização das respostas da API.
+#
+# Cada Encoder é montado uma vez a partir da lista (chave, coluna, conversor):
+# "colunas" alimenta um select só de colunas (sem objetos ORM nem identity map)
+# e "linha" transforma cada tupla do resultado em dict com dict(zip(...)),
+# aplicando depois só os conversores das colunas que têm um. "objeto" lê os
+# atributos de uma instância com operator.attrgetter e reusa "linha".
+# O provider JSON usa orjson quando instalado e cai para o json padrão.
+import json
+import operator
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+from models.models import Viagem, Destino, Despesa, CategoriaDespesa, MeioPagamento
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+# --- Conversores ---
+def data_iso(valor):
+    return valor.isoformat() if valor is not None else None
+
+def numero(valor):
+    return float(valor) if valor is not None else None
+
+class Encoder:
+    def __init__(self, campos):
+        # campos: sequência de (chave, coluna, conversor ou None)
+        self.chaves = chaves = tuple(chave for chave, _, _ in campos)
+        self.colunas = tuple(coluna for _, coluna, _ in campos)
+        # Só os campos com conversor são revisitados depois do dict(zip(...))
+        convertidos = tuple((chave, i, conv) for i, (chave, _, conv) in enumerate(campos) if conv)
+        ler = operator.attrgetter(*(coluna.key for _, coluna, _ in campos))
+
+        def linha(r):
+            item = dict(zip(chaves, r))
+            for chave, i, conv in convertidos:
+                item[chave] = conv(r[i])
+            return item
+
+        self.linha = linha
+        # attrgetter de um único atributo devolve o valor, não uma tupla
+        self.objeto = (lambda o: linha((ler(o),))) if len(campos) == 1 else (lambda o: linha(ler(o)))
+
+    def linhas(self, rows):
+        linha = self.linha
+        return [linha(r) for r in rows]
+
+# --- Encoders por modelo ---
+VIAGEM_CAMPOS = (
+    ("id", Viagem.id, None),
+    ("nome_viagem", Viagem.nome_viagem, None),
+    ("data_inicio", Viagem.data_inicio, data_iso),
+    ("data_fim", Viagem.data_fim, data_iso),
+    ("orcamento_total", Viagem.orcamento_total, numero),
+    ("moeda_base", Viagem.moeda_base, None),
+)
+DESTINO_CAMPOS = (
+    ("id", Destino.id, None),
+    ("nome_cidade", Destino.nome_cidade, None),
+    ("data_chegada", Destino.data_chegada, data_iso),
+    ("data_partida", Destino.data_partida, data_iso),
+    ("orcamento_destino", Destino.orcamento_destino, numero),
+)
+DESPESA_CAMPOS = (
+    ("id", Despesa.id, None),
+    ("descricao", Despesa.descricao, None),
+    ("valor", Despesa.valor, numero),
+    ("data", Despesa.data, data_iso),
+    ("observacoes", Despesa.observacoes, None),
+    ("categoria_id", Despesa.categoria_id, None),
+    ("meio_pagamento_id", Despesa.meio_pagamento_id, None),
+    ("moeda", Despesa.moeda, None),
+)
+
+viagem_encoder = Encoder(VIAGEM_CAMPOS)
+destino_encoder = Encoder(DESTINO_CAMPOS)
+destino_completo_encoder = Encoder(DESTINO_CAMPOS + (("viagem_id", Destino.viagem_id, None),))
+despesa_encoder = Encoder(DESPESA_CAMPOS)
+despesa_completa_encoder = Encoder(DESPESA_CAMPOS + (("destino_id", Despesa.destino_id, None),))
+# Listagem com os nomes vindos de LEFT JOIN em CategoriaDespesa e MeioPagamento
+despesa_lista_encoder = Encoder(DESPESA_CAMPOS + (
+    ("categoria_nome", CategoriaDespesa.nome, None),
+    ("meio_pagamento_nome", MeioPagamento.nome, None),
+))
+# Busca textual: inclui destino e viagem, pois cobre todas as viagens do usuário
+despesa_busca_encoder = Encoder(DESPESA_CAMPOS + (
+    ("destino_id", Despesa.destino_id, None),
+    ("viagem_id", Destino.viagem_id, None),
+    ("categoria_nome", CategoriaDespesa.nome, None),
+    ("meio_pagamento_nome", MeioPagamento.nome, None),
+))
+categoria_encoder = Encoder((("id", CategoriaDespesa.id, None), ("nome", CategoriaDespesa.nome, None)))
+meio_pagamento_encoder = Encoder((("id", MeioPagamento.id, None), ("nome", MeioPagamento.nome, None)))
+
+# --- JSON ---
+def _default(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify/request.get_json com orjson; indentação (modo debug) continua no json padrão
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
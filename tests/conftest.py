@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Fixtures comuns: app com banco SQLite temporário (schema completo, migrações aplicadas).
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'teste.db'}")
+    from main import create_app
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    from models.models import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+@pytest.fixture()
+def auth(client):
+    resposta = client.post("/auth/login", json={"username": "admin", "password": "admin_password"})
+    assert resposta.status_code == 200, resposta.data
+    return {"Authorization": f"Bearer {resposta.get_json()['token']}"}
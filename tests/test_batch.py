@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# POST /api/batch atômico: um lote desfeito não deixa relatório nem ETag da
+# versão que nunca foi confirmada.
+
+def test_lote_desfeito_nao_deixa_relatorio(client, auth):
+    viagem = client.post("/api/viagens", json={"nome_viagem": "x"}, headers=auth).get_json()
+    destino = client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": "A"}, headers=auth).get_json()
+    url = f"/api/viagens/{viagem['id']}/relatorio/geral"
+    antes = client.get(url, headers=auth)
+
+    lote = client.post("/api/batch", headers=auth, json={"atomico": True, "requests": [
+        {"id": "d", "method": "POST", "path": f"/api/destinos/{destino['id']}/despesas",
+         "body": {"descricao": "a", "valor": 10, "data": "2024-01-02"}},
+        {"id": "r", "method": "GET", "path": url},
+        {"id": "erro", "method": "GET", "path": "/api/viagens/999999"},
+    ]}).get_json()
+    assert lote["confirmado"] is False
+    relatorio = lote["responses"][1]
+    assert relatorio["body"]["total_gasto_geral"] == 10.0
+    assert "headers" not in relatorio
+
+    depois = client.get(url, headers={**auth, "If-None-Match": antes.headers["ETag"]})
+    assert depois.status_code == 304
+    assert client.get(url, headers=auth).get_json()["total_gasto_geral"] == 0
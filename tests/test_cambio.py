@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Cotações carregadas por outro processo (flask carregar-cambio): os ETags e o
+# cache de relatórios seguem a versão do câmbio gravada no banco.
+import io
+
+from sqlalchemy import text
+
+from models.models import db
+from services.cambio import carregar_taxas
+
+def _carga_externa(app, taxa):
+    # Como o comando faria em outro processo: só o banco muda, nenhum cache em memória
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE TaxaCambio SET taxa = :t WHERE moeda = 'BRL'"), {"t": taxa})
+            conn.execute(text("UPDATE VersaoCambio SET versao = versao + 1"))
+
+def test_relatorio_segue_a_versao_do_cambio(app, client, auth):
+    with app.app_context():
+        carregar_taxas(io.StringIO("moeda,data,taxa\nUSD,2024-01-01,1\nBRL,2024-01-01,5\n"))
+    viagem = client.post("/api/viagens", json={"nome_viagem": "x", "moeda_base": "BRL"}, headers=auth).get_json()
+    destino = client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": "A"}, headers=auth).get_json()
+    client.post(f"/api/destinos/{destino['id']}/despesas",
+                json={"descricao": "a", "valor": 10, "data": "2024-01-02", "moeda": "USD"}, headers=auth)
+
+    url = f"/api/viagens/{viagem['id']}/relatorio/geral"
+    primeira = client.get(url, headers=auth)
+    assert primeira.get_json()["total_gasto_geral"] == 50.0
+    resumo = client.get("/api/viagens?with=summary", headers=auth)
+
+    _carga_externa(app, 6)
+    segunda = client.get(url, headers={**auth, "If-None-Match": primeira.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.get_json()["total_gasto_geral"] == 60.0
+    resumo_novo = client.get("/api/viagens?with=summary", headers={**auth, "If-None-Match": resumo.headers["ETag"]})
+    assert resumo_novo.status_code == 200
+    assert resumo_novo.get_json()[0]["resumo"]["total_gasto"] == 60.0
+
+def test_analytics_segue_a_versao_do_cambio(app, client, auth):
+    with app.app_context():
+        carregar_taxas(io.StringIO("moeda,data,taxa\nUSD,2024-01-01,1\nBRL,2024-01-01,5\n"))
+    viagem = client.post("/api/viagens", json={"nome_viagem": "x"}, headers=auth).get_json()
+    destino = client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": "A"}, headers=auth).get_json()
+    client.post(f"/api/destinos/{destino['id']}/despesas",
+                json={"descricao": "a", "valor": 10, "data": "2024-01-02", "moeda": "USD"}, headers=auth)
+
+    primeira = client.get("/api/analytics?moeda=BRL", headers=auth)
+    assert primeira.get_json()["total"] == 50.0
+    _carga_externa(app, 6)
+    segunda = client.get("/api/analytics?moeda=BRL", headers={**auth, "If-None-Match": primeira.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.get_json()["total"] == 60.0
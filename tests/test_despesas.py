@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Criação e edição de despesas: categoria e meio de pagamento aceitam o id
+# como número ou texto, e só se pertencerem ao usuário.
+
+def _destino(client, auth):
+    viagem = client.post("/api/viagens", json={"nome_viagem": "x"}, headers=auth).get_json()
+    return client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": "A"}, headers=auth).get_json()
+
+def test_ids_das_listas_como_texto(client, auth):
+    destino = _destino(client, auth)
+    categoria = client.post("/api/categorias", json={"nome": "Comida"}, headers=auth).get_json()
+    despesa = {"descricao": "a", "valor": 10, "data": "2024-01-02", "categoria_id": str(categoria["id"])}
+
+    criada = client.post(f"/api/destinos/{destino['id']}/despesas", json=despesa, headers=auth)
+    assert criada.status_code == 201, criada.data
+    assert criada.get_json()["categoria_id"] == categoria["id"]
+
+    url = f"/api/despesas/{criada.get_json()['id']}"
+    assert client.put(url, json={"categoria_id": "abc"}, headers=auth).status_code == 400
+    assert client.put(url, json={"categoria_id": str(categoria["id"] + 1000)}, headers=auth).status_code == 400
+    assert client.put(url, json={"categoria_id": None}, headers=auth).status_code == 200
+    assert client.put(url, json={"categoria_id": str(categoria["id"])}, headers=auth).status_code == 200
+    assert client.get(url, headers=auth).get_json()["categoria_id"] == categoria["id"]
+
+def test_ids_invalidos_na_criacao(client, auth):
+    destino = _destino(client, auth)
+    despesa = {"descricao": "a", "valor": 10, "data": "2024-01-02"}
+    for campo in ("categoria_id", "meio_pagamento_id"):
+        resposta = client.post(f"/api/destinos/{destino['id']}/despesas", json={**despesa, campo: "x1"}, headers=auth)
+        assert resposta.status_code == 400
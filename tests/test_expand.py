@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# GET /viagens/<id>?expand=...: o número de comandos SQL não depende de
+# quantos destinos e despesas a viagem tem.
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models.models import db
+
+EXPAND = "destinos,despesas,categorias,meios_pagamento"
+
+@contextmanager
+def contar_comandos(app):
+    comandos = []
+    with app.app_context():
+        engine = db.engine
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    event.listen(engine, "before_cursor_execute", contar)
+    try:
+        yield comandos
+    finally:
+        event.remove(engine, "before_cursor_execute", contar)
+
+def criar_viagem(client, auth, destinos, despesas_por_destino):
+    viagem = client.post("/api/viagens", json={"nome_viagem": f"{destinos} destinos"}, headers=auth).get_json()
+    for i in range(destinos):
+        destino = client.post(f"/api/viagens/{viagem['id']}/destinos", json={"nome_cidade": f"Cidade {i}"}, headers=auth).get_json()
+        for j in range(despesas_por_destino):
+            client.post(f"/api/destinos/{destino['id']}/despesas",
+                        json={"descricao": f"Despesa {j}", "valor": 10, "data": "2024-01-01"}, headers=auth)
+    return viagem["id"]
+
+def comandos_expand(app, client, auth, viagem_id):
+    with contar_comandos(app) as comandos:
+        resposta = client.get(f"/api/viagens/{viagem_id}?expand={EXPAND}", headers=auth)
+    assert resposta.status_code == 200
+    return resposta.get_json(), len(comandos)
+
+def test_expand_numero_fixo_de_comandos(app, client, auth):
+    client.post("/api/categorias", json={"nome": "Transporte"}, headers=auth)
+    pequena = criar_viagem(client, auth, 1, 1)
+    grande = criar_viagem(client, auth, 6, 4)
+
+    dados_pequena, comandos_pequena = comandos_expand(app, client, auth, pequena)
+    dados_grande, comandos_grande = comandos_expand(app, client, auth, grande)
+
+    assert len(dados_pequena["destinos"]) == 1
+    assert len(dados_grande["destinos"]) == 6
+    assert all(len(d["despesas"]) == 4 for d in dados_grande["destinos"])
+    assert 0 < comandos_pequena == comandos_grande
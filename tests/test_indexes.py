@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# EXPLAIN QUERY PLAN das consultas principais de cada blueprint: devem buscar
+# pelos índices da migração 0001, sem varrer a tabela inteira.
+import pytest
+
+from models.models import db, Despesa
+from routes.despesa_routes import consulta_despesas_destino
+from routes.dropdown_routes import consulta_em_uso
+from routes.viagem_routes import consulta_viagens_usuario, consulta_destinos_viagem, consulta_destinos_usuario
+from services.listas_cache import consulta_categorias, consulta_meios_pagamento
+from services.relatorio_engine import FiltroRelatorio, consulta_relatorio
+
+def plano(query):
+    compilado = query.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+    linhas = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {compilado}")).all()
+    return [linha[-1] for linha in linhas]
+
+def usa_indice(query, tabela, indice):
+    detalhes = plano(query)
+    assert any(indice in d for d in detalhes), detalhes
+    # Nenhuma varredura completa da tabela (SCAN sem índice)
+    assert not any(d.startswith(f"SCAN {tabela}") and "INDEX" not in d for d in detalhes), detalhes
+
+CONSULTAS = {
+    "viagens": (lambda: consulta_viagens_usuario(1), "Viagem", "ix_viagem_usuario"),
+    "destinos": (lambda: consulta_destinos_viagem(1), "Destino", "ix_destino_viagem"),
+    "destinos_usuario": (lambda: consulta_destinos_usuario(1), "Viagem", "ix_viagem_usuario"),
+    "despesas": (lambda: consulta_despesas_destino(1, {"data_inicio": "2024-01-01"}, None, 50), "Despesa", "ix_despesa_destino_data"),
+    "categorias": (lambda: consulta_categorias(1), "CategoriaDespesa", "uq_categoria_usuario"),
+    "meios_pagamento": (lambda: consulta_meios_pagamento(1), "MeioPagamento", "uq_meiopagamento_usuario"),
+    "categoria_em_uso": (lambda: consulta_em_uso(Despesa.categoria_id, 1), "Despesa", "ix_despesa_categoria"),
+    "meio_pagamento_em_uso": (lambda: consulta_em_uso(Despesa.meio_pagamento_id, 1), "Despesa", "ix_despesa_meio_pagamento"),
+    "relatorio": (lambda: consulta_relatorio(1, FiltroRelatorio.from_args({})), "ResumoDespesa", "ix_resumo_viagem"),
+}
+
+@pytest.mark.parametrize("nome", sorted(CONSULTAS))
+def test_consulta_usa_indice(app, nome):
+    montar, tabela, indice = CONSULTAS[nome]
+    with app.app_context():
+        usa_indice(montar(), tabela, indice)
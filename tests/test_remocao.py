@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# DELETE /api/viagens/<id>?async=true: uma purga que falha é reagendada e
+# termina de apagar a viagem.
+import time
+
+from models.models import db, Viagem
+from services import remocao_viagens
+from services.remocao_viagens import purga_viagens
+
+def test_purga_com_falha_e_reagendada(app, client, auth, monkeypatch):
+    original = remocao_viagens.purgar_viagens_removidas
+    tentativas = []
+
+    def purgar_falhando_uma_vez():
+        tentativas.append(1)
+        if len(tentativas) == 1:
+            raise RuntimeError("banco ocupado")
+        return original()
+
+    monkeypatch.setattr(remocao_viagens, "purgar_viagens_removidas", purgar_falhando_uma_vez)
+    monkeypatch.setattr(purga_viagens, "espera_seconds", 0)
+    viagem = client.post("/api/viagens", json={"nome_viagem": "x"}, headers=auth).get_json()
+    assert client.delete(f"/api/viagens/{viagem['id']}?async=true", headers=auth).status_code == 202
+
+    prazo = time.time() + 5
+    with app.app_context():
+        while db.session.get(Viagem, viagem["id"]) is not None and time.time() < prazo:
+            db.session.rollback()
+            time.sleep(0.05)
+        assert db.session.get(Viagem, viagem["id"]) is None
+    assert len(tentativas) == 2
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# GET /api/sync?since=: o delta de um usuário nunca traz registros de outro,
+# mesmo quando um id do log passa a apontar para uma linha de outro dono.
+import pytest
+
+from models.models import db, Usuario, Viagem
+from services.senhas import gerar_hash_senha
+
+@pytest.fixture()
+def auth_outro(app, client):
+    with app.app_context():
+        db.session.add(Usuario(username="outro", password_hash=gerar_hash_senha("outro_password")))
+        db.session.commit()
+    resposta = client.post("/auth/login", json={"username": "outro", "password": "outro_password"})
+    assert resposta.status_code == 200, resposta.data
+    return {"Authorization": f"Bearer {resposta.get_json()['token']}"}
+
+def _viagem_removida(client, auth):
+    cursor = client.get("/api/sync", headers=auth).get_json()["cursor"]
+    viagem = client.post("/api/viagens", json={"nome_viagem": "minha"}, headers=auth).get_json()
+    assert client.delete(f"/api/viagens/{viagem['id']}", headers=auth).status_code == 200
+    return cursor, viagem["id"]
+
+def _delta(client, auth, cursor):
+    viagens, removidas = [], []
+    while True:
+        resposta = client.get(f"/api/sync?since={cursor}&limit=1", headers=auth).get_json()
+        viagens += resposta["viagens"]
+        removidas += resposta["removidos"]["viagens"]
+        cursor = resposta["cursor"]
+        if not resposta["has_more"]:
+            return viagens, removidas
+
+def test_ids_nao_sao_reaproveitados(client, auth, auth_outro):
+    cursor, viagem_id = _viagem_removida(client, auth)
+    outra = client.post("/api/viagens", json={"nome_viagem": "segredo"}, headers=auth_outro).get_json()
+    assert outra["id"] != viagem_id
+    assert _delta(client, auth, cursor) == ([], [viagem_id])
+
+def test_delta_filtra_o_dono(app, client, auth, auth_outro):
+    cursor, viagem_id = _viagem_removida(client, auth)
+    # Simula um id reaproveitado (bancos anteriores ao AUTOINCREMENT)
+    with app.app_context():
+        outro = db.session.scalar(db.select(Usuario.id).where(Usuario.username == "outro"))
+        db.session.add(Viagem(id=viagem_id, nome_viagem="segredo", usuario_id=outro))
+        db.session.commit()
+    assert _delta(client, auth, cursor) == ([], [viagem_id])